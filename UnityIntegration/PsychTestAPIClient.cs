@@ -1,6 +1,7 @@
 using System;
 using System.Collections;
 using System.Collections.Generic;
+using System.IO;
 using System.Text;
 using UnityEngine;
 using UnityEngine.Networking;
@@ -24,11 +25,19 @@ namespace PsychTestSystem
         private string accessToken;
         private bool isAuthenticated = false;
         
+        // 本地名单缓存：学号 -> 学生，数据库ID -> 学号
+        private readonly Dictionary<string, RosterEntry> rosterByStudentId = new Dictionary<string, RosterEntry>();
+        private readonly Dictionary<int, string> rosterStudentIdById = new Dictionary<int, string>();
+        private int rosterVersion = 0;
+        private string rosterClassName;
+        private bool isSyncingRoster = false;
+        
         // 事件回调
         public System.Action<bool> OnAuthenticationResult;
         public System.Action<StudentValidationResult> OnStudentValidationResult;
         public System.Action<TestDataUploadResult> OnTestDataUploadResult;
         public System.Action<TestStatusResult> OnTestStatusResult;
+        public System.Action<int> OnRosterSynced;
         public System.Action<string> OnError;
         
         private void Start()
@@ -300,6 +309,235 @@ namespace PsychTestSystem
             }
         }
         
+        /// <summary>
+        /// 同步学生名单到本地缓存。首次同步获取全量快照，之后只拉取上次版本之后的变化
+        /// </summary>
+        /// <param name="className">班级名称，为空时同步全校名单</param>
+        public void SyncRoster(string className = null)
+        {
+            if (!isAuthenticated)
+            {
+                LogError("未进行身份验证，请先调用Authenticate()");
+                OnError?.Invoke("未进行身份验证");
+                return;
+            }
+            
+            if (isSyncingRoster)
+            {
+                LogDebug("名单同步进行中，忽略本次请求");
+                return;
+            }
+            
+            StartCoroutine(SyncRosterCoroutine(className));
+        }
+        
+        private IEnumerator SyncRosterCoroutine(string className)
+        {
+            isSyncingRoster = true;
+            
+            if (rosterVersion == 0)
+            {
+                LoadRosterCache();
+            }
+            
+            // 切换班级后本地缓存不可用于增量，重新拉取全量
+            if (rosterClassName != className)
+            {
+                ClearRoster();
+                rosterClassName = className;
+            }
+            
+            string url = $"{baseURL}/api/client/roster";
+            List<string> query = new List<string>();
+            if (!string.IsNullOrEmpty(className))
+            {
+                query.Add($"class_name={UnityWebRequest.EscapeURL(className)}");
+            }
+            if (rosterVersion > 0)
+            {
+                query.Add($"since_version={rosterVersion}");
+            }
+            if (query.Count > 0)
+            {
+                url += "?" + string.Join("&", query);
+            }
+            
+            using (UnityWebRequest request = UnityWebRequest.Get(url))
+            {
+                request.SetRequestHeader("Authorization", $"Bearer {accessToken}");
+                
+                yield return request.SendWebRequest();
+                
+                if (request.result == UnityWebRequest.Result.Success)
+                {
+                    try
+                    {
+                        RosterSyncResult result = JsonUtility.FromJson<RosterSyncResult>(request.downloadHandler.text);
+                        ApplyRosterSync(result);
+                        SaveRosterCache();
+                        LogDebug($"名单同步完成: 版本{rosterVersion}，{(result.full ? "全量" : "增量")}，本地共{rosterByStudentId.Count}名学生");
+                        OnRosterSynced?.Invoke(rosterVersion);
+                    }
+                    catch (Exception e)
+                    {
+                        LogError($"解析名单同步响应失败: {e.Message}");
+                        OnError?.Invoke($"解析名单同步响应失败: {e.Message}");
+                    }
+                }
+                else
+                {
+                    LogError($"名单同步失败: {request.error}");
+                    OnError?.Invoke($"名单同步失败: {request.error}");
+                }
+            }
+            
+            isSyncingRoster = false;
+        }
+        
+        private void ApplyRosterSync(RosterSyncResult result)
+        {
+            if (result.full)
+            {
+                ClearRoster();
+            }
+            
+            if (result.deleted_ids != null)
+            {
+                foreach (int id in result.deleted_ids)
+                {
+                    RemoveRosterEntry(id);
+                }
+            }
+            
+            if (result.students != null)
+            {
+                foreach (RosterEntry entry in result.students)
+                {
+                    // 学号可能被修改，先按数据库ID移除旧条目
+                    RemoveRosterEntry(entry.id);
+                    rosterByStudentId[entry.student_id] = entry;
+                    rosterStudentIdById[entry.id] = entry.student_id;
+                }
+            }
+            
+            rosterVersion = result.version;
+        }
+        
+        private void RemoveRosterEntry(int id)
+        {
+            if (rosterStudentIdById.TryGetValue(id, out string studentId))
+            {
+                rosterByStudentId.Remove(studentId);
+                rosterStudentIdById.Remove(id);
+            }
+        }
+        
+        private void ClearRoster()
+        {
+            rosterByStudentId.Clear();
+            rosterStudentIdById.Clear();
+            rosterVersion = 0;
+        }
+        
+        /// <summary>
+        /// 从本地名单缓存查询学生，不访问网络
+        /// </summary>
+        /// <param name="studentId">学号</param>
+        /// <param name="student">查到的学生信息</param>
+        /// <returns>学号是否存在于本地名单</returns>
+        public bool TryGetCachedStudent(string studentId, out StudentInfo student)
+        {
+            student = null;
+            if (!rosterByStudentId.TryGetValue(studentId, out RosterEntry entry))
+            {
+                return false;
+            }
+            
+            student = new StudentInfo
+            {
+                student_id = entry.student_id,
+                name = entry.name,
+                class_name = entry.class_name,
+                gender = entry.gender
+            };
+            return true;
+        }
+        
+        /// <summary>
+        /// 优先使用本地名单验证学号；本地名单为空或未命中且在线时回退到服务器验证
+        /// </summary>
+        /// <param name="studentId">学号</param>
+        public void ValidateStudentLocal(string studentId)
+        {
+            if (TryGetCachedStudent(studentId, out StudentInfo student))
+            {
+                LogDebug($"本地名单验证: 学号{studentId} 存在");
+                OnStudentValidationResult?.Invoke(new StudentValidationResult { exists = true, student_info = student });
+                return;
+            }
+            
+            if (isAuthenticated && Application.internetReachability != NetworkReachability.NotReachable)
+            {
+                // 本地名单可能尚未同步到最新的学生
+                ValidateStudent(studentId);
+                return;
+            }
+            
+            LogDebug($"本地名单验证: 学号{studentId} 不存在（离线）");
+            OnStudentValidationResult?.Invoke(new StudentValidationResult { exists = false });
+        }
+        
+        private string RosterCachePath => Path.Combine(Application.persistentDataPath, "psych_roster_cache.json");
+        
+        private void SaveRosterCache()
+        {
+            try
+            {
+                RosterCacheData data = new RosterCacheData
+                {
+                    version = rosterVersion,
+                    class_name = rosterClassName,
+                    students = new List<RosterEntry>(rosterByStudentId.Values)
+                };
+                File.WriteAllText(RosterCachePath, JsonUtility.ToJson(data), Encoding.UTF8);
+            }
+            catch (Exception e)
+            {
+                LogError($"保存本地名单失败: {e.Message}");
+            }
+        }
+        
+        /// <summary>
+        /// 从磁盘加载上次同步的名单，离线启动时也可以验证学号
+        /// </summary>
+        public void LoadRosterCache()
+        {
+            if (!File.Exists(RosterCachePath))
+            {
+                return;
+            }
+            
+            try
+            {
+                RosterCacheData data = JsonUtility.FromJson<RosterCacheData>(File.ReadAllText(RosterCachePath, Encoding.UTF8));
+                ClearRoster();
+                foreach (RosterEntry entry in data.students)
+                {
+                    rosterByStudentId[entry.student_id] = entry;
+                    rosterStudentIdById[entry.id] = entry.student_id;
+                }
+                rosterVersion = data.version;
+                // JsonUtility 把 null 字符串反序列化为空字符串
+                rosterClassName = string.IsNullOrEmpty(data.class_name) ? null : data.class_name;
+                LogDebug($"已加载本地名单: 版本{rosterVersion}，共{rosterByStudentId.Count}名学生");
+            }
+            catch (Exception e)
+            {
+                LogError($"加载本地名单失败: {e.Message}");
+                ClearRoster();
+            }
+        }
+        
         private void LogDebug(string message)
         {
             if (enableDebugLogs)
@@ -316,6 +554,8 @@ namespace PsychTestSystem
         // 公共属性
         public bool IsAuthenticated => isAuthenticated;
         public string BaseURL => baseURL;
+        public int RosterVersion => rosterVersion;
+        public int RosterCount => rosterByStudentId.Count;
     }
 }
 
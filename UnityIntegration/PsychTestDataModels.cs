@@ -365,6 +365,42 @@ namespace PsychTestSystem
         public string class_data; // JSON字符串格式的班级分布数据
     }
     
+    /// <summary>
+    /// 名单中的学生（用于本地验证）
+    /// </summary>
+    [Serializable]
+    public class RosterEntry
+    {
+        public int id;
+        public string student_id;
+        public string name;
+        public string class_name;
+        public string gender;
+    }
+    
+    /// <summary>
+    /// 名单同步响应：full为true时是全量快照，否则是since_version之后的增量
+    /// </summary>
+    [Serializable]
+    public class RosterSyncResult
+    {
+        public int version;
+        public bool full;
+        public List<RosterEntry> students;
+        public List<int> deleted_ids;
+    }
+    
+    /// <summary>
+    /// 本地名单缓存（持久化到磁盘，离线时用于学号验证）
+    /// </summary>
+    [Serializable]
+    public class RosterCacheData
+    {
+        public int version;
+        public string class_name;
+        public List<RosterEntry> students = new List<RosterEntry>();
+    }
+    
     /// <summary>
     /// API错误响应
     /// </summary>
@@ -0,0 +1,37 @@
+"""Add change_log for incremental exports
+
+Revision ID: 5b1c2d7e9a41
+Revises: 38e3594ee081
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1c2d7e9a41'
+down_revision = '38e3594ee081'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'change_log',
+        sa.Column('id', sa.Integer(), primary_key=True, comment='变更序号'),
+        sa.Column('entity', sa.String(30), nullable=False, comment='实体类型，如 test'),
+        sa.Column('entity_id', sa.Integer(), nullable=False, comment='实体主键'),
+        sa.Column('op', sa.String(10), nullable=False, comment='变更类型：upsert, delete, demote'),
+        sa.Column('changed_at', sa.DateTime(), comment='变更时间'),
+    )
+
+    # 为已有检测记录补写 upsert，since=0 的增量导出等同于全量导出
+    op.execute(
+        "INSERT INTO change_log (entity, entity_id, op, changed_at) "
+        "SELECT 'test', id, 'upsert', CURRENT_TIMESTAMP FROM tests ORDER BY id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('change_log')
@@ -0,0 +1,63 @@
+"""Add import_jobs and import_job_chunks
+
+Revision ID: 7c3e8f2a1d55
+Revises: 5b1c2d7e9a41
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e8f2a1d55'
+down_revision = '5b1c2d7e9a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'import_jobs',
+        sa.Column('id', sa.String(32), primary_key=True, comment='任务ID'),
+        sa.Column('filename', sa.String(255), nullable=False, comment='上传的原始文件名'),
+        sa.Column('file_path', sa.String(255), nullable=False, comment='上传文件在服务器上的保存路径'),
+        sa.Column('on_conflict', sa.String(10), nullable=False, comment='学号已存在时的处理方式'),
+        sa.Column('chunk_size', sa.Integer(), nullable=False, comment='分块行数，续传时必须与首次运行一致'),
+        sa.Column('status', sa.String(20), nullable=False, comment='任务状态：queued, running, completed, failed'),
+        sa.Column('rows_total', sa.Integer(), nullable=True, comment='预估的数据行数'),
+        sa.Column('rows_processed', sa.Integer(), nullable=False, server_default='0', comment='已提交的数据行数'),
+        sa.Column('chunks_committed', sa.Integer(), nullable=False, server_default='0', comment='检查点：已提交的数据块数'),
+        sa.Column('success_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('duplicate_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.Text(), nullable=True, comment='任务失败原因'),
+        sa.Column('worker', sa.String(100), nullable=True, comment='认领任务的进程（主机名:进程号）'),
+        sa.Column('lease_until', sa.DateTime(), nullable=True, comment='执行租约到期时间，每提交一块续租'),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        'import_job_chunks',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('job_id', sa.String(32), sa.ForeignKey('import_jobs.id'), nullable=False),
+        sa.Column('chunk_no', sa.Integer(), nullable=False, comment='数据块序号，从0开始'),
+        sa.Column('first_row', sa.Integer(), nullable=True, comment='块内第一行的文件行号'),
+        sa.Column('last_row', sa.Integer(), nullable=True, comment='块内最后一行的文件行号'),
+        sa.Column('rows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('success_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('duplicate_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('details', sa.Text(), nullable=True, comment='重复行和错误行明细（JSON）'),
+        sa.Column('committed_at', sa.DateTime()),
+    )
+    op.create_index('ix_import_job_chunks_job_id', 'import_job_chunks', ['job_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_import_job_chunks_job_id', 'import_job_chunks')
+    op.drop_table('import_job_chunks')
+    op.drop_table('import_jobs')
@@ -0,0 +1,91 @@
+"""Keep test history: tests.is_latest and yearly archive tables
+
+Revision ID: 9d4a6b3c8e17
+Revises: 7c3e8f2a1d55
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4a6b3c8e17'
+down_revision = '7c3e8f2a1d55'
+branch_labels = None
+depends_on = None
+
+ARCHIVE_TABLES = ('tests_archive', 'scores_archive', 'physiological_data_archive')
+# 单独分区的第一个年份，更早的归档记录合并在 p_before_<年份> 分区
+ARCHIVE_FIRST_YEAR = 2020
+
+
+def upgrade() -> None:
+    op.add_column('tests', sa.Column('is_latest', sa.Boolean(), nullable=False, server_default=sa.false(),
+                                     comment='是否为该学生当前（最新上传）的检测记录，其余为历史记录'))
+    # 每个学生最新的一条记为当前记录；MySQL 不允许 UPDATE 的子查询直接引用目标表，多包一层派生表
+    op.execute(
+        "UPDATE tests SET is_latest = 1 WHERE id IN (SELECT id FROM ("
+        "SELECT id, ROW_NUMBER() OVER (PARTITION BY student_fk_id ORDER BY test_time DESC, id DESC) AS rn "
+        "FROM tests) ranked WHERE rn = 1)"
+    )
+    op.create_index('ix_tests_is_latest_student', 'tests', ['is_latest', 'student_fk_id'])
+
+    op.create_table(
+        'tests_archive',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False, comment='原检测记录ID'),
+        sa.Column('archive_year', sa.Integer(), primary_key=True, autoincrement=False, comment='分区键：检测年份'),
+        sa.Column('student_fk_id', sa.Integer(), nullable=False, comment='关联的学生ID'),
+        sa.Column('test_time', sa.DateTime(timezone=True), comment='检测时间'),
+        sa.Column('ai_summary', sa.Text()),
+        sa.Column('report_file_path', sa.String(255)),
+        sa.Column('is_abnormal', sa.Boolean()),
+        sa.Column('status', sa.String(20)),
+        sa.Column('archived_at', sa.DateTime(), comment='归档时间'),
+    )
+    op.create_index('ix_tests_archive_student_fk_id', 'tests_archive', ['student_fk_id'])
+    op.create_table(
+        'scores_archive',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('archive_year', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('test_fk_id', sa.Integer(), nullable=False),
+        sa.Column('module_name', sa.String(50), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.Column('max_score', sa.Integer(), nullable=True),
+        sa.Column('level', sa.String(20), nullable=True),
+        sa.Column('questionnaire_feedback', sa.String(255), nullable=True),
+    )
+    op.create_index('ix_scores_archive_test_fk_id', 'scores_archive', ['test_fk_id'])
+    op.create_table(
+        'physiological_data_archive',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('archive_year', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('test_fk_id', sa.Integer(), nullable=False),
+        sa.Column('data_key', sa.String(50), nullable=False),
+        sa.Column('data_value', sa.Float(), nullable=False),
+    )
+    op.create_index('ix_physiological_data_archive_test_fk_id', 'physiological_data_archive', ['test_fk_id'])
+
+    if op.get_bind().dialect.name == 'mysql':
+        # 按检测年份做 RANGE 分区，每年一个分区：按年份查询或清理时只触及对应分区，
+        # 过期年份可直接 ALTER TABLE ... DROP/TRUNCATE PARTITION p<年份>。
+        # 超出已建年份的数据落入 p_future，新的一年开始前用 REORGANIZE PARTITION p_future 拆出该年的分区。
+        partitions = [f"PARTITION p_before_{ARCHIVE_FIRST_YEAR} VALUES LESS THAN ({ARCHIVE_FIRST_YEAR})"]
+        partitions += [f"PARTITION p{year} VALUES LESS THAN ({year + 1})"
+                       for year in range(ARCHIVE_FIRST_YEAR, datetime.now().year + 2)]
+        partitions.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+        for table in ARCHIVE_TABLES:
+            op.execute(f"ALTER TABLE {table} PARTITION BY RANGE (archive_year) ({', '.join(partitions)})")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_physiological_data_archive_test_fk_id', table_name='physiological_data_archive')
+    op.drop_table('physiological_data_archive')
+    op.drop_index('ix_scores_archive_test_fk_id', table_name='scores_archive')
+    op.drop_table('scores_archive')
+    op.drop_index('ix_tests_archive_student_fk_id', table_name='tests_archive')
+    op.drop_table('tests_archive')
+    op.drop_index('ix_tests_is_latest_student', table_name='tests')
+    op.drop_column('tests', 'is_latest')
@@ -0,0 +1,47 @@
+"""Denormalized latest-test columns on students
+
+Revision ID: a3f19c6d2b84
+Revises: 9d4a6b3c8e17
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f19c6d2b84'
+down_revision = '9d4a6b3c8e17'
+branch_labels = None
+depends_on = None
+
+# 每个学生只有一条 is_latest = 1 的记录，MAX 只是为了得到标量
+BACKFILL_SQL = (
+    "UPDATE students SET "
+    "latest_test_id = (SELECT MAX(t.id) FROM tests t WHERE t.student_fk_id = students.id AND t.is_latest = 1), "
+    "latest_test_time = (SELECT MAX(t.test_time) FROM tests t WHERE t.student_fk_id = students.id AND t.is_latest = 1), "
+    "latest_is_abnormal = (SELECT MAX(t.is_abnormal) FROM tests t WHERE t.student_fk_id = students.id AND t.is_latest = 1), "
+    "test_count = (SELECT COUNT(*) FROM tests t WHERE t.student_fk_id = students.id) "
+    "+ (SELECT COUNT(*) FROM tests_archive a WHERE a.student_fk_id = students.id)"
+)
+
+
+def upgrade() -> None:
+    op.add_column('students', sa.Column('latest_test_id', sa.Integer(), nullable=True, comment='当前检测记录ID'))
+    op.add_column('students', sa.Column('latest_test_time', sa.DateTime(timezone=True), nullable=True,
+                                        comment='当前检测记录的检测时间'))
+    op.add_column('students', sa.Column('latest_is_abnormal', sa.Boolean(), nullable=True, comment='当前检测记录是否异常'))
+    op.add_column('students', sa.Column('test_count', sa.Integer(), nullable=False, server_default='0',
+                                        comment='检测次数（含历史和归档记录）'))
+    op.create_index('ix_students_latest_test_id', 'students', ['latest_test_id'])
+    op.create_index('ix_students_latest_test_time', 'students', ['latest_test_time'])
+    op.execute(BACKFILL_SQL)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_students_latest_test_time', table_name='students')
+    op.drop_index('ix_students_latest_test_id', table_name='students')
+    op.drop_column('students', 'test_count')
+    op.drop_column('students', 'latest_is_abnormal')
+    op.drop_column('students', 'latest_test_time')
+    op.drop_column('students', 'latest_test_id')
@@ -0,0 +1,26 @@
+"""Add feature_version to physiological_signals
+
+Revision ID: b4d9e2f6a718
+Revises: f6b3d8a2c914
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d9e2f6a718'
+down_revision = 'f6b3d8a2c914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 已有信号的 feature_version 为空，下一轮特征提取会全部计算
+    op.add_column('physiological_signals', sa.Column(
+        'feature_version', sa.Integer(), nullable=True, comment='已按哪个算法版本提取特征，为空表示尚未提取'))
+
+
+def downgrade() -> None:
+    op.drop_column('physiological_signals', 'feature_version')
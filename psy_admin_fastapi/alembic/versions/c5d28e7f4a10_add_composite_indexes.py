@@ -0,0 +1,57 @@
+"""Composite and covering indexes for the crud.py query mix
+
+Revision ID: c5d28e7f4a10
+Revises: a3f19c6d2b84
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d28e7f4a10'
+down_revision = 'a3f19c6d2b84'
+branch_labels = None
+depends_on = None
+
+# (索引名, 表名, 列) —— 与 models.py 中的 __table_args__ 保持一致
+INDEXES = [
+    # 学生检测历史、按学生取最新记录（窗口函数按 student_fk_id 分区、test_time 排序）
+    ('ix_tests_student_time', 'tests', ['student_fk_id', 'test_time']),
+    # 当前检测记录列表：时间范围筛选 + 按时间倒序
+    ('ix_tests_latest_time', 'tests', ['is_latest', 'test_time']),
+    ('ix_tests_latest_abnormal_time', 'tests', ['is_latest', 'is_abnormal', 'test_time']),
+    ('ix_tests_latest_status_time', 'tests', ['is_latest', 'status', 'test_time']),
+    # 学生列表按班级、性别筛选，按姓名排序
+    ('ix_students_class_gender_name', 'students', ['class_name', 'gender', 'name']),
+    # 宽表导出的得分/生理数据子查询：覆盖索引，不回表
+    ('ix_scores_test_module', 'scores', ['test_fk_id', 'module_name', 'score']),
+    ('ix_scores_module_name', 'scores', ['module_name']),
+    ('ix_physiological_data_test_key', 'physiological_data', ['test_fk_id', 'data_key', 'data_value']),
+    ('ix_physiological_data_key', 'physiological_data', ['data_key']),
+    # 增量导出和名单同步：按实体类型取变更序号区间；按时间换算水位线
+    ('ix_change_log_entity_id', 'change_log', ['entity', 'id']),
+    ('ix_change_log_changed_at', 'change_log', ['changed_at']),
+]
+
+# 以下单列索引是新组合索引的前缀，已冗余
+REDUNDANT_INDEXES = [
+    ('ix_tests_student_fk_id', 'tests', ['student_fk_id']),
+    ('ix_scores_test_fk_id', 'scores', ['test_fk_id']),
+    ('ix_physiological_data_test_fk_id', 'physiological_data', ['test_fk_id']),
+]
+
+
+def upgrade() -> None:
+    # 先建组合索引再删旧索引：MySQL 的外键列必须始终有可用的索引
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+    for name, table, _columns in REDUNDANT_INDEXES:
+        op.drop_index(name, table)
+
+
+def downgrade() -> None:
+    for name, table, columns in REDUNDANT_INDEXES:
+        op.create_index(name, table, columns)
+    for name, table, _columns in reversed(INDEXES):
+        op.drop_index(name, table)
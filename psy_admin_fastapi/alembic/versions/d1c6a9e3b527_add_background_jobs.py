@@ -0,0 +1,45 @@
+"""Add background_jobs for the durable job queue
+
+Revision ID: d1c6a9e3b527
+Revises: b4d9e2f6a718
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1c6a9e3b527'
+down_revision = 'b4d9e2f6a718'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'background_jobs',
+        sa.Column('id', sa.String(32), primary_key=True, comment='任务ID'),
+        sa.Column('kind', sa.String(50), nullable=False, comment='任务类型，对应注册的处理函数'),
+        sa.Column('lane', sa.String(20), nullable=False, comment='调度通道：client, report, export'),
+        sa.Column('status', sa.String(20), nullable=False, comment='任务状态：queued, running, completed, dead'),
+        sa.Column('payload', sa.Text(), nullable=True, comment='处理函数参数（JSON）'),
+        sa.Column('result', sa.Text(), nullable=True, comment='处理函数返回值（JSON）'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0', comment='已执行次数'),
+        sa.Column('max_attempts', sa.Integer(), nullable=False, comment='最大执行次数，用尽后转为死信'),
+        sa.Column('run_after', sa.DateTime(), nullable=False, comment='最早可执行时间（重试退避）'),
+        sa.Column('worker', sa.String(100), nullable=True, comment='认领任务的进程（主机名:进程号）'),
+        sa.Column('lease_until', sa.DateTime(), nullable=True, comment='执行租约到期时间'),
+        sa.Column('last_error', sa.Text(), nullable=True, comment='最近一次失败的异常堆栈'),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_background_jobs_lane_status_run_after', 'background_jobs', ['lane', 'status', 'run_after'])
+    op.create_index('ix_background_jobs_status_created', 'background_jobs', ['status', 'created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_background_jobs_status_created', 'background_jobs')
+    op.drop_index('ix_background_jobs_lane_status_run_after', 'background_jobs')
+    op.drop_table('background_jobs')
@@ -0,0 +1,76 @@
+"""JSON score/physiological summary columns and typed generated columns on tests
+
+Revision ID: e2a7c4b91d30
+Revises: c5d28e7f4a10
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c4b91d30'
+down_revision = 'c5d28e7f4a10'
+branch_labels = None
+depends_on = None
+
+# 从 scores / physiological_data 聚合回填；没有得分或生理数据的记录回填为空对象
+BACKFILL_SQL = {
+    "sqlite": (
+        "UPDATE tests SET "
+        "score_summary = (SELECT json_group_object(s.module_name, json_object("
+        "'score', s.score, 'max_score', s.max_score, 'level', s.level, "
+        "'questionnaire_feedback', s.questionnaire_feedback)) FROM scores s WHERE s.test_fk_id = tests.id), "
+        "phys_summary = (SELECT json_group_object(p.data_key, p.data_value) "
+        "FROM physiological_data p WHERE p.test_fk_id = tests.id) "
+        "WHERE score_summary IS NULL"
+    ),
+    "mysql": (
+        "UPDATE tests SET "
+        "score_summary = COALESCE((SELECT JSON_OBJECTAGG(s.module_name, JSON_OBJECT("
+        "'score', s.score, 'max_score', s.max_score, 'level', s.level, "
+        "'questionnaire_feedback', s.questionnaire_feedback)) FROM scores s WHERE s.test_fk_id = tests.id), "
+        "JSON_OBJECT()), "
+        "phys_summary = COALESCE((SELECT JSON_OBJECTAGG(p.data_key, p.data_value) "
+        "FROM physiological_data p WHERE p.test_fk_id = tests.id), JSON_OBJECT()) "
+        "WHERE score_summary IS NULL"
+    ),
+}
+
+
+# 生成列：(列名, 类型, JSON 取值表达式, 注释)
+GENERATED_COLUMNS = [
+    ('score_learning_anxiety', 'INTEGER', """CAST(json_extract(score_summary, '$."学习焦虑".score') AS SIGNED)""", '学习焦虑得分（生成列）'),
+    ('score_social_anxiety', 'INTEGER', """CAST(json_extract(score_summary, '$."对人焦虑".score') AS SIGNED)""", '对人焦虑得分（生成列）'),
+    ('score_loneliness', 'INTEGER', """CAST(json_extract(score_summary, '$."孤独倾向".score') AS SIGNED)""", '孤独倾向得分（生成列）'),
+    ('score_self_blame', 'INTEGER', """CAST(json_extract(score_summary, '$."自责倾向".score') AS SIGNED)""", '自责倾向得分（生成列）'),
+    ('heart_rate', 'FLOAT', """CAST(json_extract(phys_summary, '$."心率"') AS DOUBLE)""", '心率（生成列）'),
+    ('eeg_alpha', 'FLOAT', """CAST(json_extract(phys_summary, '$."脑电alpha"') AS DOUBLE)""", '脑电alpha（生成列）'),
+]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    op.add_column('tests', sa.Column('score_summary', sa.JSON(), nullable=True,
+                                     comment='问卷得分 {模块名: {score, max_score, level, questionnaire_feedback}}'))
+    op.add_column('tests', sa.Column('phys_summary', sa.JSON(), nullable=True, comment='生理数据 {数据项: 数值}'))
+    op.execute(BACKFILL_SQL[dialect])
+
+    for name, type_, expression, comment in GENERATED_COLUMNS:
+        if dialect == 'sqlite':
+            # SQLite 的 ALTER TABLE 只能追加 VIRTUAL 生成列；下面的覆盖索引保存了计算结果，统计查询不需要重新解析 JSON
+            op.execute(f"ALTER TABLE tests ADD COLUMN {name} {type_} GENERATED ALWAYS AS ({expression}) VIRTUAL")
+        else:
+            column_type = sa.Integer() if type_ == 'INTEGER' else sa.Float()
+            op.add_column('tests', sa.Column(name, column_type, sa.Computed(expression, persisted=True), comment=comment))
+    op.create_index('ix_tests_latest_scores', 'tests', ['is_latest', 'score_learning_anxiety', 'score_social_anxiety',
+                                                        'score_loneliness', 'score_self_blame'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tests_latest_scores', table_name='tests')
+    for name, _, _, _ in reversed(GENERATED_COLUMNS):
+        op.drop_column('tests', name)
+    op.drop_column('tests', 'phys_summary')
+    op.drop_column('tests', 'score_summary')
@@ -0,0 +1,42 @@
+"""Add physiological_signals for raw sample storage metadata
+
+Revision ID: f6b3d8a2c914
+Revises: e2a7c4b91d30
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6b3d8a2c914'
+down_revision = 'e2a7c4b91d30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'physiological_signals',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('test_fk_id', sa.Integer(), nullable=False, comment='关联的检测记录ID'),
+        sa.Column('channel', sa.String(32), nullable=False, comment='信号通道，如 heart_rate、eeg'),
+        sa.Column('sample_rate', sa.Float(), nullable=False, comment='采样率（Hz）'),
+        sa.Column('sample_count', sa.Integer(), nullable=False, comment='采样点数'),
+        sa.Column('file_path', sa.String(255), nullable=False, comment='.npy 文件路径'),
+        sa.Column('min_value', sa.Float(), nullable=True),
+        sa.Column('max_value', sa.Float(), nullable=True),
+        sa.Column('mean_value', sa.Float(), nullable=True),
+        sa.Column('std_value', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime()),
+    )
+    op.create_index('ix_physiological_signals_id', 'physiological_signals', ['id'])
+    op.create_index('ux_physiological_signals_test_channel', 'physiological_signals',
+                    ['test_fk_id', 'channel'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ux_physiological_signals_test_channel', 'physiological_signals')
+    op.drop_index('ix_physiological_signals_id', 'physiological_signals')
+    op.drop_table('physiological_signals')
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+数据库配置档基准测试
+在临时 SQLite 数据库上用多个线程并发读写，对比旧配置（echo=True、默认 rollback journal、
+synchronous=FULL）和当前生产配置档（echo 关闭、WAL、synchronous=NORMAL、mmap/cache/busy_timeout）
+的吞吐量和锁冲突次数。
+
+用法: python benchmark_db.py [--students 500] [--readers 8] [--writers 2] [--seconds 10]
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# 添加项目路径
+sys.path.append(os.path.dirname(__file__))
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import models
+import schemas
+from database import Base, Settings, build_engine
+
+PROFILES = {
+    # 修改前 database.py 的行为：每条 SQL 都回显，默认 journal 和同步级别
+    "baseline": Settings(DB_ECHO=True, SQLITE_JOURNAL_MODE="DELETE", SQLITE_SYNCHRONOUS="FULL",
+                         SQLITE_MMAP_SIZE=0, SQLITE_CACHE_SIZE_KB=2000, SQLITE_BUSY_TIMEOUT_MS=5000),
+    "production": Settings(DB_PROFILE="production"),
+}
+
+
+def seed(session_factory, students: int):
+    """批量写入学生和每人一条检测记录"""
+    db = session_factory()
+    try:
+        db.execute(insert(models.Student), [
+            {"student_id": f"B{i:05d}", "name": f"学生{i}", "class_name": f"{i % 15 + 1}班",
+             "gender": "男" if i % 2 else "女", "created_at": datetime.utcnow()}
+            for i in range(students)
+        ])
+        db.commit()
+        for i in range(students):
+            crud.create_test_data(db, make_upload(i))
+    finally:
+        db.close()
+
+
+def make_upload(i: int) -> schemas.TestDataUpload:
+    return schemas.TestDataUpload(
+        student_id=f"B{i:05d}", name=f"学生{i}", gender="男" if i % 2 else "女", age=15,
+        test_time=datetime.now() - timedelta(minutes=random.randint(0, 10000)),
+        questionnaire_scores={"学习焦虑": {"score": random.randint(0, 15), "max_score": 15, "level": "轻度"}},
+        physiological_data_summary={"心率": random.randint(60, 110), "脑电alpha": 9.5},
+        ai_summary="基准测试", report_file_path="reports/bench.pdf",
+    )
+
+
+def run_profile(name: str, config: Settings, students: int, readers: int, writers: int, seconds: float):
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    log_path = os.path.join(workdir, "sql.log")
+    # echo 输出写入文件，模拟生产环境中日志落盘的开销
+    with open(log_path, "w") as log_file, contextlib.redirect_stdout(log_file):
+        engine = build_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}", config)
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        seed(session_factory, students)
+        counts = run_workload(session_factory, students, readers, writers, seconds)
+        engine.dispose()
+        log_file.flush()
+
+    return {
+        "profile": name,
+        "reads_per_sec": counts["reads"] / counts["elapsed"],
+        "writes_per_sec": counts["writes"] / counts["elapsed"],
+        "lock_errors": counts["lock_errors"],
+        "sql_log_mb": os.path.getsize(log_path) / 1024 / 1024,
+    }
+
+
+def run_workload(session_factory, students: int, readers: int, writers: int, seconds: float):
+    """readers 个线程循环执行查询，writers 个线程循环上传检测数据，返回完成次数"""
+    counts = {"reads": 0, "writes": 0, "lock_errors": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        db = session_factory()
+        try:
+            while not stop.is_set():
+                try:
+                    i = random.randrange(students)
+                    crud.get_student_test_history(db, f"B{i:05d}")
+                    crud.get_test_count(db, is_abnormal=False)
+                    crud.get_students_with_filters(db, class_name=f"{i % 15 + 1}班", limit=20)
+                    count("reads")
+                except OperationalError:
+                    db.rollback()
+                    count("lock_errors")
+        finally:
+            db.close()
+
+    def writer():
+        db = session_factory()
+        try:
+            while not stop.is_set():
+                try:
+                    crud.create_test_data(db, make_upload(random.randrange(students)))
+                    count("writes")
+                except OperationalError:
+                    db.rollback()
+                    count("lock_errors")
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + \
+              [threading.Thread(target=writer) for _ in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    counts["elapsed"] = time.perf_counter() - started
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比数据库配置档的并发读写吞吐量")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    results = [
+        run_profile(name, config, args.students, args.readers, args.writers, args.seconds)
+        for name, config in PROFILES.items()
+    ]
+
+    print(f"{'配置档':<12}{'读/秒':>10}{'写/秒':>10}{'锁冲突':>8}{'SQL日志(MB)':>14}")
+    for r in results:
+        print(f"{r['profile']:<12}{r['reads_per_sec']:>10.1f}{r['writes_per_sec']:>10.1f}"
+              f"{r['lock_errors']:>8}{r['sql_log_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+得分存储基准测试
+在临时 SQLite 数据库上对比 EAV 表（scores / physiological_data）和 tests 表 JSON 紧凑列
+（score_summary / phys_summary）在列表查询、宽表导出和分数段统计上的耗时。
+EAV 一侧是改用紧凑列之前 crud.py 中的查询写法。
+
+用法: python benchmark_storage.py [--tests 20000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# 添加项目路径
+sys.path.append(os.path.dirname(__file__))
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import joinedload, sessionmaker
+
+import crud
+import models
+from database import Base, Settings, build_engine
+
+MODULES = [("学习焦虑", 15), ("对人焦虑", 10), ("孤独倾向", 10), ("自责倾向", 10)]
+
+
+def seed(session_factory, tests: int):
+    """每个学生一条检测记录，得分和生理数据同时写入 EAV 表和紧凑列"""
+    db = session_factory()
+    try:
+        db.execute(insert(models.Student), [
+            {"id": i + 1, "student_id": f"B{i:06d}", "name": f"学生{i}", "class_name": f"{i % 15 + 1}班",
+             "gender": "男" if i % 2 else "女", "created_at": datetime.utcnow(), "latest_test_id": i + 1}
+            for i in range(tests)
+        ])
+        test_rows, score_rows, phys_rows = [], [], []
+        for i in range(tests):
+            scores = {name: {"score": random.randint(0, max_score), "max_score": max_score, "level": "轻度",
+                             "questionnaire_feedback": ""} for name, max_score in MODULES}
+            phys = {"心率": float(random.randint(60, 110)), "脑电alpha": round(random.uniform(8, 12), 2)}
+            test_rows.append({
+                "id": i + 1, "student_fk_id": i + 1, "is_latest": True, "status": "pending", "is_abnormal": False,
+                "test_time": datetime.now() - timedelta(minutes=i), "ai_summary": "基准测试",
+                "score_summary": scores, "phys_summary": phys,
+            })
+            score_rows.extend({"test_fk_id": i + 1, "module_name": name, **data} for name, data in scores.items())
+            phys_rows.extend({"test_fk_id": i + 1, "data_key": key, "data_value": value} for key, value in phys.items())
+        db.execute(insert(models.Test), test_rows)
+        db.execute(insert(models.Score), score_rows)
+        db.execute(insert(models.PhysiologicalData), phys_rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+# === 改用紧凑列之前的 EAV 查询 ===
+
+def eav_list(db):
+    tests = db.query(models.Test).join(models.Student, models.Student.latest_test_id == models.Test.id) \
+        .options(joinedload(models.Test.student), joinedload(models.Test.scores),
+                 joinedload(models.Test.physiological_data)) \
+        .order_by(models.Test.test_time.desc()).limit(100).all()
+    return [([(s.module_name, s.score) for s in t.scores], [(d.data_key, d.data_value) for d in t.physiological_data])
+            for t in tests]
+
+
+def eav_export(db):
+    module_names, phys_keys = crud.get_test_record_export_columns(db)
+    score_columns = [
+        select(func.max(models.Score.score))
+        .where(models.Score.test_fk_id == models.Test.id, models.Score.module_name == name)
+        .correlate(models.Test).scalar_subquery()
+        for name in module_names
+    ]
+    phys_columns = [
+        select(func.max(models.PhysiologicalData.data_value))
+        .where(models.PhysiologicalData.test_fk_id == models.Test.id, models.PhysiologicalData.data_key == key)
+        .correlate(models.Test).scalar_subquery()
+        for key in phys_keys
+    ]
+    query = db.query(
+        models.Test.id, models.Student.student_id, models.Student.name, models.Student.class_name,
+        models.Student.gender, models.Test.test_time, models.Test.ai_summary, models.Test.is_abnormal,
+        models.Test.status, models.Test.report_file_path, *score_columns, *phys_columns,
+    ).join(models.Student, models.Test.student_fk_id == models.Student.id) \
+        .filter(models.Test.id.in_(crud._latest_test_ids(db))) \
+        .order_by(models.Test.test_time.desc())
+    return sum(1 for _ in map(crud._format_test_record_row, query.yield_per(1000)))
+
+
+def eav_histogram(db):
+    bucket = case(
+        (models.Score.score <= 10, "0-10"),
+        (models.Score.score <= 15, "11-15"),
+        (models.Score.score <= 20, "16-20"),
+        (models.Score.score <= 25, "21-25"),
+        else_="26-30",
+    )
+    latest = select(models.Test.id).where(models.Test.is_latest == True)
+    return db.query(models.Score.module_name, bucket, func.count(models.Score.id)) \
+        .filter(models.Score.module_name.in_([name for name, _ in MODULES])) \
+        .filter(models.Score.test_fk_id.in_(latest)) \
+        .group_by(models.Score.module_name, bucket).all()
+
+
+# === 紧凑列查询（crud.py 当前实现） ===
+
+def json_list(db):
+    # 绕过 cached_query 缓存，测量实际查询
+    return [(t.score_list, t.phys_list) for t in crud.get_test_records.__wrapped__(db, limit=100)]
+
+
+def json_export(db):
+    module_names, phys_keys = crud.get_test_record_export_columns(db)
+    return sum(1 for _ in crud.iter_test_record_export_rows(db, module_names, phys_keys))
+
+
+def json_histogram(db):
+    return crud.get_score_distribution(db, [name for name, _ in MODULES])
+
+
+CASES = [
+    ("列表（100条）", eav_list, json_list),
+    ("宽表导出", eav_export, json_export),
+    ("分数段统计", eav_histogram, json_histogram),
+]
+
+
+def timed(session_factory, fn, repeat: int) -> float:
+    """重复执行取最短耗时（毫秒），每次使用新会话，避免身份映射缓存"""
+    best = float("inf")
+    for _ in range(repeat):
+        db = session_factory()
+        try:
+            started = time.perf_counter()
+            fn(db)
+            best = min(best, (time.perf_counter() - started) * 1000)
+        finally:
+            db.close()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 EAV 表和 JSON 紧凑列的读取耗时")
+    parser.add_argument("--tests", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_storage_")
+    engine = build_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}", Settings(DB_ECHO=False))
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    seed(session_factory, args.tests)
+
+    print(f"{'场景':<12}{'EAV(ms)':>12}{'JSON(ms)':>12}{'加速比':>8}")
+    for name, eav_fn, json_fn in CASES:
+        eav_ms = timed(session_factory, eav_fn, args.repeat)
+        json_ms = timed(session_factory, json_fn, args.repeat)
+        print(f"{name:<12}{eav_ms:>12.1f}{json_ms:>12.1f}{eav_ms / json_ms:>8.2f}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
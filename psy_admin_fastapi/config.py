@@ -24,6 +24,56 @@ class Settings(BaseSettings):
     # 文件上传限制
     MAX_FILE_SIZE_MB: int = 10
 
+    # 数据导出配置
+    EXPORT_DIR: str = "exports"
+    EXPORT_CHUNK_SIZE: int = 1000  # 流式导出时每批从数据库游标读取的行数
+    EXPORT_JOB_WORKERS: int = 2  # 后台导出任务的最大并发数
+    EXPORT_JOB_MAX_PENDING: int = 20  # 排队中的导出任务上限，超过后拒绝新任务
+    EXPORT_RETENTION_HOURS: int = 24  # 导出文件保留时长
+    EXPORT_MAX_TOTAL_MB: int = 1024  # 导出目录总大小上限，超出时从最旧的文件开始删除
+    EXPORT_SWEEP_INTERVAL_SECONDS: int = 600  # 导出目录清理间隔
+    CHANGE_EXPORT_SETTLE_SECONDS: int = 30  # 增量导出和客户端名单版本号只包含早于该时长的变更，等待分配了更小变更序号的并发事务提交
+
+    # 数据导入配置
+    IMPORT_CHUNK_SIZE: int = 1000  # 批量导入时每块校验和插入的行数
+    IMPORT_DIR: str = "imports"  # 后台导入任务上传文件的保存目录
+    IMPORT_JOB_WORKERS: int = 1  # 后台导入任务的最大并发数
+
+    # 学生名单内存索引配置
+    ROSTER_NEGATIVE_TTL_SECONDS: int = 300  # 不存在学号的负缓存时长
+    ROSTER_RELOAD_SECONDS: int = 600  # 定期全量重载间隔，同步其他进程的写入；0 表示不重载
+
+    # 慢查询日志配置
+    SLOW_QUERY_MS: float = 200  # 单条 SQL 超过该耗时（毫秒）记为慢查询
+    SLOW_QUERY_LOG: str = "logs/slow_query.log"  # 慢查询日志路径，按大小滚动
+    SLOW_QUERY_LOG_MAX_MB: int = 10  # 单个慢查询日志文件大小上限
+    SLOW_QUERY_LOG_BACKUPS: int = 5  # 保留的历史慢查询日志份数
+    N_PLUS_ONE_THRESHOLD: int = 10  # 单个请求内同一语句形状超过该次数时记录 N+1 警告
+    QUERY_BUDGET_STRICT: bool = False  # 严格模式：接口超出 query_budget 时直接抛错（测试环境开启）
+
+    # 生理信号原始数据配置
+    SIGNAL_DIR: str = "signals"  # 原始采样 .npy 文件目录，按检测记录ID分子目录
+    MAX_SIGNAL_MB: int = 64  # 单个通道上传数据大小上限
+    SIGNAL_MAX_POINTS: int = 5000  # 区间查询单次返回的最大降采样点数
+    FEATURE_WORKERS: int = 2  # 信号特征提取进程池大小，超过 CPU 核数时按核数创建；0 表示在当前进程内计算
+    FEATURE_BATCH_SIZE: int = 50  # 每个进程池任务处理的检测记录数
+
+    # 后台线程池配置
+    WORKER_THREADS: int = 4  # 通用后台线程池大小，超过数据库连接池容量时按容量创建
+    SHUTDOWN_DRAIN_SECONDS: float = 20  # 关闭时等待后台任务结束的时长，超时未完成的队列任务释放回队列
+
+    # 后台任务队列配置（导出通道沿用 EXPORT_JOB_WORKERS / EXPORT_JOB_MAX_PENDING）
+    JOB_CLIENT_WORKERS: int = 2  # 客户端数据处理通道的并发数（最高优先级）
+    JOB_CLIENT_MAX_PENDING: int = 1000  # 客户端数据处理通道的排队上限
+    JOB_REPORT_WORKERS: int = 2  # 报告生成通道的并发数
+    JOB_REPORT_MAX_PENDING: int = 50  # 报告生成通道的排队上限
+    JOB_MAX_ATTEMPTS: int = 5  # 默认最大执行次数，用尽后转为死信
+    JOB_RETRY_BASE_SECONDS: float = 5  # 重试退避基数，第 n 次失败后等待 base * 2^(n-1) 秒
+    JOB_RETRY_MAX_SECONDS: float = 600  # 重试退避上限
+    JOB_LEASE_SECONDS: int = 60  # 执行租约时长，进程崩溃后超过该时长的任务被重新认领
+    JOB_POLL_SECONDS: float = 1  # 调度线程轮询间隔
+    JOB_RETENTION_HOURS: int = 72  # 已完成任务的保留时长
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
     
     @property
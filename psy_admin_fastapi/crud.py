@@ -1,23 +1,62 @@
 # psy_admin_fastapi/crud.py
 
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
+from sqlalchemy import func, select, case, update, delete, insert, literal, and_, or_
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 from fastapi import HTTPException
 
 import models, schemas
+from config import settings
 from security import get_password_hash, verify_password
-import pandas as pd
+import itertools
 import os
 
 
 from utils.cache import cached_query
+from utils.roster_index import roster_index
+from utils.export_writers import write_xlsx, write_columnar
+from utils import signal_store
 
 ###
 ###
 
 
+# --- 数据变更日志 ---
+
+def record_test_changes(db: Session, test_ids: List[int], op: str = "upsert"):
+    """
+    在当前事务中记录检测记录的变更，随业务数据一起提交。
+    变更日志的自增ID即增量导出的水位线；删除记录以 op="delete" 作为墓碑保留，
+    转为历史记录的以 op="demote" 记录（数据未删除，只是不再是学生的当前记录）。
+    """
+    _record_changes(db, "test", test_ids, op)
+
+
+def record_student_changes(db: Session, student_db_ids: List[int], op: str = "upsert"):
+    """记录学生的变更，客户端名单增量同步（since_version）依赖这些记录"""
+    _record_changes(db, "student", student_db_ids, op)
+
+
+def _record_changes(db: Session, entity: str, entity_ids: List[int], op: str):
+    # 批量删除时可能有上万条，用一条 executemany 写入
+    if not entity_ids:
+        return
+    now = datetime.utcnow()
+    db.execute(insert(models.ChangeLog), [
+        {"entity": entity, "entity_id": entity_id, "op": op, "changed_at": now}
+        for entity_id in entity_ids
+    ])
+
+
+def record_student_test_changes(db: Session, student_db_ids: List[int]):
+    """学生信息变化会影响其当前检测记录的导出内容，记为这些检测记录的更新"""
+    test_ids = [row[0] for row in db.query(models.Test.id).filter(
+        models.Test.student_fk_id.in_(student_db_ids), models.Test.is_latest == True)]
+    record_test_changes(db, test_ids, "upsert")
+
+
 # --- 管理员用户 CRUD ---
 
 def get_admin_user(db: Session, user_id: int):
@@ -63,8 +102,11 @@ def create_student(db: Session, student: schemas.StudentCreate):
     """创建单个学生"""
     db_student = models.Student(**student.dict())
     db.add(db_student)
+    db.flush()
+    record_student_changes(db, [db_student.id])
     db.commit()
     db.refresh(db_student)
+    roster_index.refresh(db, [db_student.student_id])
     return db_student
 
 def batch_create_students(db: Session, students: List[schemas.ExcelImportSchema]):
@@ -82,9 +124,72 @@ def batch_create_students(db: Session, students: List[schemas.ExcelImportSchema]
     # 刷新所有对象以获取ID
     for db_student in db_students:
         db.refresh(db_student)
+    record_student_changes(db, [db_student.id for db_student in db_students])
     db.commit()
+    roster_index.refresh(db, [student.student_id for student in students])
     return db_students
 
+def upsert_students(db: Session, records: List[Dict[str, Any]]):
+    """
+    按学号批量插入或更新学生（不提交），每块一条 INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE。
+    records 为包含 name, student_id, class_name, gender 的字典列表；新学号插入，已有学号覆盖姓名、班级和性别。
+    """
+    if not records:
+        return
+    now = datetime.utcnow()
+    values = [{**record, "created_at": now} for record in records]
+    if db.bind.dialect.name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    # 多行 VALUES 每行最多为表的每一列绑定一个参数（含有默认值的列），按 IN 查询的参数上限分块
+    rows_per_statement = max(in_chunk_size(db) // len(models.Student.__table__.columns), 1)
+    for chunk in chunked(values, rows_per_statement):
+        stmt = dialect_insert(models.Student).values(chunk)
+        if db.bind.dialect.name == "mysql":
+            stmt = stmt.on_duplicate_key_update(
+                name=stmt.inserted.name, class_name=stmt.inserted.class_name, gender=stmt.inserted.gender)
+        else:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.Student.student_id],
+                set_={"name": stmt.excluded.name, "class_name": stmt.excluded.class_name,
+                      "gender": stmt.excluded.gender})
+        db.execute(stmt)
+
+def bulk_update_students(db: Session, updates: List[schemas.StudentPatch]) -> int:
+    """
+    在一个事务中批量修改学生信息，按修改的字段分组执行批量 UPDATE。
+    有学号不存在时抛出 ValueError，不做任何修改。
+    """
+    student_ids = [item.student_id for item in updates]
+    if len(set(student_ids)) != len(student_ids):
+        raise ValueError("同一学号在请求中出现多次")
+
+    id_map = dict(db.query(models.Student.student_id, models.Student.id)
+                  .filter(models.Student.student_id.in_(student_ids)))
+    missing = [student_id for student_id in student_ids if student_id not in id_map]
+    if missing:
+        raise ValueError(f"学生不存在: {', '.join(missing)}")
+
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for item in updates:
+        changes = item.dict(exclude_unset=True, exclude={"student_id"})
+        if changes:
+            groups.setdefault(tuple(sorted(changes)), []).append({"id": id_map[item.student_id], **changes})
+
+    try:
+        for params in groups.values():
+            # ORM 按主键批量更新，每组字段相同的修改合并为一次 executemany
+            db.execute(update(models.Student), params)
+        record_student_changes(db, list(id_map.values()))
+        record_student_test_changes(db, list(id_map.values()))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    roster_index.refresh(db, student_ids)
+    return sum(len(params) for params in groups.values())
+
 def batch_create_test_records(db: Session, student_ids: List[int]):
     """为指定的学生批量创建待处理的检测记录"""
     db_tests = []
@@ -99,7 +204,12 @@ def batch_create_test_records(db: Session, student_ids: List[int]):
         db_tests.append(db_test)
     
     if db_tests:
-        db.bulk_save_objects(db_tests)
+        demote_current_tests(db, student_ids)
+        # 需要回填的主键来记录变更日志，这里用 add_all 代替 bulk_save_objects
+        db.add_all(db_tests)
+        db.flush()
+        record_test_changes(db, [db_test.id for db_test in db_tests])
+        sync_student_latest_tests(db, student_ids)
         db.commit()
     return db_tests
 
@@ -113,63 +223,140 @@ def update_student(db: Session, student_id: str, student_update: schemas.Student
     update_data = student_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_student, key, value)
+    record_student_changes(db, [db_student.id])
+    record_student_test_changes(db, [db_student.id])
     
     db.commit()
     db.refresh(db_student)
+    # 学号可能被修改，新旧学号都要刷新
+    roster_index.refresh(db, [student_id, db_student.student_id])
     return db_student
 
 def delete_student(db: Session, student_id: str):
     """删除学生及其相关数据"""
-    db_student = get_student(db, student_id)
-    if not db_student:
-        return False
-    
-    # 先删除相关的检测记录
-    from models import Test, Score, PhysiologicalData
-    
-    # 获取该学生的所有检测记录
-    tests = db.query(Test).filter(Test.student_fk_id == db_student.id).all()
-    
-    for test in tests:
-        # 删除检测记录相关的得分数据
-        db.query(Score).filter(Score.test_fk_id == test.id).delete()
-        # 删除检测记录相关的生理数据
-        db.query(PhysiologicalData).filter(PhysiologicalData.test_fk_id == test.id).delete()
-        # 删除检测记录
-        db.delete(test)
-    
-    # 最后删除学生记录
-    db.delete(db_student)
-    db.commit()
-    return True
+    return delete_students(db, [student_id]) > 0
 
 def delete_students(db: Session, student_ids: List[str]) -> int:
-    """批量删除学生及其关联数据"""
+    """
+    批量删除学生及其关联数据（检测记录、得分、生理数据、报告）。
+    全部使用按ID分块的集合 DELETE，不加载 ORM 对象，在一个事务内完成。
+    """
     if not student_ids:
         return 0
 
-    from models import Test, Score, PhysiologicalData
-
-    students = db.query(models.Student).filter(models.Student.student_id.in_(student_ids)).all()
-    if not students:
+    size = in_chunk_size(db)
+    student_db_ids = []
+    for chunk in chunked(list(dict.fromkeys(student_ids)), size):
+        student_db_ids.extend(
+            row[0] for row in db.query(models.Student.id).filter(models.Student.student_id.in_(chunk))
+        )
+    if not student_db_ids:
         return 0
 
-    student_db_ids = [student.id for student in students]
-
-    tests = db.query(Test).filter(Test.student_fk_id.in_(student_db_ids)).all()
-    if tests:
-        test_ids = [test.id for test in tests]
-        if test_ids:
-            db.query(Score).filter(Score.test_fk_id.in_(test_ids)).delete(synchronize_session=False)
-            db.query(PhysiologicalData).filter(PhysiologicalData.test_fk_id.in_(test_ids)).delete(synchronize_session=False)
-        for test in tests:
-            db.delete(test)
-
-    for student in students:
-        db.delete(student)
-
-    db.commit()
-    return len(students)
+    signal_test_ids = []
+    try:
+        for chunk in chunked(student_db_ids, size):
+            test_ids = [row[0] for row in db.query(models.Test.id).filter(models.Test.student_fk_id.in_(chunk))]
+            signal_test_ids.extend(_delete_tests(db, test_ids))
+            signal_test_ids.extend(_delete_archived_tests(db, chunk))
+            db.execute(delete(models.Report).where(models.Report.student_id.in_(chunk)))
+            db.execute(delete(models.Student).where(models.Student.id.in_(chunk)))
+        record_student_changes(db, student_db_ids, "delete")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    signal_store.remove_test_signals(signal_test_ids)
+    # 集合删除绕过了 ORM，会话中可能残留已删除的对象
+    db.expire_all()
+    roster_index.refresh(db, student_ids)
+    return len(student_db_ids)
+
+def _delete_archived_tests(db: Session, student_db_ids: List[int]) -> List[int]:
+    """删除学生的归档检测记录，返回有信号文件的检测记录ID"""
+    archived_ids = select(models.TestArchive.id).where(models.TestArchive.student_fk_id.in_(student_db_ids))
+    db.execute(delete(models.ScoreArchive).where(models.ScoreArchive.test_fk_id.in_(archived_ids)))
+    db.execute(delete(models.PhysiologicalDataArchive)
+               .where(models.PhysiologicalDataArchive.test_fk_id.in_(archived_ids)))
+    signal_test_ids = _delete_signals(db, archived_ids)
+    db.execute(delete(models.TestArchive).where(models.TestArchive.student_fk_id.in_(student_db_ids)))
+    return signal_test_ids
+
+def _delete_tests(db: Session, test_ids: List[int]) -> List[int]:
+    """按ID分块删除检测记录及其得分、生理数据和信号元数据，并记录删除变更；不提交事务。返回有信号文件的检测记录ID"""
+    signal_test_ids = []
+    for chunk in chunked(test_ids, in_chunk_size(db)):
+        db.execute(delete(models.Score).where(models.Score.test_fk_id.in_(chunk)))
+        db.execute(delete(models.PhysiologicalData).where(models.PhysiologicalData.test_fk_id.in_(chunk)))
+        signal_test_ids.extend(_delete_signals(db, chunk))
+        db.execute(delete(models.Test).where(models.Test.id.in_(chunk)))
+    record_test_changes(db, test_ids, "delete")
+    return signal_test_ids
+
+def _delete_signals(db: Session, test_ids) -> List[int]:
+    """删除检测记录的信号元数据，返回有信号文件的检测记录ID；文件在事务提交后再删除"""
+    ids = [row[0] for row in db.query(models.PhysiologicalSignal.test_fk_id)
+           .filter(models.PhysiologicalSignal.test_fk_id.in_(test_ids)).distinct()]
+    if ids:
+        db.execute(delete(models.PhysiologicalSignal).where(models.PhysiologicalSignal.test_fk_id.in_(test_ids)))
+    return ids
+
+def in_chunk_size(db: Session) -> int:
+    """单条 IN 查询的参数个数上限：老版本 SQLite 限制 999 个绑定参数，MySQL 受包大小限制取 5000"""
+    return 999 if db.bind.dialect.name == "sqlite" else 5000
+
+def chunked(values: List, size: int):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def get_students_by_ids(db: Session, student_ids: List[str], include_latest_test: bool = False):
+    """
+    按学号批量查询学生，分块 IN 查询，结果保持请求中的顺序（重复的学号只返回一次）。
+    include_latest_test 为 True 时同时返回每个学生最新一条检测记录的摘要。
+    返回 (学生字典列表, 未找到的学号列表)。
+    """
+    ordered_ids = list(dict.fromkeys(student_ids))
+    found: Dict[str, models.Student] = {}
+    for chunk in chunked(ordered_ids, in_chunk_size(db)):
+        for student in db.query(models.Student).filter(models.Student.student_id.in_(chunk)):
+            found[student.student_id] = student
+
+    latest_tests: Dict[int, models.Test] = {}
+    if include_latest_test and found:
+        test_ids = [student.latest_test_id for student in found.values() if student.latest_test_id]
+        for chunk in chunked(test_ids, in_chunk_size(db)):
+            for test in db.query(models.Test).filter(models.Test.id.in_(chunk)):
+                latest_tests[test.student_fk_id] = test
+
+    students = []
+    for student_id in ordered_ids:
+        student = found.get(student_id)
+        if student is None:
+            continue
+        item = {
+            "id": student.id,
+            "name": student.name,
+            "student_id": student.student_id,
+            "class_name": student.class_name,
+            "gender": student.gender,
+            "created_at": student.created_at,
+            "latest_test_time": student.latest_test_time,
+            "latest_is_abnormal": student.latest_is_abnormal,
+            "test_count": student.test_count,
+        }
+        if include_latest_test:
+            test = latest_tests.get(student.id)
+            item["latest_test"] = {
+                "id": test.id,
+                "test_time": test.test_time,
+                "is_abnormal": test.is_abnormal,
+                "status": test.status,
+                "ai_summary": test.ai_summary,
+            } if test else None
+        students.append(item)
+
+    missing = [student_id for student_id in ordered_ids if student_id not in found]
+    return students, missing
 
 def get_students_with_filters(
     db: Session,
@@ -222,6 +409,19 @@ def log_login_attempt(db: Session, username: str, success: bool, message: Option
 
 # --- 心理检测数据 CRUD (新增部分) ---
 
+def _score_summary(normalized_scores: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """问卷得分的紧凑表示，写入 tests.score_summary（与 scores 表双写）"""
+    return {
+        module_name: {"score": data["score"], "max_score": data["max_score"], "level": data["level"],
+                      "questionnaire_feedback": data["feedback"]}
+        for module_name, data in normalized_scores.items()
+    }
+
+def _phys_summary(physiological_data_summary) -> Dict[str, float]:
+    """生理数据的紧凑表示，写入 tests.phys_summary（与 physiological_data 表双写）"""
+    values = (("心率", physiological_data_summary.心率), ("脑电alpha", physiological_data_summary.脑电alpha))
+    return {data_key: value for data_key, value in values if value is not None}
+
 def create_test_data(db: Session, test_data: schemas.TestDataUpload):
     # 首先尝试通过学号查找学生
     student = db.query(models.Student).filter(models.Student.student_id == test_data.student_id).first()
@@ -235,6 +435,7 @@ def create_test_data(db: Session, test_data: schemas.TestDataUpload):
         )
         db.add(student)
         db.flush()
+        record_student_changes(db, [student.id])
 
     # 兼容新旧结构的问卷得分
     score_items = {
@@ -325,17 +526,8 @@ def create_test_data(db: Session, test_data: schemas.TestDataUpload):
     elif len(abnormal_modules) == 1:
         test_data.ai_summary = f"检测出{abnormal_modules[0]}风险，建议进一步评估。{test_data.ai_summary}"
 
-    # 如果学生已有检测记录，删除所有旧记录（确保每个学生只保留最新的一条记录）
-    existing_tests = db.query(models.Test).filter(models.Test.student_fk_id == student.id).all()
-    if existing_tests:
-        for old_test in existing_tests:
-            # 删除关联的问卷得分
-            db.query(models.Score).filter(models.Score.test_fk_id == old_test.id).delete()
-            # 删除关联的生理数据
-            db.query(models.PhysiologicalData).filter(models.PhysiologicalData.test_fk_id == old_test.id).delete()
-            # 删除检测记录
-            db.delete(old_test)
-        db.flush()  # 先提交删除操作
+    # 学生之前的检测记录转为历史记录，新记录成为当前记录
+    demote_current_tests(db, [student.id])
 
     db_test = models.Test(
         student_fk_id=student.id,
@@ -343,7 +535,9 @@ def create_test_data(db: Session, test_data: schemas.TestDataUpload):
         ai_summary=test_data.ai_summary,
         report_file_path=test_data.report_file_path,
         is_abnormal=is_abnormal,
-        status="pending"  # 设置默认状态为待处理
+        status="pending",  # 设置默认状态为待处理
+        score_summary=_score_summary(normalized_scores),
+        phys_summary=_phys_summary(test_data.physiological_data_summary),
     )
     db.add(db_test)
     db.flush()
@@ -366,8 +560,12 @@ def create_test_data(db: Session, test_data: schemas.TestDataUpload):
     if test_data.physiological_data_summary.脑电alpha is not None:
         db.add(models.PhysiologicalData(test_fk_id=db_test.id, data_key="脑电alpha", data_value=test_data.physiological_data_summary.脑电alpha))
 
+    record_test_changes(db, [db_test.id])
+    _set_student_latest_test(db, student.id, db_test)
     db.commit()
     db.refresh(db_test)
+    # 上传检测数据时可能新建或补全了学生信息
+    roster_index.refresh(db, [test_data.student_id])
     return db_test
 
 @cached_query(ttl=120)  # 缓存2分钟
@@ -385,34 +583,21 @@ def get_test_records(
         limit: int = 100
 ) -> List[models.Test]:
     """
-    获取检测记录列表，使用 joinedload 预加载关联数据，避免 N+1 查询。
-    确保每个学生只返回一条最新的检测记录。
+    获取检测记录列表，使用 joinedload 预加载学生信息；得分和生理数据在检测记录的紧凑列中，不需要关联查询。
+    每个学生只返回当前（最新上传）的检测记录，历史记录通过 get_student_test_history 查询。
     """
-    # 先构建基础查询条件
-    base_query = db.query(models.Student)
-    
+    # 通过学生表的 latest_test_id 关联当前检测记录，不扫描历史记录
+    query = db.query(models.Test).join(models.Student, models.Student.latest_test_id == models.Test.id) \
+        .options(joinedload(models.Test.student))
+
     if user_id:
-        base_query = base_query.filter(models.Student.student_id == user_id)
+        query = query.filter(models.Student.student_id == user_id)
     if user_name:
-        base_query = base_query.filter(models.Student.name.contains(user_name))
+        query = query.filter(models.Student.name.contains(user_name))
     if gender:
-        base_query = base_query.filter(models.Student.gender == gender)
+        query = query.filter(models.Student.gender == gender)
     if class_name:
-        base_query = base_query.filter(models.Student.class_name == class_name)
-    
-    # 获取符合条件的学生ID列表
-    student_ids = [s.id for s in base_query.all()]
-    if not student_ids:
-        return []
-    
-    # 构建主查询，查询所有符合条件的检测记录
-    query = db.query(models.Test).join(models.Student) \
-        .options(joinedload(models.Test.student)) \
-        .options(joinedload(models.Test.scores)) \
-        .options(joinedload(models.Test.physiological_data)) \
-        .filter(models.Student.id.in_(student_ids))
-    
-    # 先应用时间、异常状态、状态等过滤条件
+        query = query.filter(models.Student.class_name == class_name)
     if start_time:
         query = query.filter(models.Test.test_time >= start_time)
     if end_time:
@@ -421,37 +606,17 @@ def get_test_records(
         query = query.filter(models.Test.is_abnormal == is_abnormal)
     if status is not None:
         query = query.filter(models.Test.status == status)
-    
-    # 获取所有符合条件的记录，然后按学生分组，只保留最新的
-    all_tests = query.all()
-    
-    # 按学生ID分组，每个学生只保留最新的记录
-    student_latest_test = {}
-    for test in all_tests:
-        student_id = test.student_fk_id
-        if student_id not in student_latest_test:
-            student_latest_test[student_id] = test
-        else:
-            # 比较test_time，保留更新的
-            if test.test_time > student_latest_test[student_id].test_time:
-                student_latest_test[student_id] = test
-    
-    # 转换为列表并按test_time降序排序
-    filtered_tests = list(student_latest_test.values())
-    filtered_tests.sort(key=lambda x: x.test_time, reverse=True)
-    
-    # 应用分页
-    return filtered_tests[skip:skip + limit]
+
+    return query.order_by(models.Test.test_time.desc(), models.Test.id.desc()) \
+        .offset(skip).limit(limit).all()
 
 
 def get_test_record_detail(db: Session, record_id: int) -> Optional[models.Test]:
     """
-    根据ID获取单个检测记录的详情，使用 joinedload 预加载关联数据。
+    根据ID获取单个检测记录的详情，使用 joinedload 预加载学生信息。
     """
     record = db.query(models.Test) \
         .options(joinedload(models.Test.student)) \
-        .options(joinedload(models.Test.scores)) \
-        .options(joinedload(models.Test.physiological_data)) \
         .filter(models.Test.id == record_id).first()
     return record
 
@@ -463,7 +628,7 @@ def get_test_count(
         end_time: Optional[datetime] = None,
         is_abnormal: Optional[bool] = None
 ) -> int:
-    query = db.query(func.count(models.Test.id)).join(models.Student)
+    query = db.query(func.count(models.Test.id)).join(models.Student).filter(models.Test.is_latest == True)
 
     if user_id:
         query = query.filter(models.Student.student_id == user_id)
@@ -491,16 +656,7 @@ def delete_test_record(db: Session, record_id: int):
     """
     删除指定ID的检测记录及其所有关联数据。
     """
-    db_record = db.query(models.Test).filter(models.Test.id == record_id).first()
-    if db_record:
-        # 删除与该记录关联的 PhysiologicalData
-        db.query(models.PhysiologicalData).filter(models.PhysiologicalData.test_fk_id == record_id).delete(
-            synchronize_session=False)
-        # 删除与该记录关联的 Score
-        db.query(models.Score).filter(models.Score.test_fk_id == record_id).delete(synchronize_session=False)
-        # 最后删除 Test 记录本身
-        db.delete(db_record)
-        db.commit()
+    delete_test_records(db, [record_id])
     return True
 
 def delete_test_records(db: Session, record_ids: List[int]) -> int:
@@ -511,24 +667,124 @@ def delete_test_records(db: Session, record_ids: List[int]) -> int:
     if not record_ids:
         return 0
 
-    records = db.query(models.Test).filter(models.Test.id.in_(record_ids)).all()
-    if not records:
+    ids = []
+    student_db_ids = set()
+    for chunk in chunked(list(dict.fromkeys(record_ids)), in_chunk_size(db)):
+        for test_id, student_fk_id in db.query(models.Test.id, models.Test.student_fk_id) \
+                .filter(models.Test.id.in_(chunk)):
+            ids.append(test_id)
+            student_db_ids.add(student_fk_id)
+    if not ids:
         return 0
 
-    ids = [record.id for record in records]
-
-    db.query(models.PhysiologicalData).filter(
-        models.PhysiologicalData.test_fk_id.in_(ids)
-    ).delete(synchronize_session=False)
-    db.query(models.Score).filter(
-        models.Score.test_fk_id.in_(ids)
-    ).delete(synchronize_session=False)
+    try:
+        signal_test_ids = _delete_tests(db, ids)
+        promote_latest_tests(db, list(student_db_ids))
+        sync_student_latest_tests(db, list(student_db_ids))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    signal_store.remove_test_signals(signal_test_ids)
+    db.expire_all()
+    return len(ids)
 
-    for record in records:
-        db.delete(record)
+# --- 生理信号原始数据 ---
 
-    db.commit()
-    return len(records)
+def save_physiological_signal(db: Session, test_id: int, channel: str, sample_rate: float,
+                              payload: bytes) -> Optional[models.PhysiologicalSignal]:
+    """
+    保存检测记录某个通道的原始采样（同一通道重复上传时覆盖），并在服务端计算摘要。
+    检测记录不存在时返回 None；数据格式错误时抛出 ValueError。
+    """
+    if not db.query(models.Test.id).filter(models.Test.id == test_id).first():
+        return None
+    samples = signal_store.parse_samples(payload)
+    summary = signal_store.summarize(samples)
+    with signal_store.staged_signal(test_id, channel, samples) as path:
+        # 同一通道的首次上传并发时，后提交的一方违反唯一索引，回滚后按覆盖上传重试一次
+        for attempt in range(2):
+            signal = get_physiological_signal(db, test_id, channel)
+            if signal is None:
+                signal = models.PhysiologicalSignal(test_fk_id=test_id, channel=channel)
+                db.add(signal)
+            signal.sample_rate = sample_rate
+            signal.sample_count = len(samples)
+            signal.file_path = path
+            signal.feature_version = None
+            signal.created_at = datetime.utcnow()
+            for field, value in summary.items():
+                setattr(signal, field, value)
+            try:
+                db.commit()
+                break
+            except IntegrityError:
+                db.rollback()
+                if attempt:
+                    raise
+    db.refresh(signal)
+    return signal
+
+def get_physiological_signals(db: Session, test_id: int) -> List[models.PhysiologicalSignal]:
+    """检测记录的全部信号通道（含已归档的检测记录）"""
+    return db.query(models.PhysiologicalSignal).filter(models.PhysiologicalSignal.test_fk_id == test_id) \
+        .order_by(models.PhysiologicalSignal.channel).all()
+
+def get_physiological_signal(db: Session, test_id: int, channel: str) -> Optional[models.PhysiologicalSignal]:
+    return db.query(models.PhysiologicalSignal).filter(
+        models.PhysiologicalSignal.test_fk_id == test_id, models.PhysiologicalSignal.channel == channel
+    ).first()
+
+def get_signals_for_feature_extraction(db: Session, version: int, test_ids: Optional[List[int]] = None,
+                                       rerun: bool = False) -> List[models.PhysiologicalSignal]:
+    """
+    需要提取特征的信号：特征版本低于 version 的（rerun 时为全部），按检测记录排序。
+    只包含仍在 tests 表中的检测记录，已归档的检测记录不重算。
+    """
+    query = db.query(models.PhysiologicalSignal) \
+        .join(models.Test, models.Test.id == models.PhysiologicalSignal.test_fk_id)
+    if not rerun:
+        query = query.filter((models.PhysiologicalSignal.feature_version == None) |
+                             (models.PhysiologicalSignal.feature_version < version))
+    if test_ids is not None:
+        signals = []
+        for chunk in chunked(list(dict.fromkeys(test_ids)), in_chunk_size(db)):
+            signals.extend(query.filter(models.PhysiologicalSignal.test_fk_id.in_(chunk)))
+        return sorted(signals, key=lambda signal: (signal.test_fk_id, signal.channel))
+    return query.order_by(models.PhysiologicalSignal.test_fk_id, models.PhysiologicalSignal.channel).all()
+
+def save_signal_features(db: Session, features_by_test: Dict[int, Dict[str, float]], signal_ids: List[int],
+                         version: int) -> int:
+    """
+    把服务端提取的特征写入检测记录的生理数据（physiological_data 表与 phys_summary 双写），
+    同名数据项覆盖客户端上报的值；同时标记信号的特征版本。一个事务提交，返回写入特征的检测记录数。
+    """
+    changed = []
+    try:
+        for chunk in chunked(list(features_by_test), in_chunk_size(db)):
+            for test in db.query(models.Test).filter(models.Test.id.in_(chunk)):
+                features = features_by_test[test.id]
+                if not features:
+                    continue
+                summary = {item["data_key"]: item["data_value"] for item in test.phys_list}
+                summary.update(features)
+                test.phys_summary = summary
+                db.execute(delete(models.PhysiologicalData).where(
+                    models.PhysiologicalData.test_fk_id == test.id,
+                    models.PhysiologicalData.data_key.in_(list(features)),
+                ))
+                db.add_all(models.PhysiologicalData(test_fk_id=test.id, data_key=key, data_value=value)
+                           for key, value in features.items())
+                changed.append(test.id)
+        for chunk in chunked(signal_ids, in_chunk_size(db)):
+            db.execute(update(models.PhysiologicalSignal).where(models.PhysiologicalSignal.id.in_(chunk))
+                       .values(feature_version=version))
+        record_test_changes(db, changed)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(changed)
 
 # --- 状态管理相关 CRUD 函数 ---
 
@@ -559,6 +815,7 @@ def update_test_record_status(db: Session, record_id: int, status_update: schema
     record.status = status_update.status
     if status_update.ai_summary:
         record.ai_summary = status_update.ai_summary
+    record_test_changes(db, [record.id])
     
     db.commit()
     db.refresh(record)
@@ -566,9 +823,9 @@ def update_test_record_status(db: Session, record_id: int, status_update: schema
 
 def get_test_records_batch_status(db: Session, student_ids: Optional[List[str]] = None):
     """
-    批量获取检测记录状态
+    批量获取检测记录状态（只统计当前检测记录）
     """
-    query = db.query(models.Test).join(models.Student)
+    query = db.query(models.Test).join(models.Student).filter(models.Test.is_latest == True)
     
     if student_ids:
         query = query.filter(models.Student.student_id.in_(student_ids))
@@ -638,24 +895,212 @@ def get_student_test_records_status(db: Session, student_id: str):
         **status_counts
     }
 
+# --- 检测历史 ---
+
+def lock_students(db: Session, student_db_ids: List[int]):
+    """
+    锁定学生行（SELECT ... FOR UPDATE，按主键顺序加锁避免死锁）直到事务结束。
+    翻转 is_latest 前调用：同一学生的并发上传在此排队，后到的一方能看到先提交的当前记录并将其降级，
+    不会两条记录同时 is_latest=1。SQLite 不支持行锁，写事务本身串行执行。
+    """
+    for chunk in chunked(sorted(set(student_db_ids)), in_chunk_size(db)):
+        db.query(models.Student.id).filter(models.Student.id.in_(chunk)) \
+            .order_by(models.Student.id).with_for_update().all()
+
+def demote_current_tests(db: Session, student_db_ids: List[int]) -> List[int]:
+    """
+    把学生当前的检测记录转为历史记录（只翻转 is_latest 标记，不删除数据）。
+    历史记录不再出现在当前数据导出中，变更日志记为 op="demote"（数据仍在，区别于删除）。
+    """
+    lock_students(db, student_db_ids)
+    demoted = []
+    for chunk in chunked(list(student_db_ids), in_chunk_size(db)):
+        demoted.extend(row[0] for row in db.query(models.Test.id).filter(
+            models.Test.student_fk_id.in_(chunk), models.Test.is_latest == True))
+    for chunk in chunked(demoted, in_chunk_size(db)):
+        db.execute(update(models.Test).where(models.Test.id.in_(chunk)).values(is_latest=False)
+                   .execution_options(synchronize_session=False))
+    record_test_changes(db, demoted, "demote")
+    return demoted
+
+def _set_student_latest_test(db: Session, student_db_id: int, test: models.Test):
+    """上传新检测记录后更新学生的当前检测记录冗余字段；检测次数在数据库端自增，避免并发上传丢失计数"""
+    db.execute(update(models.Student).where(models.Student.id == student_db_id).values(
+        latest_test_id=test.id,
+        latest_test_time=test.test_time,
+        latest_is_abnormal=test.is_abnormal,
+        test_count=models.Student.test_count + 1,
+    ).execution_options(synchronize_session=False))
+
+def sync_student_latest_tests(db: Session, student_db_ids: List[int]):
+    """按 tests 表重新计算这些学生的当前检测记录冗余字段（删除、批量创建等路径使用）"""
+    def current(column):
+        return select(column).where(models.Test.student_fk_id == models.Student.id,
+                                    models.Test.is_latest == True).limit(1).scalar_subquery()
+
+    test_count = select(func.count(models.Test.id)) \
+        .where(models.Test.student_fk_id == models.Student.id).scalar_subquery() \
+        + select(func.count(models.TestArchive.id)) \
+        .where(models.TestArchive.student_fk_id == models.Student.id).scalar_subquery()
+    for chunk in chunked(list(student_db_ids), in_chunk_size(db)):
+        db.execute(update(models.Student).where(models.Student.id.in_(chunk)).values(
+            latest_test_id=current(models.Test.id),
+            latest_test_time=current(models.Test.test_time),
+            latest_is_abnormal=current(models.Test.is_abnormal),
+            test_count=test_count,
+        ).execution_options(synchronize_session=False))
+
+def promote_latest_tests(db: Session, student_db_ids: List[int]) -> List[int]:
+    """当前检测记录被删除后，把这些学生剩余记录中最新的一条重新设为当前记录"""
+    lock_students(db, student_db_ids)
+    promoted = []
+    for chunk in chunked(list(student_db_ids), in_chunk_size(db)):
+        has_current = select(models.Test.student_fk_id).where(models.Test.is_latest == True)
+        row_number = func.row_number().over(
+            partition_by=models.Test.student_fk_id,
+            order_by=(models.Test.test_time.desc(), models.Test.id.desc())
+        ).label("rn")
+        ranked = db.query(models.Test.id.label("test_id"), row_number).filter(
+            models.Test.student_fk_id.in_(chunk), models.Test.student_fk_id.notin_(has_current)
+        ).subquery()
+        ids = [row[0] for row in db.query(ranked.c.test_id).filter(ranked.c.rn == 1)]
+        if ids:
+            db.execute(update(models.Test).where(models.Test.id.in_(ids)).values(is_latest=True)
+                       .execution_options(synchronize_session=False))
+            promoted.extend(ids)
+    record_test_changes(db, promoted, "upsert")
+    return promoted
+
+def archive_test_history(db: Session, before: datetime, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    把检测时间早于 before 的历史检测记录（及其得分、生理数据）批量移入按年份分区的归档表。
+    当前检测记录不归档。每批用 INSERT ... SELECT 加集合 DELETE 完成并单独提交。
+    archive_year 是归档表主键的一部分，不能为 NULL：没有检测时间的历史记录按归档时间的年份归档。
+    """
+    counts = {"tests": 0, "scores": 0, "physiological_data": 0}
+    while True:
+        ids = [row[0] for row in db.query(models.Test.id).filter(
+            models.Test.is_latest == False,
+            or_(models.Test.test_time < before, models.Test.test_time.is_(None))
+        ).order_by(models.Test.id).limit(min(batch_size, in_chunk_size(db)))]
+        if not ids:
+            break
+        try:
+            now = datetime.utcnow()
+            archive_year = func.extract("year", func.coalesce(models.Test.test_time, literal(now)))
+            db.execute(insert(models.TestArchive).from_select(
+                ["id", "archive_year", "student_fk_id", "test_time", "ai_summary",
+                 "report_file_path", "is_abnormal", "status", "archived_at"],
+                select(models.Test.id, archive_year, models.Test.student_fk_id, models.Test.test_time,
+                       models.Test.ai_summary, models.Test.report_file_path, models.Test.is_abnormal,
+                       models.Test.status, literal(now)).where(models.Test.id.in_(ids))
+            ))
+            counts["scores"] += db.execute(insert(models.ScoreArchive).from_select(
+                ["id", "archive_year", "test_fk_id", "module_name", "score", "max_score",
+                 "level", "questionnaire_feedback"],
+                select(models.Score.id, archive_year, models.Score.test_fk_id, models.Score.module_name,
+                       models.Score.score, models.Score.max_score, models.Score.level,
+                       models.Score.questionnaire_feedback)
+                .join(models.Test, models.Score.test_fk_id == models.Test.id).where(models.Test.id.in_(ids))
+            )).rowcount
+            counts["physiological_data"] += db.execute(insert(models.PhysiologicalDataArchive).from_select(
+                ["id", "archive_year", "test_fk_id", "data_key", "data_value"],
+                select(models.PhysiologicalData.id, archive_year, models.PhysiologicalData.test_fk_id,
+                       models.PhysiologicalData.data_key, models.PhysiologicalData.data_value)
+                .join(models.Test, models.PhysiologicalData.test_fk_id == models.Test.id)
+                .where(models.Test.id.in_(ids))
+            )).rowcount
+            db.execute(delete(models.Score).where(models.Score.test_fk_id.in_(ids)))
+            db.execute(delete(models.PhysiologicalData).where(models.PhysiologicalData.test_fk_id.in_(ids)))
+            db.execute(delete(models.Test).where(models.Test.id.in_(ids)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        counts["tests"] += len(ids)
+    db.expire_all()
+    return counts
+
+def _history_item(test, scores: List[Dict[str, Any]], physiological_data: List[Dict[str, Any]],
+                  archived: bool) -> Dict[str, Any]:
+    return {
+        "id": test.id,
+        "test_time": test.test_time,
+        "ai_summary": test.ai_summary,
+        "report_file_path": test.report_file_path,
+        "is_abnormal": bool(test.is_abnormal),
+        "status": test.status,
+        "is_latest": bool(getattr(test, "is_latest", False)),
+        "archived": archived,
+        "scores": scores,
+        "physiological_data": physiological_data,
+    }
+
+def _group_by_test(rows, fields):
+    grouped: Dict[int, List[Dict[str, Any]]] = {}
+    for row in rows:
+        grouped.setdefault(row.test_fk_id, []).append({field: getattr(row, field) for field in fields})
+    return grouped
+
+def get_student_test_history(db: Session, student_id: str, include_archived: bool = True,
+                             start_time: Optional[datetime] = None, end_time: Optional[datetime] = None):
+    """
+    学生的全部检测记录（当前 + 历史，可选包含归档），按检测时间倒序。
+    学生不存在时返回 None。
+    """
+    student = db.query(models.Student.id).filter(models.Student.student_id == student_id).first()
+    if not student:
+        return None
+
+    def query_tests(test_model):
+        query = db.query(test_model).filter(test_model.student_fk_id == student.id)
+        if start_time:
+            query = query.filter(test_model.test_time >= start_time)
+        if end_time:
+            query = query.filter(test_model.test_time <= end_time)
+        return query.all()
+
+    # 当前和历史记录的得分、生理数据直接取紧凑列
+    items = [_history_item(test, test.score_list, test.phys_list, False) for test in query_tests(models.Test)]
+
+    # 归档记录仍按 scores_archive / physiological_data_archive 分组
+    archived_tests = query_tests(models.TestArchive) if include_archived else []
+    if archived_tests:
+        score_fields = ("module_name", "score", "max_score", "level", "questionnaire_feedback")
+        phys_fields = ("data_key", "data_value")
+        test_ids = [test.id for test in archived_tests]
+        scores = {}
+        physiological_data = {}
+        for chunk in chunked(test_ids, in_chunk_size(db)):
+            scores.update(_group_by_test(
+                db.query(models.ScoreArchive).filter(models.ScoreArchive.test_fk_id.in_(chunk)), score_fields))
+            physiological_data.update(_group_by_test(
+                db.query(models.PhysiologicalDataArchive)
+                .filter(models.PhysiologicalDataArchive.test_fk_id.in_(chunk)), phys_fields))
+        items.extend(_history_item(test, scores.get(test.id, []), physiological_data.get(test.id, []), True)
+                     for test in archived_tests)
+
+    items.sort(key=lambda item: (item["test_time"] is not None, item["test_time"], item["id"]), reverse=True)
+    return items
+
 # === 客户端对接相关 CRUD 函数 ===
 
 def validate_student_for_client(db: Session, student_id: str):
     """
-    客户端学号验证，返回学生基本信息
+    客户端学号验证，返回学生基本信息（走内存名单索引，索引未命中时才查询数据库）
     """
     try:
-        student = db.query(models.Student).filter(models.Student.student_id == student_id).first()
+        student = roster_index.get(db, student_id)
         if not student:
             return {"exists": False, "student_info": None}
         
         return {
             "exists": True,
             "student_info": {
-                "student_id": student.student_id,
-                "name": student.name,
-                "class_name": student.class_name,
-                "gender": student.gender
+                "student_id": student["student_id"],
+                "name": student["name"],
+                "class_name": student["class_name"],
+                "gender": student["gender"]
             }
         }
     except Exception as e:
@@ -682,6 +1127,7 @@ def create_client_test_data(db: Session, test_data: schemas.ClientTestDataUpload
         )
         db.add(student)
         db.flush()
+        record_student_changes(db, [student.id])
     else:
         # 如果学生已存在，优先使用数据库中的基础信息
         # 仅在数据库中的字段为空时，才用上传数据补充
@@ -693,6 +1139,8 @@ def create_client_test_data(db: Session, test_data: schemas.ClientTestDataUpload
         #     student.age = test_data.age  # 数据库 Student 模型没有 age 字段，先不要更新
         if not student.class_name and test_data.class_name:
             student.class_name = test_data.class_name
+        if db.is_modified(student):
+            record_student_changes(db, [student.id])
         db.flush()
 
     if not test_data.ai_summary:
@@ -774,17 +1222,8 @@ def create_client_test_data(db: Session, test_data: schemas.ClientTestDataUpload
     elif len(abnormal_modules) == 1:
         test_data.ai_summary = f"检测出{abnormal_modules[0]}风险，建议进一步评估。{test_data.ai_summary}"
 
-    # 如果学生已有检测记录，删除所有旧记录（确保每个学生只保留最新的一条记录）
-    existing_tests = db.query(models.Test).filter(models.Test.student_fk_id == student.id).all()
-    if existing_tests:
-        for old_test in existing_tests:
-            # 删除关联的问卷得分
-            db.query(models.Score).filter(models.Score.test_fk_id == old_test.id).delete()
-            # 删除关联的生理数据
-            db.query(models.PhysiologicalData).filter(models.PhysiologicalData.test_fk_id == old_test.id).delete()
-            # 删除检测记录
-            db.delete(old_test)
-        db.flush()  # 先提交删除操作
+    # 学生之前的检测记录转为历史记录，新记录成为当前记录
+    demote_current_tests(db, [student.id])
 
     db_test = models.Test(
         student_fk_id=student.id,
@@ -792,7 +1231,9 @@ def create_client_test_data(db: Session, test_data: schemas.ClientTestDataUpload
         ai_summary=test_data.ai_summary,
         report_file_path=pdf_file_path or test_data.report_file_path,
         is_abnormal=is_abnormal,
-        status="completed"
+        status="completed",
+        score_summary=_score_summary(normalized_scores),
+        phys_summary=_phys_summary(test_data.physiological_data_summary),
     )
     db.add(db_test)
     db.flush()
@@ -815,25 +1256,30 @@ def create_client_test_data(db: Session, test_data: schemas.ClientTestDataUpload
     if test_data.physiological_data_summary.脑电alpha is not None:
         db.add(models.PhysiologicalData(test_fk_id=db_test.id, data_key="脑电alpha", data_value=test_data.physiological_data_summary.脑电alpha))
 
+    record_test_changes(db, [db_test.id])
+    _set_student_latest_test(db, student.id, db_test)
     db.commit()
     db.refresh(db_test)
+    # 上传检测数据时可能新建或补全了学生信息
+    roster_index.refresh(db, [test_data.student_id])
     return db_test
 
 def get_student_test_status_for_client(db: Session, student_id: str):
     """
     获取学生检测状态（客户端专用）
     """
-    # 检查学生是否存在
-    student = db.query(models.Student).filter(models.Student.student_id == student_id).first()
+    # 检查学生是否存在（内存名单索引）
+    student = roster_index.get(db, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="学生不存在")
 
-    # 查询该学生的检测记录
-    records = db.query(models.Test).join(models.Student).filter(
-        models.Student.student_id == student_id
-    ).order_by(models.Test.test_time.desc()).all()
+    # 检测次数和当前检测记录都取自学生表的冗余字段，只需一次按主键的关联查询
+    latest_record = db.query(models.Student.test_count, models.Student.latest_test_time,
+                             models.Student.latest_is_abnormal, models.Test.status) \
+        .outerjoin(models.Test, models.Test.id == models.Student.latest_test_id) \
+        .filter(models.Student.id == student["id"]).first()
 
-    if not records:
+    if not latest_record or not latest_record.test_count:
         return {
             "student_id": student_id,
             "status": "not_started",
@@ -842,9 +1288,6 @@ def get_student_test_status_for_client(db: Session, student_id: str):
             "test_record_count": 0
         }
 
-    # 获取最新的检测记录
-    latest_record = records[0]
-    
     # 判断状态
     if latest_record.status == "completed":
         status = "completed"
@@ -856,204 +1299,567 @@ def get_student_test_status_for_client(db: Session, student_id: str):
     return {
         "student_id": student_id,
         "status": status,
-        "is_abnormal": latest_record.is_abnormal,
-        "latest_test_time": latest_record.test_time,
-        "test_record_count": len(records)
+        "is_abnormal": latest_record.latest_is_abnormal,
+        "latest_test_time": latest_record.latest_test_time,
+        "test_record_count": latest_record.test_count
     }
 
 
+# --- 客户端名单同步 ---
+
+ROSTER_FIELDS = ("id", "student_id", "name", "class_name", "gender")
+
+
+def get_roster_version(db: Session, settle_seconds: Optional[float] = None) -> int:
+    """
+    名单版本号即已过等待期的变更日志的最大序号。
+    与增量导出的变更窗口相同，版本号不能越过可能仍在未提交事务中的较小序号，否则该变更永远不会下发给客户端。
+    """
+    return db.query(func.max(models.ChangeLog.id)) \
+        .filter(models.ChangeLog.changed_at <= _settled_before(settle_seconds)).scalar() or 0
+
+
+def _roster_query(db: Session):
+    return db.query(models.Student.id, models.Student.student_id, models.Student.name,
+                    models.Student.class_name, models.Student.gender)
+
+
+def get_client_roster(db: Session, class_name: Optional[str] = None,
+                      since_version: Optional[int] = None,
+                      settle_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """
+    客户端离线验证用的学生名单。
+    不带 since_version（或版本号无效）时返回全量快照；否则只返回该版本之后新增/修改的学生
+    和被删除的学生ID。指定 class_name 时，转出该班级的学生也按删除处理。
+    等待期内的变更可能已出现在本次结果中，下次增量同步时会再下发一次。
+    """
+    version = get_roster_version(db, settle_seconds)
+
+    if since_version is None or since_version < 0 or since_version > version:
+        query = _roster_query(db)
+        if class_name:
+            query = query.filter(models.Student.class_name == class_name)
+        students = [dict(zip(ROSTER_FIELDS, row)) for row in query.order_by(models.Student.id)]
+        return {"version": version, "full": True, "students": students, "deleted_ids": []}
+
+    last_seq = func.max(models.ChangeLog.id).label("seq")
+    last_changes = db.query(models.ChangeLog.entity_id, last_seq) \
+        .filter(models.ChangeLog.entity == "student",
+                models.ChangeLog.id > since_version, models.ChangeLog.id <= version) \
+        .group_by(models.ChangeLog.entity_id).subquery()
+    changed_ids = [row[0] for row in db.query(last_changes.c.entity_id)]
+
+    current = {}
+    for chunk in chunked(changed_ids, in_chunk_size(db)):
+        for row in _roster_query(db).filter(models.Student.id.in_(chunk)):
+            current[row.id] = row
+
+    students = []
+    deleted_ids = []
+    for student_db_id in sorted(changed_ids):
+        row = current.get(student_db_id)
+        if row is not None and (not class_name or row.class_name == class_name):
+            students.append(dict(zip(ROSTER_FIELDS, row)))
+        else:
+            deleted_ids.append(student_db_id)
+    return {"version": version, "full": False, "students": students, "deleted_ids": deleted_ids}
+
+
 # --- 数据导出相关函数 ---
 
+STUDENT_EXPORT_HEADERS = ["学号", "姓名", "班级", "性别", "创建时间"]
+TEST_RECORD_EXPORT_HEADERS = [
+    "记录ID", "学号", "姓名", "班级", "性别", "检测时间",
+    "AI评估总结", "是否异常", "状态", "报告文件路径",
+]
+
+# 仪表板得分分布统计的模块（有生成列的已知模块，分布统计走 ix_tests_latest_scores 覆盖索引）与分数段
+DASHBOARD_SCORE_MODULES = list(models.TYPED_SCORE_COLUMNS)
+SCORE_BUCKETS = ["0-10", "11-15", "16-20", "21-25", "26-30"]
+
+
+def _format_datetime(value: Optional[datetime]) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+
+def _new_export_path(prefix: str, ext: str = "xlsx") -> str:
+    """在导出目录下生成带时间戳的文件路径"""
+    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+    filename = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
+    return os.path.join(settings.EXPORT_DIR, filename)
+
+
+def _latest_test_ids(
+        db: Session,
+        user_id: Optional[str] = None,
+        user_name: Optional[str] = None,
+        gender: Optional[str] = None,
+        class_name: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        is_abnormal: Optional[bool] = None,
+        status: Optional[str] = None,
+        student_fk_ids: Optional[List[int]] = None,
+        latest_only: bool = True,
+):
+    """
+    与 get_test_records 相同的筛选条件下，每个学生当前检测记录ID的子查询。
+    直接按 is_latest 标记筛选，不需要窗口函数，也不会扫描历史记录；
+    latest_only 为 False 时不限 is_latest，同时包含历史记录（列式导出使用）。
+    """
+    query = select(models.Test.id) \
+        .join(models.Student, models.Test.student_fk_id == models.Student.id)
+    if latest_only:
+        query = query.where(models.Test.is_latest == True)
+
+    if user_id:
+        query = query.where(models.Student.student_id == user_id)
+    if user_name:
+        query = query.where(models.Student.name.contains(user_name))
+    if gender:
+        query = query.where(models.Student.gender == gender)
+    if class_name:
+        query = query.where(models.Student.class_name == class_name)
+    if start_time:
+        query = query.where(models.Test.test_time >= start_time)
+    if end_time:
+        query = query.where(models.Test.test_time <= end_time)
+    if is_abnormal is not None:
+        query = query.where(models.Test.is_abnormal == is_abnormal)
+    if status is not None:
+        query = query.where(models.Test.status == status)
+    if student_fk_ids is not None:
+        query = query.where(models.Test.student_fk_id.in_(student_fk_ids))
+    return query
+
+
+def iter_student_export_rows(db: Session, skip: int = 0, limit: int = 10000,
+                             chunk_size: Optional[int] = None):
+    """按服务器端游标分批读取学生数据，逐行产出导出数据"""
+    query = db.query(
+        models.Student.student_id,
+        models.Student.name,
+        models.Student.class_name,
+        models.Student.gender,
+        models.Student.created_at,
+    ).order_by(models.Student.name).offset(skip).limit(limit) \
+        .yield_per(chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+    for row in query:
+        yield (row.student_id, row.name, row.class_name, row.gender, _format_datetime(row.created_at))
+
+
+def get_test_record_export_columns(db: Session):
+    """
+    检测记录导出的得分列和生理数据列。
+    上传接口只接受有生成列的已知模块和数据项，列固定取 TYPED_SCORE_COLUMNS / TYPED_PHYS_COLUMNS，
+    导出时不再对 scores / physiological_data 做 DISTINCT 扫描；没有数据的列导出为空值。
+    """
+    return list(models.TYPED_SCORE_COLUMNS), list(models.TYPED_PHYS_COLUMNS)
+
+
+def _score_value(module_name: str):
+    """某问卷模块的得分：已知模块读生成列，其他模块从 JSON 紧凑列取值"""
+    column = models.TYPED_SCORE_COLUMNS.get(module_name)
+    if column:
+        return getattr(models.Test, column)
+    return models.Test.score_summary[(module_name, "score")].as_integer()
+
+
+def _phys_value(data_key: str):
+    """某生理数据项的数值：已知数据项读生成列，其他数据项从 JSON 紧凑列取值"""
+    column = models.TYPED_PHYS_COLUMNS.get(data_key)
+    if column:
+        return getattr(models.Test, column)
+    return models.Test.phys_summary[data_key].as_float()
+
+
+def _test_record_wide_query(db: Session, module_names: List[str], phys_keys: List[str],
+                            test_ids: Optional[List[int]] = None, latest_only: bool = True, **filters):
+    """
+    检测记录宽表查询：问卷得分和生理数据按模块/数据项取检测记录上的生成列（未知模块从 JSON 紧凑列取值），
+    不需要关联 scores / physiological_data 表，流式读取期间也不需要再发起额外查询。
+    指定 test_ids 时直接按记录ID查询，否则按筛选条件取每个学生最新的记录（latest_only=False 时含历史记录）。
+    列顺序：记录ID、学号、姓名、班级、性别、检测时间、AI总结、是否异常、状态、报告路径、各模块得分、各生理数据项。
+    """
+    score_columns = [_score_value(module_name) for module_name in module_names]
+    phys_columns = [_phys_value(data_key) for data_key in phys_keys]
+
+    query = db.query(
+        models.Test.id,
+        models.Student.student_id,
+        models.Student.name,
+        models.Student.class_name,
+        models.Student.gender,
+        models.Test.test_time,
+        models.Test.ai_summary,
+        models.Test.is_abnormal,
+        models.Test.status,
+        models.Test.report_file_path,
+        *score_columns,
+        *phys_columns,
+    ).join(models.Student, models.Test.student_fk_id == models.Student.id)
+
+    if test_ids is not None:
+        return query.filter(models.Test.id.in_(test_ids))
+    return query.filter(models.Test.id.in_(_latest_test_ids(db, latest_only=latest_only, **filters))) \
+        .order_by(models.Test.test_time.desc())
+
+
+def _format_test_record_row(row) -> tuple:
+    """宽表查询结果转换为 CSV/NDJSON/xlsx 导出的行"""
+    return (
+        row[0], row[1], row[2], row[3], row[4],
+        _format_datetime(row[5]),
+        row[6] or "",
+        "是" if row[7] else "否",
+        row[8],
+        row[9] or "",
+        *row[10:],
+    )
+
+
+def iter_test_record_export_rows(db: Session, module_names: List[str], phys_keys: List[str],
+                                 chunk_size: Optional[int] = None, **filters):
+    """按服务器端游标分批读取检测记录，逐行产出导出数据"""
+    query = _test_record_wide_query(db, module_names, phys_keys, **filters) \
+        .yield_per(chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+    for row in query:
+        yield _format_test_record_row(row)
+
+
+# 增量导出每行前面附加的列：变更类型和变更序号
+CHANGE_EXPORT_HEADERS = ["变更类型", "变更序号"]
+
+
+def get_change_watermark_for_time(db: Session, since_time: datetime) -> int:
+    """把时间水位线换算为变更序号：返回该时间之前最后一条变更的序号"""
+    seq = db.query(func.max(models.ChangeLog.id)) \
+        .filter(models.ChangeLog.entity == "test", models.ChangeLog.changed_at <= since_time).scalar()
+    return seq or 0
+
+
+def _settled_before(settle_seconds: Optional[float] = None) -> datetime:
+    """变更日志的等待期截止时间，settle_seconds 默认取 CHANGE_EXPORT_SETTLE_SECONDS"""
+    if settle_seconds is None:
+        settle_seconds = settings.CHANGE_EXPORT_SETTLE_SECONDS
+    return datetime.utcnow() - timedelta(seconds=settle_seconds)
+
+
+def get_test_record_change_window(db: Session, since: int = 0, limit: int = 10000,
+                                  settle_seconds: Optional[float] = None):
+    """
+    确定一次增量导出的变更窗口 (since, until]：最多包含 limit 条变更日志。
+    返回 (until, 是否还有更多)；没有新变更时 until 等于 since。
+
+    变更序号在插入时分配、在事务提交时才可见，InnoDB 下并发事务的提交顺序可能与序号顺序不同：
+    序号较大的变更已经可见时，较小的序号可能还在未提交的事务中，水位线越过它就会永久漏掉。
+    因此窗口只包含写入时间早于 settle_seconds（默认 CHANGE_EXPORT_SETTLE_SECONDS）的变更，
+    等待期内仍未提交的事务（超过该时长的长事务）不在保证范围内。
+    """
+    seqs = db.query(models.ChangeLog.id) \
+        .filter(models.ChangeLog.entity == "test", models.ChangeLog.id > since,
+                models.ChangeLog.changed_at <= _settled_before(settle_seconds)) \
+        .order_by(models.ChangeLog.id).limit(limit + 1).all()
+    if not seqs:
+        return since, False
+    window = seqs[:limit]
+    return window[-1][0], len(seqs) > limit
+
+
+def get_test_record_changes(db: Session, since: int, until: int,
+                            chunk_size: Optional[int] = None):
+    """
+    增量导出：返回变更序号在 (since, until] 内的检测记录变更，(表头, 数据行迭代器)。
+    同一记录在窗口内多次变更只输出最后一次；已删除（delete）和转为历史记录（demote）的记录
+    输出只有记录ID的墓碑行，两者都应从当前数据中移除。
+    """
+    module_names, phys_keys = get_test_record_export_columns(db)
+    headers = CHANGE_EXPORT_HEADERS + TEST_RECORD_EXPORT_HEADERS + module_names + phys_keys
+
+    # 每条记录只保留窗口内的最后一次变更
+    last_seq = func.max(models.ChangeLog.id).label("seq")
+    last_changes = db.query(models.ChangeLog.entity_id, last_seq) \
+        .filter(models.ChangeLog.entity == "test",
+                models.ChangeLog.id > since, models.ChangeLog.id <= until) \
+        .group_by(models.ChangeLog.entity_id).subquery()
+    changes = db.query(models.ChangeLog.id, models.ChangeLog.entity_id, models.ChangeLog.op) \
+        .join(last_changes, models.ChangeLog.id == last_changes.c.seq) \
+        .order_by(models.ChangeLog.id).all()
+
+    def rows():
+        empty_columns = [None] * (len(headers) - len(CHANGE_EXPORT_HEADERS) - 1)
+        chunk = chunk_size or settings.EXPORT_CHUNK_SIZE
+        for start in range(0, len(changes), chunk):
+            batch = changes[start:start + chunk]
+            upsert_ids = [test_id for _, test_id, op in batch if op == "upsert"]
+            found = {}
+            if upsert_ids:
+                for row in _test_record_wide_query(db, module_names, phys_keys, test_ids=upsert_ids):
+                    found[row[0]] = _format_test_record_row(row)
+            for seq, test_id, op in batch:
+                if op == "upsert" and test_id in found:
+                    yield ("upsert", seq, *found[test_id])
+                elif op == "demote":
+                    # 转为历史记录：移出当前数据，但记录本身未删除
+                    yield ("demote", seq, test_id, *empty_columns)
+                else:
+                    # 已删除，或在窗口之后被删除
+                    yield ("delete", seq, test_id, *empty_columns)
+
+    return headers, rows()
+
+
+# 列式导出（Parquet/Arrow）的基础列及类型
+COLUMNAR_BASE_FIELDS = [
+    ("record_id", "int64"),
+    ("student_id", "string"),
+    ("name", "string"),
+    ("class_name", "string"),
+    ("gender", "string"),
+    ("test_time", "timestamp"),
+    ("ai_summary", "string"),
+    ("is_abnormal", "bool"),
+    ("status", "string"),
+    ("report_file_path", "string"),
+    ("is_latest", "bool"),
+]
+
+# 按检测时间分区的粒度
+PARTITION_FORMATS = {"year": "%Y", "month": "%Y-%m", "day": "%Y-%m-%d"}
+
+
+def get_test_record_columnar_fields(module_names: List[str], phys_keys: List[str]):
+    """列式导出的字段定义：每个问卷模块一列 score_<模块>，每个生理数据项一列 phys_<数据项>"""
+    return COLUMNAR_BASE_FIELDS \
+        + [(f"score_{module_name}", "int32") for module_name in module_names] \
+        + [(f"phys_{data_key}", "float64") for data_key in phys_keys]
+
+
+def iter_test_record_columnar_batches(db: Session, module_names: List[str], phys_keys: List[str],
+                                      partition_by: Optional[str] = None,
+                                      chunk_size: Optional[int] = None, **filters):
+    """
+    按列分批产出检测记录，每批对应一个 row group：(分区值, {列名: 值列表})。
+    包含历史记录，is_latest 列标记学生的当前记录。
+    查询按检测时间排序，同一分区的数据是连续的，分区变化时立即结束当前批次。
+    """
+    if partition_by and partition_by not in PARTITION_FORMATS:
+        raise ValueError(f"partition_by 必须是 {', '.join(PARTITION_FORMATS)} 之一")
+
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    names = [name for name, _ in get_test_record_columnar_fields(module_names, phys_keys)]
+    base_count = len(COLUMNAR_BASE_FIELDS) - 1
+    query = _test_record_wide_query(db, module_names, phys_keys, latest_only=False, **filters) \
+        .add_columns(models.Test.is_latest).yield_per(chunk_size)
+
+    columns = {name: [] for name in names}
+    count = 0
+    current_key = None
+    for row in query:
+        key = None
+        if partition_by:
+            key = row[5].strftime(PARTITION_FORMATS[partition_by]) if row[5] else "unknown"
+        if count and (key != current_key or count >= chunk_size):
+            yield current_key, columns
+            columns = {name: [] for name in names}
+            count = 0
+        current_key = key
+        # is_latest 追加在查询末尾，按字段顺序放到基础列之后
+        values = (*row[:base_count], row[-1], *row[base_count:-1])
+        for name, value in zip(names, values):
+            columns[name].append(value)
+        count += 1
+
+    if count:
+        yield current_key, columns
+
+
+def get_class_distribution(db: Session) -> Dict[str, int]:
+    """按班级统计学生数"""
+    rows = db.query(models.Student.class_name, func.count(models.Student.id)) \
+        .group_by(models.Student.class_name).all()
+    return {class_name: count for class_name, count in rows}
+
+
+def get_score_distribution(db: Session, module_names: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+    """在数据库中按分数段聚合各问卷模块的人数（只统计每个学生最新的检测记录，一次扫描得到全部模块）"""
+    module_names = module_names or DASHBOARD_SCORE_MODULES
+    ranges = [(None, 10), (10, 15), (15, 20), (20, 25), (25, None)]  # 与 SCORE_BUCKETS 一一对应，(下限, 上限]
+    columns = []
+    for module_name in module_names:
+        score = _score_value(module_name)
+        for lower, upper in ranges:
+            conditions = [score.isnot(None)]
+            if lower is not None:
+                conditions.append(score > lower)
+            if upper is not None:
+                conditions.append(score <= upper)
+            columns.append(func.count(case((and_(*conditions), 1))))
+
+    row = db.query(*columns).filter(models.Test.is_latest == True).one()
+    counts = iter(row)
+    return {module_name: {b: next(counts) for b in SCORE_BUCKETS} for module_name in module_names}
+
+
 def export_students_to_excel(db: Session, skip: int = 0, limit: int = 10000) -> str:
-    """导出学生数据到Excel文件"""
-    students = get_students_with_filters(db, skip=0, limit=limit)
-    
-    if not students:
+    """导出学生数据到Excel文件（流式写入，内存占用与数据量无关）"""
+    rows = iter_student_export_rows(db, skip=skip, limit=limit)
+    first_row = next(rows, None)
+    if first_row is None:
         raise ValueError("没有可导出的学生数据")
-    
-    # 准备数据
-    data = []
-    for student in students:
-        data.append({
-            "学号": student.student_id,
-            "姓名": student.name,
-            "班级": student.class_name,
-            "性别": student.gender,
-            "创建时间": student.created_at.strftime("%Y-%m-%d %H:%M:%S") if student.created_at else ""
-        })
-    
-    # 创建DataFrame并导出
-    df = pd.DataFrame(data)
-    
-    # 导出目录
-    export_dir = "exports"
-    os.makedirs(export_dir, exist_ok=True)
-    
-    # 生成文件名
-    filename = f"学生数据_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    filepath = os.path.join(export_dir, filename)
-    
-    # 保存Excel文件
-    df.to_excel(filepath, index=False, engine="openpyxl")
-    
+
+    filepath = _new_export_path("学生数据")
+    write_xlsx(filepath, [("Sheet1", STUDENT_EXPORT_HEADERS, itertools.chain([first_row], rows))])
     return filepath
 
 
-def export_test_records_to_excel(db: Session, user_id: Optional[str] = None, 
+def export_test_records_to_excel(db: Session, user_id: Optional[str] = None,
                                start_time: Optional[datetime] = None,
                                end_time: Optional[datetime] = None,
                                is_abnormal: Optional[bool] = None,
                                status: Optional[str] = None) -> str:
-    """导出检测记录数据到Excel文件"""
-    
-    # 获取所有符合条件的记录
-    records = get_test_records(db, user_id=user_id, start_time=start_time, 
-                             end_time=end_time, is_abnormal=is_abnormal, 
-                             status=status, skip=0, limit=999999)
-    
-    if not records:
+    """导出检测记录数据到Excel文件（流式写入，内存占用与数据量无关）"""
+    module_names, phys_keys = get_test_record_export_columns(db)
+    rows = iter_test_record_export_rows(
+        db, module_names, phys_keys,
+        user_id=user_id, start_time=start_time, end_time=end_time,
+        is_abnormal=is_abnormal, status=status
+    )
+    first_row = next(rows, None)
+    if first_row is None:
         raise ValueError("没有可导出的检测记录数据")
-    
-    # 准备数据
-    data = []
-    for record in records:
-        # 获取问卷得分
-        scores_dict = {}
-        for score in record.scores:
-            scores_dict[score.module_name] = score.score
-        
-        # 获取生理数据
-        phys_data_dict = {}
-        for phys_data in record.physiological_data:
-            phys_data_dict[phys_data.data_key] = phys_data.data_value
-        
-        data.append({
-            "记录ID": record.id,
-            "学号": record.student.student_id,
-            "姓名": record.student.name,
-            "班级": record.student.class_name,
-            "性别": record.student.gender,
-            "检测时间": record.test_time.strftime("%Y-%m-%d %H:%M:%S") if record.test_time else "",
-            "AI评估总结": record.ai_summary or "",
-            "是否异常": "是" if record.is_abnormal else "否",
-            "状态": record.status,
-            "报告文件路径": record.report_file_path or "",
-            **scores_dict,  # 展开问卷得分
-            **phys_data_dict  # 展开生理数据
-        })
-    
-    # 创建DataFrame并导出
-    df = pd.DataFrame(data)
-    
-    # 导出目录
-    export_dir = "exports"
-    os.makedirs(export_dir, exist_ok=True)
-    
-    # 生成文件名
-    filename = f"检测记录数据_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    filepath = os.path.join(export_dir, filename)
-    
-    # 保存Excel文件
-    df.to_excel(filepath, index=False, engine="openpyxl")
-    
+
+    headers = TEST_RECORD_EXPORT_HEADERS + module_names + phys_keys
+    filepath = _new_export_path("检测记录数据")
+    write_xlsx(filepath, [("Sheet1", headers, itertools.chain([first_row], rows))])
     return filepath
 
 
+def export_test_records_to_columnar(db: Session, format: str = "parquet",
+                                    partition_by: Optional[str] = None,
+                                    progress=None, filepath: Optional[str] = None,
+                                    **filters) -> str:
+    """
+    导出检测记录为带类型的宽表 Parquet/Arrow 文件，供分析使用。
+    包含当前记录和历史记录（is_latest 列区分），已移入归档表的记录不包含在内。
+    按 EXPORT_CHUNK_SIZE 分批写入 row group；指定 partition_by 时按检测时间分区并打包为 zip。
+    未安装 pyarrow 时抛出 ColumnarExportUnavailable。
+    """
+    module_names, phys_keys = get_test_record_export_columns(db)
+    fields = get_test_record_columnar_fields(module_names, phys_keys)
+    batches = iter_test_record_columnar_batches(
+        db, module_names, phys_keys, partition_by=partition_by, **filters
+    )
+    if filepath is None:
+        filepath = _new_export_path("检测记录数据", "zip" if partition_by else format)
+    write_columnar(
+        filepath, fields, batches, format=format,
+        partition_column=f"test_{partition_by}" if partition_by else None,
+        progress=progress,
+    )
+    return filepath
+
+
+def get_dashboard_export_sheets(db: Session):
+    """仪表板统计导出的各个工作表，全部由聚合查询得到"""
+    latest_ids = _latest_test_ids(db)
+    total_students = db.query(func.count(models.Student.id)).scalar() or 0
+    total_records = db.query(func.count(models.Test.id)).filter(models.Test.id.in_(latest_ids)).scalar() or 0
+    abnormal_count = db.query(func.count(models.Test.id)) \
+        .filter(models.Test.id.in_(latest_ids), models.Test.is_abnormal == True).scalar() or 0
+
+    today_start = datetime.combine(datetime.now().date(), datetime.min.time())
+    today_count = db.query(func.count(models.Test.id)) \
+        .filter(models.Test.id.in_(_latest_test_ids(db, start_time=today_start))).scalar() or 0
+
+    score_distribution = get_score_distribution(db)
+    return [
+        ("统计概览", ["指标", "数值"], [
+            ("总学生数", total_students),
+            ("总检测记录数", total_records),
+            ("异常记录数", abnormal_count),
+            ("今日检测数", today_count),
+        ]),
+        ("班级分布", ["班级", "学生数"], list(get_class_distribution(db).items())),
+        ("得分分布", ["模块", "分数段", "人数"], [
+            (module_name, score_range, count)
+            for module_name, distribution in score_distribution.items()
+            for score_range, count in distribution.items()
+        ]),
+    ]
+
+
+DASHBOARD_FLAT_EXPORT_HEADERS = ["工作表", "项目", "分组", "数值"]
+
+
+def iter_dashboard_export_rows(db: Session):
+    """把仪表板统计的多个工作表展开为统一的四列，用于 CSV/NDJSON 导出"""
+    for title, _headers, rows in get_dashboard_export_sheets(db):
+        for row in rows:
+            if len(row) == 3:
+                yield (title, row[0], row[1], row[2])
+            else:
+                yield (title, row[0], "", row[1])
+
+
 def export_dashboard_stats_to_excel(db: Session) -> str:
     """导出仪表板统计数据到Excel文件"""
-    
-    # 获取统计数据
-    total_students = len(get_students_with_filters(db, skip=0, limit=999999))
-    all_records = get_test_records(db, skip=0, limit=999999)
-    total_records = len(all_records)
-    abnormal_records = [r for r in all_records if r.is_abnormal]
-    abnormal_count = len(abnormal_records)
-    
-    # 获取今日记录数
-    today = datetime.now().date()
-    today_start = datetime.combine(today, datetime.min.time())
-    today_records = get_test_records(db, start_time=today_start, skip=0, limit=999999)
-    today_count = len(today_records)
-    
-    # 获取班级分布
-    students = get_students_with_filters(db, skip=0, limit=999999)
-    class_distribution = {}
-    for student in students:
-        class_name = student.class_name
-        class_distribution[class_name] = class_distribution.get(class_name, 0) + 1
-    
-    # 获取得分统计
-    score_stats = {
-        "焦虑": [],
-        "抑郁": [],
-        "压力": []
-    }
-    
-    for record in all_records:
-        for score in record.scores:
-            if score.module_name in score_stats:
-                score_stats[score.module_name].append(score.score)
-    
-    # 计算每个分数段的分布
-    score_distribution = {}
-    for module_name, scores in score_stats.items():
-        distribution = {
-            "0-10": 0,
-            "11-15": 0,
-            "16-20": 0,
-            "21-25": 0,
-            "26-30": 0
-        }
-        
-        for score in scores:
-            if score <= 10:
-                distribution["0-10"] += 1
-            elif score <= 15:
-                distribution["11-15"] += 1
-            elif score <= 20:
-                distribution["16-20"] += 1
-            elif score <= 25:
-                distribution["21-25"] += 1
-            else:
-                distribution["26-30"] += 1
-        
-        score_distribution[module_name] = distribution
-    
-    # 创建多sheet的Excel文件
-    export_dir = "exports"
-    os.makedirs(export_dir, exist_ok=True)
-    
-    filename = f"仪表板统计数据_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    filepath = os.path.join(export_dir, filename)
-    
-    with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-        # 统计概览sheet
-        stats_data = {
-            "指标": ["总学生数", "总检测记录数", "异常记录数", "今日检测数"],
-            "数值": [total_students, total_records, abnormal_count, today_count]
-        }
-        pd.DataFrame(stats_data).to_excel(writer, sheet_name='统计概览', index=False)
-        
-        # 班级分布sheet
-        class_data = []
-        for class_name, count in class_distribution.items():
-            class_data.append({"班级": class_name, "学生数": count})
-        pd.DataFrame(class_data).to_excel(writer, sheet_name='班级分布', index=False)
-        
-        # 得分分布sheet
-        score_data = []
-        for module_name, distribution in score_distribution.items():
-            for score_range, count in distribution.items():
-                score_data.append({
-                    "模块": module_name,
-                    "分数段": score_range,
-                    "人数": count
-                })
-        pd.DataFrame(score_data).to_excel(writer, sheet_name='得分分布', index=False)
-    
+    filepath = _new_export_path("仪表板统计数据")
+    write_xlsx(filepath, get_dashboard_export_sheets(db))
     return filepath
 
 
+# 导出类型 -> 文件名前缀
+EXPORT_KINDS = {
+    "students": "学生数据",
+    "test-records": "检测记录数据",
+    "dashboard-stats": "仪表板统计数据",
+}
+
+TEST_RECORD_FILTER_KEYS = ("user_id", "start_time", "end_time", "is_abnormal", "status")
+
+
+def get_export_rows(db: Session, kind: str, **params):
+    """按导出类型返回 (表头, 数据行迭代器)，用于 CSV/NDJSON 等单表格式"""
+    if kind == "students":
+        return STUDENT_EXPORT_HEADERS, iter_student_export_rows(
+            db, skip=params.get("skip", 0), limit=params.get("limit", 10000))
+    if kind == "test-records":
+        module_names, phys_keys = get_test_record_export_columns(db)
+        filters = {k: params.get(k) for k in TEST_RECORD_FILTER_KEYS}
+        return (TEST_RECORD_EXPORT_HEADERS + module_names + phys_keys,
+                iter_test_record_export_rows(db, module_names, phys_keys, **filters))
+    if kind == "dashboard-stats":
+        return DASHBOARD_FLAT_EXPORT_HEADERS, iter_dashboard_export_rows(db)
+    raise ValueError(f"不支持的导出类型: {kind}")
+
+
+def get_export_sheets(db: Session, kind: str, **params):
+    """按导出类型返回 xlsx 工作表定义"""
+    if kind == "dashboard-stats":
+        return get_dashboard_export_sheets(db)
+    headers, rows = get_export_rows(db, kind, **params)
+    return [("Sheet1", headers, rows)]
+
+
+def count_export_rows(db: Session, kind: str, latest_only: bool = True, **params) -> int:
+    """估算导出的数据行数，用于显示后台导出任务的进度；列式导出包含历史记录，传 latest_only=False"""
+    if kind == "students":
+        total = db.query(func.count(models.Student.id)).scalar() or 0
+        skip = params.get("skip", 0)
+        return max(0, min(total - skip, params.get("limit", 10000)))
+    if kind == "test-records":
+        filters = {k: params.get(k) for k in TEST_RECORD_FILTER_KEYS}
+        return db.query(func.count(models.Test.id)) \
+            .filter(models.Test.id.in_(_latest_test_ids(db, latest_only=latest_only, **filters))).scalar() or 0
+    if kind == "dashboard-stats":
+        class_count = db.query(func.count(func.distinct(models.Student.class_name))).scalar() or 0
+        return 4 + class_count + len(DASHBOARD_SCORE_MODULES) * len(SCORE_BUCKETS)
+    raise ValueError(f"不支持的导出类型: {kind}")
+
+
 # 新增函数：获取所有学号（用于批量导入去重）
 def get_all_student_ids(db: Session):
     """获取所有学生的学号，用于批量导入时的去重检查"""
@@ -1070,19 +1876,19 @@ def get_dashboard_stats_aggregated(db: Session):
     # 学生总数
     total_students = db.query(func.count(models.Student.id)).scalar()
     
-    # 检测记录总数
-    total_records = db.query(func.count(models.Test.id)).scalar()
+    # 检测记录总数（只统计当前检测记录）
+    total_records = db.query(func.count(models.Test.id)).filter(models.Test.is_latest == True).scalar()
     
     # 异常记录数
     abnormal_count = db.query(func.count(models.Test.id)).filter(
-        models.Test.is_abnormal == True
+        models.Test.is_latest == True, models.Test.is_abnormal == True
     ).scalar()
     
     # 今日记录数
     today = date.today()
     today_start = datetime.combine(today, datetime.min.time())
     today_count = db.query(func.count(models.Test.id)).filter(
-        models.Test.test_time >= today_start
+        models.Test.is_latest == True, models.Test.test_time >= today_start
     ).scalar()
     
     return {
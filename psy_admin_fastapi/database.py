@@ -1,18 +1,50 @@
 # database.py
 
-from sqlalchemy import create_engine
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.pool import QueuePool
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from sqlalchemy_utils import database_exists, create_database # 新增导入
 
+logger = logging.getLogger(__name__)
+
 
 class Settings(BaseSettings):
     # 使用SQLite数据库作为临时解决方案
     DATABASE_URL: str = "sqlite:///./psyadmin.db"
     DB_NAME: str = "psyadmin.db"
 
+    # 数据库配置档：production 关闭 SQL 回显；development 打印每条 SQL 便于调试
+    DB_PROFILE: str = "production"
+    DB_ECHO: Optional[bool] = None  # 显式设置时覆盖配置档的默认值
+
+    # SQLite：每个连接建立时执行的 PRAGMA
+    SQLITE_JOURNAL_MODE: str = "WAL"  # WAL 模式下读写互不阻塞
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # WAL 模式下 NORMAL 不会损坏数据库，只可能丢失掉电前最后的事务
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # 写锁被占用时等待而不是立即报 database is locked
+
+    # MySQL 等服务端数据库的连接池
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800  # 小于 MySQL wait_timeout，避免拿到已被服务端关闭的连接
+    DB_POOL_PRE_PING: bool = True
+
+    # 只读副本：仪表板、导出、报告和列表查询走副本，未配置或不可用时回退主库
+    DATABASE_REPLICA_URL: Optional[str] = None  # 本地测试可指向另一个 SQLite 文件或另一个 MySQL 实例
+    REPLICA_MAX_LAG_SECONDS: float = 10  # 副本落后主库超过该秒数时读请求改走主库
+    REPLICA_CHECK_INTERVAL_SECONDS: float = 15  # 副本可用性和延迟的检查间隔
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 settings = Settings()
@@ -20,12 +52,67 @@ settings = Settings()
 # 数据库连接字符串
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
+
+def _is_memory_sqlite(url) -> bool:
+    return url.database in (None, "", ":memory:") or "mode=memory" in str(url)
+
+
+def _sqlite_pragmas(config: Settings, memory: bool):
+    pragmas = [
+        f"PRAGMA busy_timeout = {config.SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA cache_size = -{config.SQLITE_CACHE_SIZE_KB}",  # 负数表示以 KB 为单位
+        f"PRAGMA mmap_size = {config.SQLITE_MMAP_SIZE}",
+        f"PRAGMA synchronous = {config.SQLITE_SYNCHRONOUS}",
+    ]
+    if not memory:
+        # 内存数据库不支持 WAL
+        pragmas.insert(0, f"PRAGMA journal_mode = {config.SQLITE_JOURNAL_MODE}")
+    return pragmas
+
+
+def build_engine(url: str = SQLALCHEMY_DATABASE_URL, config: Optional[Settings] = None):
+    """
+    按配置档创建数据库引擎：
+    - SQLite：连接建立时执行 WAL、synchronous、mmap、cache、busy_timeout 等 PRAGMA
+    - 其他数据库：配置连接池大小、溢出、超时、回收时间和 pre-ping
+    """
+    config = config or settings
+    echo = config.DB_ECHO if config.DB_ECHO is not None else config.DB_PROFILE == "development"
+    db_url = make_url(url)
+
+    if db_url.get_backend_name() != "sqlite":
+        return create_engine(
+            url,
+            echo=echo,
+            poolclass=QueuePool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+        )
+
+    new_engine = create_engine(
+        url,
+        echo=echo,
+        connect_args={"check_same_thread": False}  # SQLite特有配置
+    )
+    pragmas = _sqlite_pragmas(config, _is_memory_sqlite(db_url))
+
+    @event.listens_for(new_engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    return new_engine
+
+
 # 创建数据库引擎
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    echo=True,
-    connect_args={"check_same_thread": False}  # SQLite特有配置
-)
+engine = build_engine()
 
 # 创建同步会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -38,6 +125,110 @@ def get_db_session():
     finally:
         db.close()
 
+
+def _reject_writes(session, flush_context, instances):
+    raise RuntimeError("只读副本会话不能写入数据")
+
+
+class ReadReplica:
+    """
+    只读副本路由
+    副本可连接且复制延迟不超过 REPLICA_MAX_LAG_SECONDS 时返回副本会话，否则返回主库会话。
+    延迟按 change_log 估算：取副本上最大的变更序号，主库上比它新的最早一条变更距今的时间即为延迟；
+    因此不依赖 MySQL 的复制状态权限，两个独立的 SQLite 文件也能测试。
+    """
+
+    def __init__(self, replica_engine, primary_engine, max_lag_seconds: float, check_interval: float):
+        self.engine = replica_engine
+        self.primary_engine = primary_engine
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.primary_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=primary_engine)
+        self.session_factory = None
+        if replica_engine is not None:
+            self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+            event.listen(self.session_factory, "before_flush", _reject_writes)
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.reads = {"replica": 0, "primary": 0}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # 读计数单独加锁：健康检查持有 _lock 期间可能在等待连接超时，不能阻塞计数
+        self._reads_lock = threading.Lock()
+
+    def available(self) -> bool:
+        """副本当前是否可用；检查结果缓存 check_interval 秒"""
+        if self.engine is None:
+            return False
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._check()
+                    self._checked_at = time.monotonic()
+        return self.healthy
+
+    def _check(self):
+        from models import ChangeLog
+        try:
+            with self.engine.connect() as conn:
+                replica_version = conn.execute(select(func.max(ChangeLog.id))).scalar() or 0
+            with self.primary_engine.connect() as conn:
+                oldest_missing = conn.execute(
+                    select(func.min(ChangeLog.changed_at)).where(ChangeLog.id > replica_version)
+                ).scalar()
+        except Exception as e:
+            if self.healthy or self.last_error is None:
+                logger.warning(f"只读副本不可用，读请求回退主库: {e}")
+            self.healthy = False
+            self.lag_seconds = None
+            self.last_error = str(e)
+            return
+
+        self.lag_seconds = 0.0 if oldest_missing is None else max(
+            0.0, (datetime.utcnow() - oldest_missing).total_seconds()
+        )
+        healthy = self.lag_seconds <= self.max_lag_seconds
+        if healthy != self.healthy:
+            logger.info(f"只读副本{'恢复使用' if healthy else '延迟过大，读请求回退主库'}，延迟 {self.lag_seconds:.1f} 秒")
+        self.healthy = healthy
+        self.last_error = None
+
+    def count_read(self, target: str):
+        """记录一次读请求落在 replica 还是 primary（多个线程并发调用）"""
+        with self._reads_lock:
+            self.reads[target] += 1
+
+    def session(self):
+        """返回副本会话；副本不可用时返回主库会话"""
+        if self.available():
+            self.count_read("replica")
+            return self.session_factory()
+        self.count_read("primary")
+        return self.primary_session_factory()
+
+    def stats(self) -> dict:
+        with self._reads_lock:
+            reads = dict(self.reads)
+        return {
+            "configured": self.engine is not None,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "last_error": self.last_error,
+            "reads": reads,
+        }
+
+
+# 只读副本（未配置 DATABASE_REPLICA_URL 时所有读请求走主库）
+read_replica = ReadReplica(
+    build_engine(settings.DATABASE_REPLICA_URL) if settings.DATABASE_REPLICA_URL else None,
+    engine,
+    max_lag_seconds=settings.REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.REPLICA_CHECK_INTERVAL_SECONDS,
+)
+
+
 # 创建一个基类，我们的数据库模型将继承自它
 Base = declarative_base()
 
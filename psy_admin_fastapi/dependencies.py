@@ -7,12 +7,26 @@ from jose import JWTError, jwt
 from pydantic import BaseModel
 
 import crud, models
-from database import get_db_session # 导入数据库会话
+from database import get_db_session, read_replica # 导入数据库会话
 from config import settings # 导入你的配置
 
 # OAuth2PasswordBearer 用于处理 OAuth2 的密码流认证
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token") # 与实际登录路由保持一致
 
+# 只读接口的数据库依赖注入：副本可用时使用副本会话，否则沿用主库会话。
+# 依赖 get_db_session 是为了让覆盖 get_db_session 的测试同样作用于只读接口；会话在首次查询前不占用连接
+def get_read_db_session(primary_db: Session = Depends(get_db_session)):
+    if not read_replica.available():
+        read_replica.count_read("primary")
+        yield primary_db
+        return
+    read_replica.count_read("replica")
+    db = read_replica.session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
 class TokenData(BaseModel):
     username: str | None = None
 
@@ -1,5 +1,6 @@
 from datetime import timedelta, datetime, timezone
 import logging
+import time
 from typing import Optional, List
 from concurrent.futures import ThreadPoolExecutor
 
@@ -8,18 +9,30 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
-import pandas as pd
 from typing import List
 import crud, models, schemas
-from database import engine, get_db_session, Base  # 导入数据库相关
+from database import engine, get_db_session, Base, SessionLocal, read_replica  # 导入数据库相关
 from config import settings  # 导入你的配置
-from dependencies import get_current_admin_user, oauth2_scheme  # 导入认证依赖和OAuth2 scheme
+from dependencies import get_current_admin_user, get_read_db_session, oauth2_scheme  # 导入认证依赖和OAuth2 scheme
 # 延迟导入报告服务，避免循环导入
 # from services.report_service import generate_report_content, generate_pdf_report, generate_excel_report
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import os
-from utils.concurrent import thread_pool, thread_safe_db
+from urllib.parse import quote
+from utils.concurrent import thread_pool, validate_pool_sizes, db_pool_stats, WorkerPoolClosedError
 from utils.schema_migrations import ensure_core_schema
+from utils.export_writers import iter_csv, iter_ndjson, ColumnarExportUnavailable
+from utils import signal_store
+from utils.file_responses import range_file_response
+from utils.report_files import atomic_report_path, remove_partial_reports
+from services.import_service import import_students, ImportConflictError
+from services.import_jobs import import_job_manager, import_job_to_dict, import_chunk_to_dict
+from utils.roster_index import roster_index
+from services.feature_pipeline import feature_pipeline
+from services.job_queue import job_queue, job_to_dict, JobQueueFullError, JOB_STATUSES
+import services.report_jobs  # 注册报告生成任务
+from utils.db_monitor import query_monitor, query_budget, QueryCounterMiddleware
+from services.export_jobs import export_job_manager, EXPORT_MEDIA_TYPES, COLUMNAR_FORMATS, media_type_for
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -27,9 +40,75 @@ logger = logging.getLogger(__name__)
 
 # 定义 lifespan 事件处理器
 from contextlib import asynccontextmanager
+import asyncio
+
+async def _export_sweeper_loop():
+    """定期按保留策略清理导出目录"""
+    while True:
+        try:
+            await asyncio.to_thread(export_job_manager.sweep)
+        except Exception as e:
+            logger.error(f"导出目录清理失败: {e}")
+        await asyncio.sleep(settings.EXPORT_SWEEP_INTERVAL_SECONDS)
+
+def _load_roster_index():
+    db = SessionLocal()
+    try:
+        roster_index.load(db)
+    finally:
+        db.close()
+
+async def _roster_reload_loop():
+    """定期全量重载学生名单索引，同步其他工作进程的写入"""
+    while True:
+        await asyncio.sleep(settings.ROSTER_RELOAD_SECONDS)
+        try:
+            await asyncio.to_thread(_load_roster_index)
+        except Exception as e:
+            logger.error(f"重载学生名单索引失败: {e}")
+
+def _flush_log_handlers():
+    """刷新所有日志处理器（含不向上传播的慢查询日志），关闭前写完缓冲中的日志"""
+    loggers = [logging.getLogger()] + [item for item in logging.root.manager.loggerDict.values()
+                                       if isinstance(item, logging.Logger)]
+    for handler in {handler for item in loggers for handler in item.handlers}:
+        try:
+            handler.flush()
+        except Exception:
+            pass
+
+def _drain_background_work(timeout: float):
+    """
+    关闭时按截止时间收尾后台工作：各线程池先停止接受新任务，再在剩余时间内等待执行中的任务。
+    队列任务已持久化，超时未完成的释放回队列；导入任务停在数据块边界，下次启动从检查点继续。
+    """
+    deadline = time.monotonic() + timeout
+
+    def remaining():
+        return max(deadline - time.monotonic(), 0)
+
+    steps = [
+        ("后台任务队列", lambda: job_queue.stop(timeout=remaining())),
+        ("导入任务", lambda: import_job_manager.shutdown(timeout=remaining())),
+        ("通用线程池", lambda: thread_pool.close(timeout=remaining())),
+    ]
+    for name, step in steps:
+        try:
+            unfinished = step()
+            if unfinished:
+                logger.warning(f"{name}关闭时仍有 {unfinished} 个任务未完成")
+        except Exception as e:
+            logger.error(f"关闭{name}失败: {e}", exc_info=True)
+    feature_pipeline.shutdown()
+    # 本进程中断的报告写入只留下临时文件，一并删除
+    removed = remove_partial_reports(settings.REPORT_DIR, pid=os.getpid())
+    if removed:
+        logger.info(f"已删除 {removed} 个未写完的报告临时文件")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # 为每条 SQL 计时，超过 SLOW_QUERY_MS 的写入慢查询日志
+    query_monitor.install(engine)
     # 启动时创建数据库表
     Base.metadata.create_all(bind=engine)
     logger.info("数据库表已检查/创建。")
@@ -39,9 +118,48 @@ async def lifespan(app: FastAPI):
         logger.info("启动迁移检查完成。")
     except Exception as e:
         logger.error(f"启动迁移检查失败: {e}")
+    # 继续上次进程退出时未完成的导入任务
+    try:
+        resumed = import_job_manager.resume_pending()
+        if resumed:
+            logger.info(f"已恢复 {resumed} 个未完成的导入任务")
+    except Exception as e:
+        logger.error(f"恢复导入任务失败: {e}")
+    # 加载学生名单索引，客户端学号验证不再逐次查询数据库
+    try:
+        await asyncio.to_thread(_load_roster_index)
+    except Exception as e:
+        logger.error(f"加载学生名单索引失败: {e}")
+    # 后台线程池和进程池大小超出数据库连接池容量或 CPU 核数时记录警告
+    for warning in validate_pool_sizes():
+        logger.warning(warning)
+    # 删除上次进程被强制结束时残留的报告临时文件（跳过其他工作进程可能正在写入的文件）
+    try:
+        remove_partial_reports(settings.REPORT_DIR, min_age_seconds=3600)
+    except Exception as e:
+        logger.error(f"清理报告临时文件失败: {e}")
+    # 启动后台任务队列，继续执行上次进程退出时排队中的任务
+    job_queue.start()
+    # 尚未提取特征的信号（如登记任务时队列已满）在后台补算
+    try:
+        await asyncio.to_thread(job_queue.enqueue, "signal_features")
+    except JobQueueFullError as e:
+        logger.warning(f"登记信号特征提取任务失败: {e}")
+    sweeper_task = asyncio.create_task(_export_sweeper_loop())
+    roster_task = asyncio.create_task(_roster_reload_loop()) if settings.ROSTER_RELOAD_SECONDS > 0 else None
     yield
-    # 关闭时可以执行清理操作（如果有需要）
+    # 关闭：uvicorn 已停止接收请求并等待进行中的请求结束，这里在截止时间内收尾后台工作
     logger.info("应用正在关闭...")
+    background_tasks = [task for task in (sweeper_task, roster_task) if task]
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await asyncio.to_thread(_drain_background_work, settings.SHUTDOWN_DRAIN_SECONDS)
+    logger.info("后台工作已收尾，释放数据库连接池")
+    engine.dispose()
+    if read_replica.engine is not None:
+        read_replica.engine.dispose()
+    _flush_log_handlers()
 
 # 创建 FastAPI 应用实例，并传入 lifespan 事件处理器
 app = FastAPI(
@@ -56,10 +174,14 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.allowed_origins_list,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["Content-Disposition", "X-Next-Since", "X-Has-More", "Server-Timing"],
 )
 
+# 统计每个请求的 SQL 条数、读取行数和数据库耗时，写入 Server-Timing 响应头
+app.add_middleware(QueryCounterMiddleware)
+
 # 认证接口：用于获取JWT令牌
 @app.post("/token", response_model=schemas.Token, summary="获取JWT令牌")
 async def login_for_access_token(
@@ -152,12 +274,14 @@ async def upload_test_data(
     db: Session = Depends(get_db_session),
 ):
     try:
-        # 使用线程池处理数据上传，提高并发性能
-        future = thread_pool.submit(_process_upload_data, test_data)
-        db_test_record = future.result(timeout=30)  # 设置30秒超时
+        # 在后台线程池中以独立的会话作用域写入，等待期间不阻塞事件循环
+        future = thread_pool.submit_with_session(_process_upload_data, test_data)
+        db_test_record = await asyncio.wait_for(asyncio.wrap_future(future), timeout=30)  # 设置30秒超时
         
         logger.info(f"成功接收并存储学生 {test_data.student_id} 的检测数据。")
         return db_test_record
+    except WorkerPoolClosedError:
+        raise HTTPException(status_code=503, detail="服务正在重启，请稍后重试", headers={"Retry-After": "5"})
     except Exception as e:
         logger.error(f"处理心理检测数据上传失败: {e}", exc_info=True)
         raise HTTPException(
@@ -165,15 +289,12 @@ async def upload_test_data(
             detail=f"数据上传失败: {e}"
         )
 
-@thread_safe_db
-def _process_upload_data(test_data: schemas.TestDataUpload, db: Session):
-    """处理数据上传的线程安全函数"""
+def _process_upload_data(db: Session, test_data: schemas.TestDataUpload):
+    """处理数据上传的线程池任务：正常返回后提交，异常时回滚"""
     try:
         db_test_record = crud.create_test_data(db, test_data)
         db.refresh(db_test_record)  # 确保最新状态
-        db_test_record.student  # 访问以加载
-        db_test_record.scores  # 访问以加载
-        db_test_record.physiological_data  # 访问以加载
+        db_test_record.student  # 访问以加载（得分和生理数据在检测记录的紧凑列中，无需加载）
         return db_test_record
     except Exception as e:
         logger.error(f"线程池处理数据上传失败: {e}")
@@ -181,6 +302,7 @@ def _process_upload_data(test_data: schemas.TestDataUpload, db: Session):
 
 # 获取所有心理检测记录列表
 @app.get("/test-data/records/", response_model=List[schemas.TestRecordDetail], summary="获取所有心理检测记录列表")
+@query_budget(3)
 async def get_test_data_records(
     user_id: Optional[str] = None,
     user_name: Optional[str] = None,
@@ -192,7 +314,7 @@ async def get_test_data_records(
     status: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db_session),
+    db: Session = Depends(get_read_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)  # 需要认证
 ):
     records = crud.get_test_records(
@@ -202,15 +324,53 @@ async def get_test_data_records(
 
 # 获取单个心理检测记录详情
 @app.get("/test-data/records/{record_id}", response_model=schemas.TestRecordDetail, summary="获取单个心理检测记录详情")
+@query_budget(3)
 async def get_test_data_record_detail(
     record_id: int,
-    db: Session = Depends(get_db_session),
+    db: Session = Depends(get_read_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)  # 需要认证
 ):
     record = crud.get_test_record_detail(db, record_id)
     if not record:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="检测记录未找到")
     return record
+
+
+@app.get("/api/test-records/{record_id}/signals", response_model=List[schemas.PhysiologicalSignal],
+         summary="获取检测记录的生理信号通道")
+async def list_physiological_signals(
+    record_id: int,
+    db: Session = Depends(get_read_db_session),
+    current_user: models.AdminUser = Depends(get_current_admin_user),
+):
+    return crud.get_physiological_signals(db, record_id)
+
+@app.get("/api/test-records/{record_id}/signals/{channel}", response_model=schemas.SignalSeries,
+         summary="按时间区间获取降采样的生理信号")
+async def get_physiological_signal_series(
+    record_id: int,
+    channel: str,
+    start: float = 0,
+    end: Optional[float] = None,
+    points: int = 1000,
+    db: Session = Depends(get_read_db_session),
+    current_user: models.AdminUser = Depends(get_current_admin_user),
+):
+    """返回 [start, end) 秒区间内的信号，按桶取最小值/最大值，最多 points 个点"""
+    if start < 0 or (end is not None and end <= start):
+        raise HTTPException(status_code=400, detail="时间区间无效")
+    if not 1 <= points <= settings.SIGNAL_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"points 必须在 1 到 {settings.SIGNAL_MAX_POINTS} 之间")
+    signal = crud.get_physiological_signal(db, record_id, channel)
+    if not signal:
+        raise HTTPException(status_code=404, detail="信号数据不存在")
+    try:
+        series = await asyncio.to_thread(signal_store.load_series, signal.file_path, signal.sample_rate,
+                                         signal.sample_count, start, end, points)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="信号文件不存在")
+    return {"channel": signal.channel, "sample_rate": signal.sample_rate, **series}
+
 @app.delete("/test-data/records/{record_id}", summary="删除检测记录")
 async def delete_test_record(
     record_id: int,
@@ -226,96 +386,90 @@ async def delete_test_record(
 @app.post("/api/students/batch-import")
 async def batch_import_students(
     file: UploadFile = File(...),
+    on_conflict: str = Form("skip"),
     db: Session = Depends(get_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)
 ):
-    # 1. 读取Excel文件
+    """
+    批量导入学生，支持 xlsx 和 csv。
+    文件按块流式读取并向量化校验，有效数据分块批量插入；返回的重复/错误明细与逐行导入一致。
+    on_conflict 决定学号已存在时的处理：skip（记为重复，默认）、update（覆盖姓名/班级/性别）、
+    error（整批回滚并返回 409 及冲突行）。
+    """
     try:
-        content = await file.read()
-        from io import BytesIO
-        df = pd.read_excel(BytesIO(content), engine="openpyxl")
+        return await asyncio.to_thread(import_students, db, file.file, file.filename, on_conflict=on_conflict)
+    except ImportConflictError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "conflicts": e.conflicts})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Excel读取失败: {str(e)}")
-
-    # 2. 验证列完整性
-    required_cols = ["name", "student_id", "class_name", "gender"]
-    missing_cols = set(required_cols) - set(df.columns)
-    if missing_cols:
-        raise HTTPException(status_code=400, detail=f"缺少必要列: {', '.join(missing_cols)}")
-
-    # 3. 数据验证与去重
-    valid_students = []
-    duplicate_students = []
-    error_rows = []
-    
-    # 批量查询现有学号
-    existing_student_ids = set(crud.get_all_student_ids(db))
-    
-    for index, row in df.iterrows():
-        try:
-            # 数据验证
-            if pd.isna(row["name"]) or pd.isna(row["student_id"]) or pd.isna(row["class_name"]) or pd.isna(row["gender"]):
-                error_rows.append({
-                    "row": index + 2,  # Excel行号（从2开始，因为第1行是标题）
-                    "error": "必填字段不能为空"
-                })
-                continue
-            
-            student_id = str(row["student_id"]).strip()
-            
-            # 检查是否已存在
-            if student_id in existing_student_ids:
-                duplicate_students.append({
-                    "row": index + 2,
-                    "student_id": student_id,
-                    "name": row["name"]
-                })
-                continue
-            
-            # 添加到有效列表
-            valid_students.append(schemas.ExcelImportSchema(
-                name=str(row["name"]).strip(),
-                student_id=student_id,
-                class_name=str(row["class_name"]).strip(),
-                gender=str(row["gender"]).strip()
-            ))
-            existing_student_ids.add(student_id)  # 避免同一批次内重复
-            
-        except Exception as e:
-            error_rows.append({
-                "row": index + 2,
-                "error": f"数据格式错误: {str(e)}"
-            })
-
-    # 4. 批量插入有效数据
-    success_count = 0
-    # test_record_count = 0  # 已移除：不再自动创建检测记录
-    if valid_students:
-        try:
-            # 批量创建学生
-            db_students = crud.batch_create_students(db, valid_students)
-            success_count = len(valid_students)
-            
-            # 不再自动为每个新创建的学生创建待处理的检测记录
-            # 检测记录应该在实际进行检测并上传数据时才创建
-            # 之前的自动创建逻辑已完全移除
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"批量插入失败: {str(e)}")
+        logger.error(f"批量导入学生失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"批量插入失败: {str(e)}")
+
+# === 后台导入任务接口 ===
+
+@app.post("/api/import/jobs", response_model=schemas.ImportJobStatus, status_code=202, summary="创建后台学生导入任务")
+async def create_import_job(
+    file: UploadFile = File(...),
+    on_conflict: str = Form("skip"),
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """
+    上传文件保存到磁盘后立即返回任务ID，导入在后台按块提交。
+    每块提交后更新检查点，任务中断后从检查点继续；on_conflict=error 时遇到已存在的学号即停止，
+    之前已提交的块保留。
+    """
+    try:
+        job = await asyncio.to_thread(import_job_manager.create, file.file, file.filename, on_conflict)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return import_job_to_dict(job)
 
-    # 5. 返回详细结果
-    return {
-        "success_count": success_count,
-        # "test_record_count": test_record_count,  # 已移除：不再返回检测记录数量
-        "duplicate_count": len(duplicate_students),
-        "error_count": len(error_rows),
-        "duplicate_students": duplicate_students,
-        "error_rows": error_rows,
-        "detail": f"导入完成：成功 {success_count} 条学生，重复 {len(duplicate_students)} 条，错误 {len(error_rows)} 条"
-    }
+
+@app.get("/api/import/jobs/{job_id}", response_model=schemas.ImportJobStatus, summary="查询后台导入任务进度")
+async def get_import_job(
+    job_id: str,
+    db: Session = Depends(get_db_session),
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    job = db.get(models.ImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导入任务不存在")
+    return import_job_to_dict(job)
+
+
+@app.get("/api/import/jobs/{job_id}/chunks", response_model=List[schemas.ImportJobChunkResult],
+         summary="查询后台导入任务的分块结果")
+async def get_import_job_chunks(
+    job_id: str,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db_session),
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    if not db.get(models.ImportJob, job_id):
+        raise HTTPException(status_code=404, detail="导入任务不存在")
+    chunks = db.query(models.ImportJobChunk).filter(models.ImportJobChunk.job_id == job_id) \
+        .order_by(models.ImportJobChunk.chunk_no).offset(skip).limit(limit).all()
+    return [import_chunk_to_dict(chunk) for chunk in chunks]
+
+
+@app.post("/api/import/jobs/{job_id}/retry", response_model=schemas.ImportJobStatus, summary="从检查点重试失败的导入任务")
+async def retry_import_job(
+    job_id: str,
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    try:
+        job = await asyncio.to_thread(import_job_manager.retry, job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not job:
+        raise HTTPException(status_code=404, detail="导入任务不存在")
+    return import_job_to_dict(job)
 
 # 获取学生列表（支持筛选、排序、分页）
 @app.get("/api/students", response_model=List[schemas.Student])
+@query_budget(2)
 async def get_students(
     skip: int = 0,
     limit: int = 10000,  # 增加默认limit，支持获取更多数据
@@ -323,7 +477,7 @@ async def get_students(
     gender: Optional[str] = None,
     sort_by: str = "name",
     sort_order: str = "asc",
-    db: Session = Depends(get_db_session),
+    db: Session = Depends(get_read_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)
 ):
     # 限制最大limit，防止查询过大数据集
@@ -367,6 +521,7 @@ async def create_student(
 
 # 获取单个学生
 @app.get("/api/students/{student_id}", response_model=schemas.Student)
+@query_budget(2)
 async def get_student(
     student_id: str,
     db: Session = Depends(get_db_session),
@@ -390,6 +545,25 @@ async def update_student(
         raise HTTPException(status_code=404, detail="学生未找到")
     return updated_student
 
+# 批量修改学生信息
+@app.patch("/api/students", summary="批量修改学生信息")
+async def bulk_update_students(
+    request: schemas.StudentBulkPatch,
+    db: Session = Depends(get_db_session),
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """在一个事务中应用多条学生修改；任一学号不存在时全部不生效"""
+    if not request.updates:
+        raise HTTPException(status_code=400, detail="请提供要修改的学生列表")
+    try:
+        updated_count = crud.bulk_update_students(db, request.updates)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"批量修改学生失败: {e}")
+        raise HTTPException(status_code=500, detail=f"批量修改学生失败: {str(e)}")
+    return {"updated_count": updated_count}
+
 @app.delete("/api/students/batch")
 async def batch_delete_students(
     request: schemas.BatchDeleteStudentsRequest,
@@ -457,7 +631,8 @@ async def get_student_info(
 
 # 报告相关API
 @app.get("/api/reports/{student_id}")
-async def get_report(student_id: str, db: Session = Depends(get_db_session)):
+@query_budget(3)
+async def get_report(student_id: str, db: Session = Depends(get_read_db_session)):
     try:
         from services.report_service import generate_report_content
         logger.info(f"开始生成报告，学号: {student_id}")
@@ -480,7 +655,7 @@ async def get_report(student_id: str, db: Session = Depends(get_db_session)):
 async def download_report(
     student_id: str,
     format: str = "pdf",
-    db: Session = Depends(get_db_session)
+    db: Session = Depends(get_read_db_session)
 ):
     try:
         from services.report_service import generate_report_content, generate_pdf_report, generate_excel_report
@@ -516,8 +691,9 @@ async def download_report(
 
 # 仪表板API接口（优化版，使用聚合查询和缓存）
 @app.get("/api/dashboard/stats", summary="获取仪表板统计数据")
+@query_budget(5)
 async def get_dashboard_stats(
-    db: Session = Depends(get_db_session),
+    db: Session = Depends(get_read_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)
 ):
     """获取仪表板所需的统计数据"""
@@ -544,7 +720,7 @@ async def get_dashboard_stats(
 @app.get("/api/dashboard/trend", summary="获取检测趋势数据")
 async def get_trend_data(
     days: int = 7,
-    db: Session = Depends(get_db_session),
+    db: Session = Depends(get_read_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)
 ):
     """获取指定天数内的检测趋势数据"""
@@ -587,58 +763,19 @@ async def get_trend_data(
 
 @app.get("/api/dashboard/score-stats", summary="获取问卷得分统计")
 async def get_score_stats(
-    limit: int = 100,
-    db: Session = Depends(get_db_session),
+    db: Session = Depends(get_read_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)
 ):
-    """获取问卷得分统计数据"""
+    """各问卷模块最新检测记录的得分分布，与仪表板导出使用同一组模块和数据库聚合"""
     try:
-        records = crud.get_test_records(db, skip=0, limit=limit)
-        
-        score_stats = {
-            "焦虑": [],
-            "抑郁": [],
-            "压力": []
-        }
-        
-        for record in records:
-            for score in record.scores:
-                if score.module_name in score_stats:
-                    score_stats[score.module_name].append(score.score)
-        
-        # 计算每个分数段的分布
-        score_distribution = {}
-        for module_name, scores in score_stats.items():
-            distribution = {
-                "0-10": 0,
-                "11-15": 0,
-                "16-20": 0,
-                "21-25": 0,
-                "26-30": 0
-            }
-            
-            for score in scores:
-                if score <= 10:
-                    distribution["0-10"] += 1
-                elif score <= 15:
-                    distribution["11-15"] += 1
-                elif score <= 20:
-                    distribution["16-20"] += 1
-                elif score <= 25:
-                    distribution["21-25"] += 1
-                else:
-                    distribution["26-30"] += 1
-            
-            score_distribution[module_name] = distribution
-        
-        return score_distribution
+        return crud.get_score_distribution(db)
     except Exception as e:
         logger.error(f"获取得分统计失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取得分统计失败: {str(e)}")
 
 @app.get("/api/dashboard/class-distribution", summary="获取班级分布数据")
 async def get_class_distribution(
-    db: Session = Depends(get_db_session),
+    db: Session = Depends(get_read_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)
 ):
     """获取班级学生分布数据"""
@@ -657,25 +794,64 @@ async def get_class_distribution(
 
 # === 数据导出接口 ===
 
+EXPORT_FORMATS = ("xlsx", "csv", "ndjson")
+
+
+def _check_export_format(format: str, allowed=EXPORT_FORMATS):
+    if format not in allowed:
+        raise HTTPException(status_code=400, detail=f"format 参数必须是 {', '.join(allowed)} 之一")
+
+
+def _streaming_export(build_rows, format: str, filename_prefix: str,
+                      extra_headers: Optional[dict] = None) -> StreamingResponse:
+    """
+    以 CSV/NDJSON 流式返回导出数据，不落盘。
+    生成器内部自行创建会话（副本可用时走只读副本）：响应体发送期间请求级的会话可能已经被关闭。
+    build_rows(db) 返回 (表头, 数据行迭代器)。
+    """
+    def generate():
+        db = read_replica.session()
+        try:
+            headers, rows = build_rows(db)
+            encoder = iter_csv if format == "csv" else iter_ndjson
+            yield from encoder(headers, rows)
+        except Exception as e:
+            # 响应头已经发出，只能记录日志并中断输出
+            logger.error(f"流式导出 {filename_prefix} 失败: {e}", exc_info=True)
+            raise
+        finally:
+            db.close()
+
+    filename = f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    headers = {"Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}"}
+    headers.update(extra_headers or {})
+    return StreamingResponse(generate(), media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
+
 @app.get("/api/export/students", summary="导出学生数据")
 async def export_students(
     skip: int = 0,
     limit: int = 10000,
-    db: Session = Depends(get_db_session),
+    format: str = "xlsx",
+    db: Session = Depends(get_read_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)
 ):
-    """导出学生数据到Excel文件"""
+    """导出学生数据，format 支持 xlsx（文件下载）以及 csv/ndjson（流式返回）"""
+    _check_export_format(format)
+    if format != "xlsx":
+        return _streaming_export(
+            lambda session: crud.get_export_rows(session, "students", skip=skip, limit=limit),
+            format, "学生数据"
+        )
+
     try:
-        filepath = crud.export_students_to_excel(db, skip=skip, limit=limit)
+        filepath = await asyncio.to_thread(crud.export_students_to_excel, db, skip=skip, limit=limit)
         
         # 返回文件下载
-        import aiofiles
-        from fastapi.responses import FileResponse
-        
         filename = os.path.basename(filepath)
         return FileResponse(
             filepath,
-            media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            media_type=EXPORT_MEDIA_TYPES["xlsx"],
             filename=filename
         )
     except Exception as e:
@@ -690,12 +866,47 @@ async def export_test_records(
     end_time: Optional[datetime] = None,
     is_abnormal: Optional[bool] = None,
     status: Optional[str] = None,
-    db: Session = Depends(get_db_session),
+    format: str = "xlsx",
+    partition_by: Optional[str] = None,
+    db: Session = Depends(get_read_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)
 ):
-    """导出检测记录数据到Excel文件"""
+    """
+    导出检测记录数据，format 支持 xlsx（文件下载）、csv/ndjson（流式返回）
+    以及 parquet/arrow（带类型的宽表，partition_by=year|month|day 时按检测时间分区打包为 zip）
+    """
+    _check_export_format(format, EXPORT_FORMATS + COLUMNAR_FORMATS)
+    if partition_by and (format not in COLUMNAR_FORMATS or partition_by not in crud.PARTITION_FORMATS):
+        raise HTTPException(status_code=400, detail=f"partition_by 仅用于 parquet/arrow 导出，取值为 {', '.join(crud.PARTITION_FORMATS)}")
+
+    if format in COLUMNAR_FORMATS:
+        try:
+            filepath = await asyncio.to_thread(
+                crud.export_test_records_to_columnar,
+                db, format=format, partition_by=partition_by,
+                user_id=user_id, start_time=start_time, end_time=end_time,
+                is_abnormal=is_abnormal, status=status
+            )
+        except ColumnarExportUnavailable as e:
+            raise HTTPException(status_code=501, detail=str(e))
+        except Exception as e:
+            logger.error(f"导出检测记录数据失败: {e}")
+            raise HTTPException(status_code=500, detail=f"导出检测记录数据失败: {str(e)}")
+        return FileResponse(filepath, media_type=media_type_for(filepath), filename=os.path.basename(filepath))
+
+    if format != "xlsx":
+        return _streaming_export(
+            lambda session: crud.get_export_rows(
+                session, "test-records",
+                user_id=user_id, start_time=start_time, end_time=end_time,
+                is_abnormal=is_abnormal, status=status
+            ),
+            format, "检测记录数据"
+        )
+
     try:
-        filepath = crud.export_test_records_to_excel(
+        filepath = await asyncio.to_thread(
+            crud.export_test_records_to_excel,
             db, 
             user_id=user_id, 
             start_time=start_time, 
@@ -705,13 +916,10 @@ async def export_test_records(
         )
         
         # 返回文件下载
-        import aiofiles
-        from fastapi.responses import FileResponse
-        
         filename = os.path.basename(filepath)
         return FileResponse(
             filepath,
-            media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            media_type=EXPORT_MEDIA_TYPES["xlsx"],
             filename=filename
         )
     except Exception as e:
@@ -719,29 +927,116 @@ async def export_test_records(
         raise HTTPException(status_code=500, detail=f"导出检测记录数据失败: {str(e)}")
 
 
+@app.get("/api/export/test-records/changes", summary="增量导出检测记录变更")
+async def export_test_record_changes(
+    since: int = 0,
+    since_time: Optional[datetime] = None,
+    limit: int = 10000,
+    format: str = "ndjson",
+    db: Session = Depends(get_read_db_session),
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """
+    只导出水位线之后新增、修改或删除的检测记录，删除的记录以墓碑行（变更类型 delete）输出，
+    被新检测记录取代、转为历史记录的以变更类型 demote 输出（只有记录ID）。
+    since 为上次响应头 X-Next-Since 返回的变更序号；也可以用 since_time 按时间指定起点。
+    X-Has-More 为 true 时应以新的水位线继续请求。format 支持 csv/ndjson。
+    最近 CHANGE_EXPORT_SETTLE_SECONDS 秒内的变更留到下次导出，等待并发事务提交，避免水位线越过未提交的变更。
+    """
+    _check_export_format(format, ("csv", "ndjson"))
+    if limit <= 0 or limit > 100000:
+        raise HTTPException(status_code=400, detail="limit 必须在 1 到 100000 之间")
+    if since_time is not None:
+        since = crud.get_change_watermark_for_time(db, since_time)
+
+    # 先确定本次窗口的上界作为下一个水位线写入响应头，数据行在流式输出时再按批查询
+    next_since, has_more = crud.get_test_record_change_window(db, since=since, limit=limit)
+    return _streaming_export(
+        lambda session: crud.get_test_record_changes(session, since=since, until=next_since),
+        format, "检测记录变更",
+        extra_headers={"X-Next-Since": str(next_since), "X-Has-More": "true" if has_more else "false"},
+    )
+
+
 @app.get("/api/export/dashboard-stats", summary="导出仪表板统计数据")
 async def export_dashboard_stats(
-    db: Session = Depends(get_db_session),
+    format: str = "xlsx",
+    db: Session = Depends(get_read_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)
 ):
-    """导出仪表板统计数据到Excel文件"""
+    """导出仪表板统计数据，format 支持 xlsx（多工作表文件）以及 csv/ndjson（展开为四列流式返回）"""
+    _check_export_format(format)
+    if format != "xlsx":
+        return _streaming_export(
+            lambda session: crud.get_export_rows(session, "dashboard-stats"),
+            format, "仪表板统计数据"
+        )
+
     try:
-        filepath = crud.export_dashboard_stats_to_excel(db)
+        filepath = await asyncio.to_thread(crud.export_dashboard_stats_to_excel, db)
         
         # 返回文件下载
-        import aiofiles
-        from fastapi.responses import FileResponse
-        
         filename = os.path.basename(filepath)
         return FileResponse(
             filepath,
-            media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            media_type=EXPORT_MEDIA_TYPES["xlsx"],
             filename=filename
         )
     except Exception as e:
         logger.error(f"导出仪表板统计数据失败: {e}")
         raise HTTPException(status_code=500, detail=f"导出仪表板统计数据失败: {str(e)}")
 
+# === 后台导出任务接口 ===
+
+@app.post("/api/export/jobs", response_model=schemas.ExportJobStatus, status_code=202, summary="创建后台导出任务")
+async def create_export_job(
+    request: schemas.ExportJobCreate,
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """提交后台导出任务，立即返回任务ID，避免大数据量导出被代理超时中断"""
+    params = request.dict(exclude={"kind", "format"})
+    try:
+        job = export_job_manager.submit(request.kind, request.format, **params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict()
+
+
+@app.get("/api/export/jobs/{job_id}", response_model=schemas.ExportJobStatus, summary="查询后台导出任务进度")
+async def get_export_job(
+    job_id: str,
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    job = export_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    return job.to_dict()
+
+
+@app.get("/api/export/jobs/{job_id}/download", summary="下载后台导出任务文件（支持断点续传）")
+async def download_export_job(
+    job_id: str,
+    request: Request,
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    job = export_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    if job.status in ("queued", "running"):
+        raise HTTPException(status_code=409, detail="导出任务尚未完成")
+    if job.status == "failed":
+        raise HTTPException(status_code=409, detail=f"导出任务失败: {job.error}")
+    if job.status == "expired" or not job.file_path or not os.path.exists(job.file_path):
+        raise HTTPException(status_code=410, detail="导出文件已过期被清理，请重新创建导出任务")
+
+    return range_file_response(
+        request, job.file_path,
+        filename=os.path.basename(job.file_path),
+        media_type=media_type_for(job.file_path)
+    )
+
 # === 第一阶段：客户端对接接口 ===
 
 @app.get("/api/students/{student_id}", response_model=schemas.Student, summary="获取学生信息")
@@ -756,22 +1051,23 @@ async def get_student_info(
         raise HTTPException(status_code=404, detail="学生未找到")
     return student
 
-@app.post("/api/students/batch-query", summary="批量查询学生信息")
+@app.post("/api/students/batch-query", response_model=schemas.StudentBatchQueryResult,
+          response_model_exclude_unset=True, summary="批量查询学生信息")
+@query_budget(2)
 async def batch_query_students(
     query: schemas.StudentBatchQuery,
     db: Session = Depends(get_db_session),
     current_user: models.AdminUser = Depends(get_current_admin_user)
 ):
-    """批量查询学生信息"""
-    students = []
-    for student_id in query.student_ids:
-        student = crud.get_student(db, student_id)
-        if student:
-            students.append(student)
-    
-    return {"students": students, "total_count": len(students)}
+    """
+    批量查询学生信息，按请求顺序返回，未找到的学号放在 missing_student_ids 中。
+    include_latest_test 为 true 时每个学生附带最新检测记录摘要，无需再逐个查询状态。
+    """
+    students, missing = crud.get_students_by_ids(db, query.student_ids, query.include_latest_test)
+    return {"students": students, "total_count": len(students), "missing_student_ids": missing}
 
 @app.get("/api/test-records/status/{student_id}", summary="获取学生检测记录状态")
+@query_budget(2)
 async def get_student_test_status(
     student_id: str,
     db: Session = Depends(get_db_session),
@@ -787,7 +1083,38 @@ async def get_student_test_status(
         logger.error(f"获取学生检测状态失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取学生检测状态失败: {str(e)}")
 
+@app.get("/api/students/{student_id}/test-history", response_model=List[schemas.TestHistoryItem],
+         summary="获取学生检测历史")
+@query_budget(6)
+async def get_student_test_history(
+    student_id: str,
+    include_archived: bool = True,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    db: Session = Depends(get_db_session),
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """返回学生的全部检测记录（当前 + 历史，默认包含已归档的记录），按检测时间倒序，用于纵向分析"""
+    history = crud.get_student_test_history(db, student_id, include_archived, start_time, end_time)
+    if history is None:
+        raise HTTPException(status_code=404, detail="学生未找到")
+    return history
+
+@app.post("/api/test-records/archive", response_model=schemas.TestArchiveResult, summary="归档历史检测记录")
+async def archive_test_history(
+    before: datetime,
+    db: Session = Depends(get_db_session),
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """把检测时间早于 before 的历史检测记录移入按年份分区的归档表，当前检测记录不受影响"""
+    try:
+        return await asyncio.to_thread(crud.archive_test_history, db, before)
+    except Exception as e:
+        logger.error(f"归档历史检测记录失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"归档历史检测记录失败: {str(e)}")
+
 @app.get("/api/test-records/batch-status", summary="批量获取检测记录状态")
+@query_budget(2)
 async def batch_get_test_status(
     student_ids: Optional[List[str]] = None,
     db: Session = Depends(get_db_session),
@@ -844,46 +1171,32 @@ async def batch_generate_reports(
                 raise HTTPException(status_code=404, detail=f"检测记录 {record_id} 未找到")
             records.append(record)
         
-        # 生成报告文件列表
-        from services.report_service import generate_report_content, generate_pdf_report, generate_excel_report
-        report_files = []
-        for record in records:
-            try:
-                # 生成报告内容
-                content = generate_report_content(db, record.student.student_id)
-                
-                # 获取学生姓名
-                student_name = record.student.name if record.student else "Student"
-                
-                # 根据格式生成对应文件
-                if format == "pdf":
-                    filepath = generate_pdf_report(content, record.student.student_id, student_name)
-                elif format == "excel":
-                    filepath = generate_excel_report(db, record.student.student_id)
-                
-                # 检查文件是否存在
-                if os.path.exists(filepath):
-                    report_files.append({
-                        "record_id": record.id,
-                        "student_id": record.student.student_id,
-                        "file_path": filepath,
-                        "file_name": os.path.basename(filepath)
-                    })
-            except Exception as e:
-                logger.error(f"为记录 {record.id} 生成报告失败: {e}")
-                continue
-        
-        return {
-            "message": f"成功生成 {len(report_files)} 份报告",
-            "report_files": report_files,
-            "failed_count": len(record_ids) - len(report_files)
-        }
+        from services.report_service import generate_batch_reports
+        return generate_batch_reports(db, records, format)
     except HTTPException as e:
         raise e
     except Exception as e:
         logger.error(f"批量生成报告失败: {e}")
         raise HTTPException(status_code=500, detail=f"批量生成报告失败: {str(e)}")
 
+@app.post("/api/test-records/batch-generate-reports/jobs", response_model=schemas.BackgroundJobStatus,
+          status_code=202, summary="创建后台批量报告任务")
+async def create_batch_report_job(
+    request: schemas.BatchGenerateReportsRequest,
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """在后台任务队列 report 通道中批量生成报告，立即返回任务ID；完成后从任务结果中获取文件列表"""
+    if not request.record_ids:
+        raise HTTPException(status_code=400, detail="请提供要生成报告的记录ID列表")
+    if request.format not in ["pdf", "excel"]:
+        raise HTTPException(status_code=400, detail="格式参数必须是 'pdf' 或 'excel'")
+    try:
+        job = await asyncio.to_thread(job_queue.enqueue, "batch_reports",
+                                      {"record_ids": request.record_ids, "format": request.format})
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job_to_dict(job)
+
 @app.delete("/api/test-records/batch", summary="批量删除检测记录")
 async def batch_delete_test_records(
     request: schemas.BatchDeleteTestRecordsRequest,
@@ -905,7 +1218,108 @@ async def batch_delete_test_records(
 
 # === 客户端对接接口 ===
 
+@app.get("/api/roster-index/stats", summary="学生名单索引统计")
+async def get_roster_index_stats(
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """返回学生名单内存索引的大小、命中与回源次数和命中率"""
+    return roster_index.stats()
+
+@app.get("/api/admin/read-replica", summary="只读副本状态")
+async def get_read_replica_status(
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """返回只读副本是否可用、当前复制延迟以及读请求在副本和主库间的分布"""
+    return read_replica.stats()
+
+@app.post("/api/admin/signal-features/run", response_model=schemas.BackgroundJobStatus, status_code=202,
+          summary="提取生理信号特征")
+async def run_signal_feature_extraction(
+    rerun: bool = False,
+    current_user: models.AdminUser = Depends(get_current_admin_user),
+):
+    """登记特征提取任务：计算尚未按当前算法版本提取特征的信号；rerun=true 时重新计算全部历史检测记录（算法变更后使用）"""
+    try:
+        job = await asyncio.to_thread(job_queue.enqueue, "signal_features", {"rerun": rerun})
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job_to_dict(job)
+
+# === 后台任务队列管理接口 ===
+
+@app.get("/api/admin/jobs", response_model=List[schemas.BackgroundJobStatus], summary="后台任务列表")
+async def list_background_jobs(
+    status: Optional[str] = None,
+    lane: Optional[str] = None,
+    limit: int = 100,
+    current_user: models.AdminUser = Depends(get_current_admin_user),
+):
+    """按状态（queued, running, completed, dead）和通道（client, report, export）筛选，按创建时间倒序"""
+    if status and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status 必须是 {', '.join(JOB_STATUSES)} 之一")
+    if lane and lane not in job_queue.lanes:
+        raise HTTPException(status_code=400, detail=f"lane 必须是 {', '.join(job_queue.lanes)} 之一")
+    if limit <= 0 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit 必须在 1 到 1000 之间")
+    jobs = await asyncio.to_thread(job_queue.list_jobs, status, lane, limit)
+    return [job_to_dict(job) for job in jobs]
+
+@app.get("/api/admin/jobs/stats", summary="后台任务队列统计")
+async def get_background_job_stats(current_user: models.AdminUser = Depends(get_current_admin_user)):
+    return await asyncio.to_thread(job_queue.stats)
+
+@app.get("/api/admin/jobs/{job_id}", response_model=schemas.BackgroundJobStatus, summary="查询后台任务")
+async def get_background_job(job_id: str, current_user: models.AdminUser = Depends(get_current_admin_user)):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job_to_dict(job)
+
+@app.post("/api/admin/jobs/{job_id}/retry", response_model=schemas.BackgroundJobStatus, summary="重试死信任务")
+async def retry_background_job(job_id: str, current_user: models.AdminUser = Depends(get_current_admin_user)):
+    try:
+        job = await asyncio.to_thread(job_queue.retry, job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job_to_dict(job)
+
+@app.get("/api/admin/worker-pools", summary="后台线程池和数据库连接池饱和度")
+async def get_worker_pool_stats(current_user: models.AdminUser = Depends(get_current_admin_user)):
+    """数据库连接池检出情况、通用线程池排队和等待时长、各任务通道占用、特征提取进程数，以及池大小校验警告"""
+    return {
+        "db_pool": db_pool_stats(),
+        "thread_pool": thread_pool.stats(),
+        "job_lanes": job_queue.saturation(),
+        "feature_processes": feature_pipeline.max_workers,
+        "warnings": validate_pool_sizes(),
+    }
+
+@app.get("/api/admin/slow-queries", summary="慢查询统计")
+async def get_slow_queries(
+    top: int = 20,
+    order_by: str = "total_ms",
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """按累计耗时返回前 N 种语句形状，含次数、平均/最大耗时、慢查询次数、调用位置和执行计划"""
+    if order_by not in ("total_ms", "max_ms", "count", "slow_count"):
+        raise HTTPException(status_code=400, detail="order_by 仅支持 total_ms、max_ms、count、slow_count")
+    return {
+        "threshold_ms": query_monitor.threshold_ms,
+        "queries": query_monitor.top(max(1, min(top, 200)), order_by),
+    }
+
+@app.delete("/api/admin/slow-queries", summary="清空慢查询统计")
+async def reset_slow_queries(
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """清空已累计的语句耗时统计（慢查询日志文件保留）"""
+    query_monitor.reset()
+    return {"message": "慢查询统计已清空"}
+
 @app.post("/api/client/validate-student", response_model=schemas.StudentValidateResponse, summary="客户端学号验证")
+@query_budget(2)
 async def validate_student_for_client(
     request: schemas.StudentValidateRequest,
     db: Session = Depends(get_db_session)
@@ -918,6 +1332,20 @@ async def validate_student_for_client(
         logger.error(f"学号验证失败: {e}")
         raise HTTPException(status_code=500, detail=f"学号验证失败: {str(e)}")
 
+@app.get("/api/client/roster", response_model=schemas.ClientRoster, summary="客户端学生名单同步")
+@query_budget(3)
+async def get_client_roster(
+    class_name: Optional[str] = None,
+    since_version: Optional[int] = None,
+    db: Session = Depends(get_db_session),
+    current_user: models.AdminUser = Depends(get_current_admin_user)
+):
+    """
+    返回全校或指定班级的学生名单，供客户端本地验证学号。
+    首次同步不带 since_version 获取全量快照；之后传入上次返回的 version，只获取增量变化。
+    """
+    return crud.get_client_roster(db, class_name=class_name, since_version=since_version)
+
 @app.post("/api/client/upload-test-data", response_model=schemas.TestRecordDetail, summary="客户端上传检测数据")
 async def upload_test_data_from_client(
     pdf_file: UploadFile = File(...),
@@ -956,7 +1384,7 @@ async def upload_test_data_from_client(
         
         # 保存PDF文件
         try:
-            with open(pdf_filepath, "wb") as buffer:
+            with atomic_report_path(pdf_filepath) as tmp_path, open(tmp_path, "wb") as buffer:
                 buffer.write(content)
             logger.info(f"PDF文件已保存: {pdf_filepath}")
         except Exception as e:
@@ -978,7 +1406,51 @@ async def upload_test_data_from_client(
             detail=f"数据上传失败: {str(e)}"
         )
 
+@app.post("/api/client/tests/{test_id}/signals/{channel}", response_model=schemas.PhysiologicalSignal,
+          summary="客户端上传生理信号原始采样")
+async def upload_physiological_signal(
+    test_id: int,
+    channel: str,
+    sample_rate: float,
+    request: Request,
+    db: Session = Depends(get_db_session)
+):
+    """
+    请求体为原始采样的二进制数据（小端 float32，Content-Type: application/octet-stream），
+    同一检测记录的同一通道重复上传时覆盖。服务端计算摘要后返回通道元数据，
+    脑电频段功率和心率变异性由后台任务队列 client 通道计算并写入生理数据。
+    """
+    if not signal_store.valid_channel(channel):
+        raise HTTPException(status_code=400, detail="通道名只能包含小写字母、数字和下划线，最长32个字符")
+    if sample_rate <= 0:
+        raise HTTPException(status_code=400, detail="采样率必须大于0")
+    max_bytes = settings.MAX_SIGNAL_MB * 1024 * 1024
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"信号数据超过限制 ({settings.MAX_SIGNAL_MB}MB)")
+    # 分块传输时没有 Content-Length，边读边累计，超限即停止读取
+    chunks, received = [], 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise HTTPException(status_code=413, detail=f"信号数据超过限制 ({settings.MAX_SIGNAL_MB}MB)")
+        chunks.append(chunk)
+    payload = b"".join(chunks)
+    try:
+        signal = await asyncio.to_thread(crud.save_physiological_signal, db, test_id, channel, sample_rate, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if signal is None:
+        raise HTTPException(status_code=404, detail="检测记录不存在")
+    logger.info(f"已保存生理信号: 检测记录 {test_id} 通道 {channel} 采样 {signal.sample_count}")
+    try:
+        await asyncio.to_thread(job_queue.enqueue, "signal_features", {"test_ids": [test_id]})
+    except JobQueueFullError as e:
+        # 信号已保存，下次启动时补算
+        logger.warning(f"登记信号特征提取任务失败: {e}")
+    return signal
+
 @app.get("/api/client/test-status/{student_id}", response_model=schemas.TestStatusResponse, summary="查询学生检测状态")
+@query_budget(2)
 async def get_student_test_status(
     student_id: str,
     db: Session = Depends(get_db_session)
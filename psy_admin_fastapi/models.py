@@ -1,12 +1,52 @@
 # models.py
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey
+import json
+
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, Index, JSON, Computed
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func # 用于获取当前时间
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
 
 from database import Base # 从 .database 导入 Base
 
+# 已知问卷模块和生理数据项对应的生成列：由 JSON 紧凑列在写入时计算，导出和分数段统计直接读取整数/浮点列
+TYPED_SCORE_COLUMNS = {
+    "学习焦虑": "score_learning_anxiety",
+    "对人焦虑": "score_social_anxiety",
+    "孤独倾向": "score_loneliness",
+    "自责倾向": "score_self_blame",
+}
+TYPED_PHYS_COLUMNS = {
+    "心率": "heart_rate",
+    "脑电alpha": "eeg_alpha",
+}
+
+
+class UnicodeJSON(TypeDecorator):
+    """
+    中文键名按原文写入的 JSON 列
+
+    SQLite 的 json_extract 按原始文本匹配键名，\\uXXXX 转义的键无法按中文路径取值，生成列会全部为 NULL。
+    序列化放在列类型上，写入格式不依赖引擎的 json_serializer 配置（测试和脚本中直接 create_engine 的引擎同样适用）。
+    """
+    impl = JSON
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            if value is None:
+                return None
+            return json.dumps(value, ensure_ascii=False)
+        return process
+
+
+def summary_value_sql(column: str, key: str, field: str = None, cast: str = "SIGNED") -> str:
+    """JSON 取值表达式，SQLite 和 MySQL 通用（SQLite 按类型名把 SIGNED 视为 NUMERIC、DOUBLE 视为 REAL 亲和类型；MySQL 需 8.0.17+ 才支持 CAST AS DOUBLE）"""
+    path = f'$."{key}"' + (f".{field}" if field else "")
+    return f"CAST(json_extract({column}, '{path}') AS {cast})"
+
+
 # 定义检测记录模型 (tests 表)
 class Test(Base):
     __tablename__ = 'tests'
@@ -17,6 +57,34 @@ class Test(Base):
     report_file_path = Column(String(255), comment='PDF报告文件路径')
     is_abnormal = Column(Boolean, default=False, comment='是否异常标记，方便筛选')
     status = Column(String(20), default='pending', comment='检测状态：pending, processing, completed, failed')
+    is_latest = Column(Boolean, nullable=False, default=True, comment='是否为该学生当前（最新上传）的检测记录，其余为历史记录')
+    # 问卷得分和生理数据的紧凑副本，与 scores / physiological_data 表双写；读取、导出和统计不再关联 EAV 表，见迁移 e2a7c4b91d30
+    score_summary = Column(UnicodeJSON, nullable=True, comment='问卷得分 {模块名: {score, max_score, level, questionnaire_feedback}}')
+    phys_summary = Column(UnicodeJSON, nullable=True, comment='生理数据 {数据项: 数值}')
+    score_learning_anxiety = Column(Integer, Computed(summary_value_sql("score_summary", "学习焦虑", "score"), persisted=True),
+                                    comment='学习焦虑得分（生成列）')
+    score_social_anxiety = Column(Integer, Computed(summary_value_sql("score_summary", "对人焦虑", "score"), persisted=True),
+                                  comment='对人焦虑得分（生成列）')
+    score_loneliness = Column(Integer, Computed(summary_value_sql("score_summary", "孤独倾向", "score"), persisted=True),
+                              comment='孤独倾向得分（生成列）')
+    score_self_blame = Column(Integer, Computed(summary_value_sql("score_summary", "自责倾向", "score"), persisted=True),
+                              comment='自责倾向得分（生成列）')
+    heart_rate = Column(Float, Computed(summary_value_sql("phys_summary", "心率", cast="DOUBLE"), persisted=True),
+                        comment='心率（生成列）')
+    eeg_alpha = Column(Float, Computed(summary_value_sql("phys_summary", "脑电alpha", cast="DOUBLE"), persisted=True),
+                       comment='脑电alpha（生成列）')
+
+    # 组合索引与 crud.py 中的筛选/排序组合一一对应，见 alembic 迁移 c5d28e7f4a10
+    __table_args__ = (
+        Index('ix_tests_is_latest_student', 'is_latest', 'student_fk_id'),
+        Index('ix_tests_student_time', 'student_fk_id', 'test_time'),
+        Index('ix_tests_latest_time', 'is_latest', 'test_time'),
+        Index('ix_tests_latest_abnormal_time', 'is_latest', 'is_abnormal', 'test_time'),
+        Index('ix_tests_latest_status_time', 'is_latest', 'status', 'test_time'),
+        # 分数段统计只读这个索引，不回表
+        Index('ix_tests_latest_scores', 'is_latest', 'score_learning_anxiety', 'score_social_anxiety',
+              'score_loneliness', 'score_self_blame'),
+    )
 
     # 定义与 Student 的多对一关系
     student = relationship("Student", back_populates="tests")
@@ -24,6 +92,21 @@ class Test(Base):
     scores = relationship("Score", back_populates="test")
     physiological_data = relationship("PhysiologicalData", back_populates="test")
 
+    @property
+    def score_list(self):
+        """问卷得分列表（ScoreDetail 结构）；尚未回填紧凑列的旧记录回退到 scores 表"""
+        if self.score_summary is None:
+            return [{"module_name": s.module_name, "score": s.score, "max_score": s.max_score, "level": s.level,
+                     "questionnaire_feedback": s.questionnaire_feedback} for s in self.scores]
+        return [{"module_name": name, **data} for name, data in self.score_summary.items()]
+
+    @property
+    def phys_list(self):
+        """生理数据列表（PhysiologicalDataDetail 结构）；尚未回填紧凑列的旧记录回退到 physiological_data 表"""
+        if self.phys_summary is None:
+            return [{"data_key": d.data_key, "data_value": d.data_value} for d in self.physiological_data]
+        return [{"data_key": key, "data_value": value} for key, value in self.phys_summary.items()]
+
 # 定义问卷得分模型 (scores 表)
 class Score(Base):
     __tablename__ = 'scores'
@@ -35,6 +118,12 @@ class Score(Base):
     level = Column(String(20), nullable=True, comment='等级：重度、中度、轻度')
     questionnaire_feedback = Column(String(255), nullable=True, comment='问卷反馈或备注信息')
 
+    # 覆盖索引：按检测记录取某个模块的得分时不需要回表；module_name 单列索引用于列出全部模块（DISTINCT）
+    __table_args__ = (
+        Index('ix_scores_test_module', 'test_fk_id', 'module_name', 'score'),
+        Index('ix_scores_module_name', 'module_name'),
+    )
+
     # 定义与 Test 的多对一关系
     test = relationship("Test", back_populates="scores")
 
@@ -46,9 +135,39 @@ class PhysiologicalData(Base):
     data_key = Column(String(50), nullable=False, comment='数据项键，如心率、脑电alpha')
     data_value = Column(Float, nullable=False, comment='数据值')
 
+    __table_args__ = (
+        Index('ix_physiological_data_test_key', 'test_fk_id', 'data_key', 'data_value'),
+        Index('ix_physiological_data_key', 'data_key'),
+    )
+
     # 定义与 Test 的多对一关系
     test = relationship("Test", back_populates="physiological_data")
 
+# 生理信号原始数据 (physiological_signals 表)：采样保存在 SIGNAL_DIR 下的 .npy 文件中，表中只存元数据和摘要；
+# 不设外键，检测记录归档后信号保留，ID 沿用原检测记录
+class PhysiologicalSignal(Base):
+    __tablename__ = 'physiological_signals'
+    id = Column(Integer, primary_key=True, index=True)
+    test_fk_id = Column(Integer, nullable=False, comment='关联的检测记录ID')
+    channel = Column(String(32), nullable=False, comment='信号通道，如 heart_rate、eeg')
+    sample_rate = Column(Float, nullable=False, comment='采样率（Hz）')
+    sample_count = Column(Integer, nullable=False, comment='采样点数')
+    file_path = Column(String(255), nullable=False, comment='.npy 文件路径')
+    min_value = Column(Float, nullable=True)
+    max_value = Column(Float, nullable=True)
+    mean_value = Column(Float, nullable=True)
+    std_value = Column(Float, nullable=True)
+    feature_version = Column(Integer, nullable=True, comment='已按哪个算法版本提取特征，为空表示尚未提取')
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ux_physiological_signals_test_channel', 'test_fk_id', 'channel', unique=True),
+    )
+
+    @property
+    def duration_seconds(self):
+        return self.sample_count / self.sample_rate
+
 # 管理员用户表 (用于登录)
 class AdminUser(Base):
     __tablename__ = 'admin_users'
@@ -74,9 +193,18 @@ class Student(Base):
     class_name = Column(String(100), nullable=False)
     gender = Column(String(10), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # 当前检测记录的冗余字段，由上传和删除路径在同一事务中维护，状态查询和列表不必再聚合 tests 表
+    latest_test_id = Column(Integer, nullable=True, index=True, comment='当前检测记录ID')
+    latest_test_time = Column(DateTime(timezone=True), nullable=True, index=True, comment='当前检测记录的检测时间')
+    latest_is_abnormal = Column(Boolean, nullable=True, comment='当前检测记录是否异常')
+    test_count = Column(Integer, nullable=False, default=0, server_default='0', comment='检测次数（含历史和归档记录）')
     reports = relationship("Report", back_populates="student")
     tests = relationship("Test", back_populates="student")
 
+    __table_args__ = (
+        Index('ix_students_class_gender_name', 'class_name', 'gender', 'name'),
+    )
+
 class Report(Base):
     __tablename__ = "reports"
     id = Column(Integer, primary_key=True, index=True)
@@ -84,3 +212,116 @@ class Report(Base):
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     student = relationship("Student", back_populates="reports")
+
+# 数据变更日志表：id 单调递增，作为增量导出的水位线
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    id = Column(Integer, primary_key=True, comment='变更序号')
+    entity = Column(String(30), nullable=False, comment='实体类型，如 test')
+    entity_id = Column(Integer, nullable=False, comment='实体主键')
+    op = Column(String(10), nullable=False, comment='变更类型：upsert, delete, demote')
+    changed_at = Column(DateTime, default=datetime.utcnow, comment='变更时间')
+
+    __table_args__ = (
+        Index('ix_change_log_entity_id', 'entity', 'id'),
+        Index('ix_change_log_changed_at', 'changed_at'),
+    )
+
+# 后台导入任务表：每提交一个数据块就更新一次检查点，进程重启后从检查点继续
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    id = Column(String(32), primary_key=True, comment='任务ID')
+    filename = Column(String(255), nullable=False, comment='上传的原始文件名')
+    file_path = Column(String(255), nullable=False, comment='上传文件在服务器上的保存路径')
+    on_conflict = Column(String(10), nullable=False, default='skip', comment='学号已存在时的处理方式')
+    chunk_size = Column(Integer, nullable=False, comment='分块行数，续传时必须与首次运行一致')
+    status = Column(String(20), nullable=False, default='queued', comment='任务状态：queued, running, completed, failed')
+    rows_total = Column(Integer, nullable=True, comment='预估的数据行数')
+    rows_processed = Column(Integer, nullable=False, default=0, comment='已提交的数据行数')
+    chunks_committed = Column(Integer, nullable=False, default=0, comment='检查点：已提交的数据块数')
+    success_count = Column(Integer, nullable=False, default=0)
+    updated_count = Column(Integer, nullable=False, default=0)
+    duplicate_count = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True, comment='任务失败原因')
+    worker = Column(String(100), nullable=True, comment='认领任务的进程（主机名:进程号）')
+    lease_until = Column(DateTime, nullable=True, comment='执行租约到期时间，每提交一块续租')
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    chunks = relationship("ImportJobChunk", back_populates="job", order_by="ImportJobChunk.chunk_no")
+
+# 导入任务的分块结果，与该块的数据在同一事务中提交
+class ImportJobChunk(Base):
+    __tablename__ = "import_job_chunks"
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(32), ForeignKey('import_jobs.id'), nullable=False, index=True)
+    chunk_no = Column(Integer, nullable=False, comment='数据块序号，从0开始')
+    first_row = Column(Integer, nullable=True, comment='块内第一行的文件行号')
+    last_row = Column(Integer, nullable=True, comment='块内最后一行的文件行号')
+    rows = Column(Integer, nullable=False, default=0)
+    success_count = Column(Integer, nullable=False, default=0)
+    updated_count = Column(Integer, nullable=False, default=0)
+    duplicate_count = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    details = Column(Text, nullable=True, comment='重复行和错误行明细（JSON）')
+    committed_at = Column(DateTime, default=datetime.utcnow)
+    job = relationship("ImportJob", back_populates="chunks")
+
+# 持久化后台任务队列：任务按通道（client / report / export）调度，失败后指数退避重试，
+# 超过最大次数转为死信（status=dead）；执行中的任务定期续租，租约过期后可被其他进程重新认领
+class BackgroundJob(Base):
+    __tablename__ = "background_jobs"
+    id = Column(String(32), primary_key=True, comment='任务ID')
+    kind = Column(String(50), nullable=False, comment='任务类型，对应注册的处理函数')
+    lane = Column(String(20), nullable=False, comment='调度通道：client, report, export')
+    status = Column(String(20), nullable=False, default='queued', comment='任务状态：queued, running, completed, dead')
+    payload = Column(Text, nullable=True, comment='处理函数参数（JSON）')
+    result = Column(Text, nullable=True, comment='处理函数返回值（JSON）')
+    attempts = Column(Integer, nullable=False, default=0, comment='已执行次数')
+    max_attempts = Column(Integer, nullable=False, comment='最大执行次数，用尽后转为死信')
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow, comment='最早可执行时间（重试退避）')
+    worker = Column(String(100), nullable=True, comment='认领任务的进程（主机名:进程号）')
+    lease_until = Column(DateTime, nullable=True, comment='执行租约到期时间')
+    last_error = Column(Text, nullable=True, comment='最近一次失败的异常堆栈')
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_background_jobs_lane_status_run_after', 'lane', 'status', 'run_after'),
+        Index('ix_background_jobs_status_created', 'status', 'created_at'),
+    )
+
+# 历史检测记录归档表：按检测年份（archive_year）分区，主键包含分区键；
+# 归档表只保存不再是“当前”的检测记录，不设外键，ID 沿用原表
+class TestArchive(Base):
+    __tablename__ = "tests_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False, comment='原检测记录ID')
+    archive_year = Column(Integer, primary_key=True, autoincrement=False, comment='分区键：检测年份')
+    student_fk_id = Column(Integer, nullable=False, index=True, comment='关联的学生ID')
+    test_time = Column(DateTime(timezone=True), comment='检测时间')
+    ai_summary = Column(Text)
+    report_file_path = Column(String(255))
+    is_abnormal = Column(Boolean, default=False)
+    status = Column(String(20))
+    archived_at = Column(DateTime, default=datetime.utcnow, comment='归档时间')
+
+class ScoreArchive(Base):
+    __tablename__ = "scores_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    archive_year = Column(Integer, primary_key=True, autoincrement=False)
+    test_fk_id = Column(Integer, nullable=False, index=True)
+    module_name = Column(String(50), nullable=False)
+    score = Column(Integer, nullable=False)
+    max_score = Column(Integer, nullable=True)
+    level = Column(String(20), nullable=True)
+    questionnaire_feedback = Column(String(255), nullable=True)
+
+class PhysiologicalDataArchive(Base):
+    __tablename__ = "physiological_data_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    archive_year = Column(Integer, primary_key=True, autoincrement=False)
+    test_fk_id = Column(Integer, nullable=False, index=True)
+    data_key = Column(String(50), nullable=False)
+    data_value = Column(Float, nullable=False)
@@ -1,8 +1,8 @@
 # psy_admin_fastapi/schemas.py
 
-from pydantic import BaseModel, EmailStr,Field  # 确保导入 EmailStr (如果 AdminUser 有邮箱)
+from pydantic import AliasChoices, BaseModel, EmailStr,Field, field_validator  # 确保导入 EmailStr (如果 AdminUser 有邮箱)
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import Any, Dict, Optional, List
 
 
 # --- 输入模型 (用于接收请求体) ---
@@ -172,8 +172,10 @@ class TestRecordDetail(BaseModel):
 
     # 关联数据：
     student: StudentDetail # 关联的学生信息
-    scores: List[ScoreDetail] = [] # 关联的问卷得分列表
-    physiological_data: List[PhysiologicalDataDetail] = [] # 关联的生理数据列表
+    # 从检测记录的紧凑列（Test.score_list / phys_list）读取，不再关联 scores / physiological_data 表
+    scores: List[ScoreDetail] = Field([], validation_alias=AliasChoices("score_list", "scores")) # 关联的问卷得分列表
+    physiological_data: List[PhysiologicalDataDetail] = Field(
+        [], validation_alias=AliasChoices("phys_list", "physiological_data")) # 关联的生理数据列表
 
     class Config:
         from_attributes = True # 以前是 orm_mode = True
@@ -200,9 +202,31 @@ class ExcelImportSchema(StudentBase):
 class Student(StudentBase):
     id: int
     created_at: datetime
+    latest_test_time: Optional[datetime] = None
+    latest_is_abnormal: Optional[bool] = None
+    test_count: int = 0
     class Config:
         from_attributes = True
 
+class StudentPatch(BaseModel):
+    """批量修改中的单个学生，未提供的字段保持不变"""
+    student_id: str  # 要修改的学生学号
+    name: Optional[str] = None
+    class_name: Optional[str] = None
+    gender: Optional[str] = None
+
+    @field_validator("name", "class_name", "gender")
+    @classmethod
+    def reject_null(cls, value):
+        # 字段可以省略，但对应的列不允许为空，显式传 null 时返回 422 而不是在写库时失败
+        if value is None:
+            raise ValueError("不能为 null")
+        return value
+
+class StudentBulkPatch(BaseModel):
+    """批量修改学生请求"""
+    updates: List[StudentPatch]
+
 class StudentIDRequest(BaseModel):
     student_id: str
 
@@ -214,6 +238,7 @@ class BatchDeleteStudentsRequest(BaseModel):
 class StudentBatchQuery(BaseModel):
     """批量学生查询请求"""
     student_ids: List[str]
+    include_latest_test: bool = False  # 是否同时返回每个学生最新检测记录的摘要
 
 class TestRecordStatus(BaseModel):
     """检测记录状态"""
@@ -223,6 +248,35 @@ class TestRecordStatus(BaseModel):
     status: str  # 状态：pending, processing, completed, failed
     ai_summary: Optional[str] = None
 
+class StudentWithLatestTest(Student):
+    """批量查询结果中的学生，可附带最新检测记录摘要"""
+    latest_test: Optional[TestRecordStatus] = None
+
+class StudentBatchQueryResult(BaseModel):
+    """批量学生查询结果，students 与请求中的学号顺序一致"""
+    students: List[StudentWithLatestTest]
+    total_count: int
+    missing_student_ids: List[str] = []
+
+class TestHistoryItem(BaseModel):
+    """学生检测历史中的一条记录（当前、历史或已归档）"""
+    id: int
+    test_time: Optional[datetime] = None
+    ai_summary: Optional[str] = None
+    report_file_path: Optional[str] = None
+    is_abnormal: bool = False
+    status: Optional[str] = None
+    is_latest: bool = False  # 是否为当前检测记录
+    archived: bool = False  # 是否已移入归档表
+    scores: List[ScoreDetail] = []
+    physiological_data: List[PhysiologicalDataDetail] = []
+
+class TestArchiveResult(BaseModel):
+    """历史检测记录归档结果"""
+    tests: int
+    scores: int
+    physiological_data: int
+
 class TestRecordStatusUpdate(BaseModel):
     """检测记录状态更新请求"""
     status: str  # 状态：pending, processing, completed, failed
@@ -290,3 +344,126 @@ class TestStatusResponse(BaseModel):
     is_abnormal: Optional[bool] = None
     latest_test_time: Optional[datetime] = None
     test_record_count: int = 0
+
+# === 后台导出任务相关 schemas ===
+
+class ExportJobCreate(BaseModel):
+    """创建后台导出任务请求"""
+    kind: str  # students, test-records, dashboard-stats
+    format: str = "xlsx"  # xlsx, csv, ndjson；test-records 另支持 parquet, arrow
+    # students 导出参数
+    skip: int = 0
+    limit: int = 10000
+    # test-records 导出筛选条件
+    user_id: Optional[str] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    is_abnormal: Optional[bool] = None
+    status: Optional[str] = None
+    partition_by: Optional[str] = None  # 列式导出按检测时间分区：year, month, day
+
+class ExportJobStatus(BaseModel):
+    """后台导出任务状态"""
+    job_id: str
+    kind: str
+    format: str
+    status: str  # queued, running, completed, failed, expired
+    rows_written: int = 0
+    rows_total: Optional[int] = None
+    progress: Optional[float] = None  # 百分比
+    file_name: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class BackgroundJobStatus(BaseModel):
+    """后台任务队列中的任务状态"""
+    job_id: str
+    kind: str
+    lane: str  # client, report, export
+    status: str  # queued, running, completed, dead
+    attempts: int = 0
+    max_attempts: int
+    run_after: Optional[datetime] = None  # 排队任务最早可执行时间（失败重试时为退避后的时间）
+    worker: Optional[str] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None  # 最近一次失败的异常堆栈
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ImportJobStatus(BaseModel):
+    """后台导入任务状态"""
+    job_id: str
+    filename: str
+    on_conflict: str
+    status: str  # queued, running, completed, failed
+    rows_total: Optional[int] = None
+    rows_processed: int = 0
+    chunks_committed: int = 0
+    progress: Optional[float] = None  # 百分比
+    success_count: int = 0
+    updated_count: int = 0
+    duplicate_count: int = 0
+    error_count: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ImportJobChunkResult(BaseModel):
+    """后台导入任务单个数据块的结果"""
+    chunk_no: int
+    first_row: Optional[int] = None
+    last_row: Optional[int] = None
+    rows: int
+    success_count: int
+    updated_count: int
+    duplicate_count: int
+    error_count: int
+    duplicate_students: List[Dict[str, Any]] = []
+    error_rows: List[Dict[str, Any]] = []
+    committed_at: Optional[datetime] = None
+
+class RosterStudent(BaseModel):
+    """客户端名单中的学生"""
+    id: int
+    student_id: str
+    name: str
+    class_name: str
+    gender: str
+
+class ClientRoster(BaseModel):
+    """客户端名单快照或增量"""
+    version: int  # 下次增量同步时作为 since_version 传回
+    full: bool  # True 表示全量快照，客户端应先清空本地名单
+    students: List[RosterStudent]
+    deleted_ids: List[int] = []  # 已删除（或转出所查询班级）的学生ID
+
+class PhysiologicalSignal(BaseModel):
+    """生理信号通道元数据和服务端摘要"""
+    test_fk_id: int
+    channel: str
+    sample_rate: float
+    sample_count: int
+    duration_seconds: float
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+    mean_value: Optional[float] = None
+    std_value: Optional[float] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class SignalSeries(BaseModel):
+    """降采样后的信号区间：每个时间点对应一个桶的最小值和最大值"""
+    channel: str
+    sample_rate: float
+    start: float  # 秒
+    end: float  # 秒
+    bucket_seconds: float
+    time: List[float]
+    min: List[float]
+    max: List[float]
@@ -0,0 +1,290 @@
+"""
+后台导出任务服务
+大数据量导出登记为后台任务队列 export 通道中的任务，接口立即返回任务ID，
+客户端轮询进度，完成后通过支持 Range 的接口下载文件。
+任务本身持久化在 background_jobs 表中，进程重启后继续执行，失败后按退避重试；
+执行中的行数进度只保存在本进程内存中。
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import crud
+from config import settings
+import models
+from database import read_replica
+from services.job_queue import job_queue
+from utils.export_writers import write_xlsx, iter_csv, iter_ndjson
+
+logger = logging.getLogger(__name__)
+
+EXPORT_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",  # text/* 类型由 Starlette 自动追加 charset
+    "ndjson": "application/x-ndjson; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+    "zip": "application/zip",
+}
+
+# 列式格式只支持检测记录导出
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+# 队列任务状态 -> 导出任务状态
+QUEUE_STATUS = {"queued": "queued", "running": "running", "completed": "completed", "dead": "failed"}
+
+
+class ExportJob:
+    """单个后台导出任务的状态"""
+
+    def __init__(self, kind: str, format: str, params: Dict[str, Any], job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.format = format
+        self.params = params
+        self.status = "queued"  # queued, running, completed, failed, expired
+        self.rows_written = 0
+        self.rows_total: Optional[int] = None
+        self.file_path: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    @classmethod
+    def from_queue(cls, queued: models.BackgroundJob, running: Optional["ExportJob"] = None) -> "ExportJob":
+        """由队列中的任务记录还原导出任务状态；本进程正在执行时叠加内存中的行数进度"""
+        payload = json.loads(queued.payload)
+        job = cls(payload["kind"], payload["format"], payload["params"], job_id=queued.id)
+        job.status = QUEUE_STATUS.get(queued.status, queued.status)
+        result = json.loads(queued.result) if queued.result else {}
+        job.file_path = result.get("file_path")
+        job.rows_written = result.get("rows_written", 0)
+        job.rows_total = result.get("rows_total")
+        if job.status == "running" and running is not None:
+            job.rows_written = running.rows_written
+            job.rows_total = running.rows_total
+        if job.status == "completed" and not (job.file_path and os.path.exists(job.file_path)):
+            job.status = "expired"
+        if job.status == "failed" and queued.last_error:
+            # 只返回异常信息，不返回完整堆栈
+            job.error = queued.last_error.strip().splitlines()[-1]
+        job.created_at = queued.created_at
+        job.started_at = queued.started_at
+        job.finished_at = queued.finished_at
+        return job
+
+    def to_dict(self) -> Dict[str, Any]:
+        progress = None
+        if self.status == "completed":
+            progress = 100.0
+        elif self.rows_total:
+            progress = round(min(self.rows_written / self.rows_total, 1.0) * 100, 1)
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "format": self.format,
+            "status": self.status,
+            "rows_written": self.rows_written,
+            "rows_total": self.rows_total,
+            "progress": progress,
+            "file_name": os.path.basename(self.file_path) if self.file_path else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def media_type_for(path: str) -> str:
+    """根据导出文件扩展名返回下载的 media type"""
+    ext = os.path.splitext(path)[1].lstrip(".")
+    return EXPORT_MEDIA_TYPES.get(ext, "application/octet-stream")
+
+
+def _write_stream(path: str, chunks: Iterable[bytes]):
+    """把字节块写入文件，先写临时文件再重命名"""
+    tmp_path = f"{path}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _job_file_tag(job_id: str) -> str:
+    """导出文件名中标识所属任务的片段：<前缀>_<时间戳>_<任务ID前8位>.<扩展名>"""
+    return f"_{job_id[:8]}."
+
+
+def sweep_export_dir(directory: str, max_age_hours: float, max_total_mb: float,
+                     active_job_ids: Iterable[str] = ()) -> List[str]:
+    """
+    按保留策略清理导出目录：
+    1. 删除超过保留时长的文件
+    2. 剩余文件总大小超出上限时，从最旧的文件开始删除
+    排队或执行中的任务（active_job_ids，可能在其他进程中写入）的文件不会被删除；
+    写入中的 .part 文件/目录只在超过保留时长（进程中断后的残留）时删除，不参与总大小清理。
+    返回被删除的文件路径列表。
+    """
+    if not os.path.isdir(directory):
+        return []
+
+    tags = [_job_file_tag(job_id) for job_id in active_job_ids]
+    now = time.time()
+    max_age_seconds = max_age_hours * 3600
+    removed = []
+    kept = []
+    for entry in os.scandir(directory):
+        if any(tag in entry.name for tag in tags):
+            continue
+        stat = entry.stat()
+        expired = now - stat.st_mtime > max_age_seconds
+        if entry.is_dir():
+            # 中断的分区导出会留下 .part 暂存目录，过期后整体删除
+            if entry.name.endswith(".part") and expired:
+                shutil.rmtree(entry.path, ignore_errors=True)
+            continue
+        if expired:
+            removed.append(entry.path)
+        elif not entry.name.endswith(".part"):
+            kept.append((entry.path, stat.st_mtime, stat.st_size))
+
+    budget = max_total_mb * 1024 * 1024
+    total = sum(size for _, _, size in kept)
+    for path, _, size in sorted(kept, key=lambda f: f[1]):
+        if total <= budget:
+            break
+        removed.append(path)
+        total -= size
+
+    deleted = []
+    for path in removed:
+        try:
+            os.remove(path)
+            deleted.append(path)
+        except OSError as e:
+            logger.warning(f"删除过期导出文件失败: {path}, {e}")
+    return deleted
+
+
+class ExportJobManager:
+    """后台导出任务管理器：任务经后台任务队列的 export 通道调度（并发数和排队上限见 EXPORT_JOB_*）"""
+
+    def __init__(self):
+        # 本进程正在执行的任务，用于查询实时行数进度
+        self.jobs: Dict[str, ExportJob] = {}
+        self._lock = threading.Lock()
+        job_queue.register("export", lane="export")(self._run)
+
+    def submit(self, kind: str, format: str, **params) -> ExportJob:
+        """提交导出任务，排队任务过多时抛出 JobQueueFullError"""
+        if kind not in crud.EXPORT_KINDS:
+            raise ValueError(f"不支持的导出类型: {kind}")
+        if format not in EXPORT_MEDIA_TYPES or format == "zip":
+            raise ValueError(f"不支持的导出格式: {format}")
+        if format in COLUMNAR_FORMATS and kind != "test-records":
+            raise ValueError("Parquet/Arrow 格式仅支持检测记录导出")
+        partition_by = params.get("partition_by")
+        if partition_by and (format not in COLUMNAR_FORMATS or partition_by not in crud.PARTITION_FORMATS):
+            raise ValueError(f"partition_by 仅用于 Parquet/Arrow 导出，取值为 {', '.join(crud.PARTITION_FORMATS)}")
+
+        job_id = uuid.uuid4().hex
+        queued = job_queue.enqueue("export", {"job_id": job_id, "kind": kind, "format": format, "params": params},
+                                   job_id=job_id)
+        return ExportJob.from_queue(queued)
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        queued = job_queue.get(job_id)
+        if queued is None or queued.kind != "export":
+            return None
+        with self._lock:
+            running = self.jobs.get(job_id)
+        return ExportJob.from_queue(queued, running)
+
+    def sweep(self) -> List[str]:
+        """
+        执行一次导出目录清理；文件被删除的任务查询时显示为过期。
+        受保护的任务取自任务队列中排队或执行中的导出任务，其他进程正在写入的文件同样不会被删除。
+        """
+        deleted = sweep_export_dir(
+            settings.EXPORT_DIR,
+            max_age_hours=settings.EXPORT_RETENTION_HOURS,
+            max_total_mb=settings.EXPORT_MAX_TOTAL_MB,
+            active_job_ids=job_queue.active_job_ids("export"),
+        )
+        if deleted:
+            logger.info(f"导出目录清理完成，删除 {len(deleted)} 个文件")
+        return deleted
+
+    def _count_rows(self, job: ExportJob, rows: Iterable):
+        """包装数据行迭代器，统计已写入的行数"""
+        for row in rows:
+            yield row
+            job.rows_written += 1
+
+    def _run(self, job_id: str, kind: str, format: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """队列任务处理函数：写出导出文件并返回文件路径和行数；失败时删除未写完的文件并抛出，由队列重试"""
+        # 任务参数经 JSON 持久化，时间筛选条件还原为 datetime
+        params = {key: datetime.fromisoformat(value) if key in ("start_time", "end_time") and value else value
+                  for key, value in params.items()}
+        job = ExportJob(kind, format, params, job_id=job_id)
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        with self._lock:
+            self.jobs[job_id] = job
+        # 导出只读，副本可用时不占用主库
+        db = read_replica.session()
+        try:
+            job.rows_total = crud.count_export_rows(db, job.kind, latest_only=job.format not in COLUMNAR_FORMATS,
+                                                    **job.params)
+
+            os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+            prefix = crud.EXPORT_KINDS[job.kind]
+            partition_by = job.params.get("partition_by")
+            ext = "zip" if partition_by else job.format
+            filename = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{_job_file_tag(job.id)}{ext}"
+            job.file_path = os.path.join(settings.EXPORT_DIR, filename)
+
+            if job.format in COLUMNAR_FORMATS:
+                filters = {k: job.params.get(k) for k in crud.TEST_RECORD_FILTER_KEYS}
+                crud.export_test_records_to_columnar(
+                    db, format=job.format, partition_by=partition_by,
+                    progress=lambda n: setattr(job, "rows_written", n),
+                    filepath=job.file_path, **filters
+                )
+            elif job.format == "xlsx":
+                sheets = [
+                    (title, headers, self._count_rows(job, rows))
+                    for title, headers, rows in crud.get_export_sheets(db, job.kind, **job.params)
+                ]
+                write_xlsx(job.file_path, sheets)
+            else:
+                headers, rows = crud.get_export_rows(db, job.kind, **job.params)
+                encoder = iter_csv if job.format == "csv" else iter_ndjson
+                _write_stream(job.file_path, encoder(headers, self._count_rows(job, rows)))
+
+            logger.info(f"导出任务 {job.id} 完成，共 {job.rows_written} 行")
+            return {"file_path": job.file_path, "rows_written": job.rows_written, "rows_total": job.rows_total}
+        except Exception:
+            if job.file_path and os.path.exists(job.file_path):
+                os.remove(job.file_path)
+            raise
+        finally:
+            db.close()
+            with self._lock:
+                self.jobs.pop(job_id, None)
+
+
+# 初始化全局导出任务管理器
+export_job_manager = ExportJobManager()
@@ -0,0 +1,97 @@
+"""
+生理信号特征提取流水线
+从 physiological_signals 中找出尚未按当前算法版本计算特征的检测记录，分批交给进程池提取
+脑电频段功率和心率变异性，结果写回检测记录的生理数据。算法变更后以重跑模式重新计算历史检测记录。
+作为后台任务队列 client 通道的任务执行。
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import crud
+from config import settings
+from services.job_queue import job_queue
+from utils.concurrent import process_pool_size, session_scope
+from utils.signal_features import FEATURE_VERSION, extract_batch
+
+logger = logging.getLogger(__name__)
+
+
+class FeaturePipeline:
+    """特征提取流水线：数值计算在进程池中执行，数据库读写留在调用线程；同一时间只运行一轮"""
+
+    def __init__(self, max_workers: int, batch_size: int):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> Optional[ProcessPoolExecutor]:
+        """首次使用时创建进程池；max_workers 为 0 时在当前进程内计算"""
+        if self.max_workers <= 0:
+            return None
+        if self._executor is None:
+            # spawn 启动子进程，避免在多线程的服务进程中 fork
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def run(self, test_ids: Optional[List[int]] = None, rerun: bool = False) -> Dict[str, int]:
+        """
+        提取信号特征并写回生理数据
+
+        Args:
+            test_ids: 只处理这些检测记录；为空时处理全部
+            rerun: 重跑模式，忽略特征版本，重新计算所有信号
+
+        Returns:
+            {"tests": 写入特征的检测记录数, "features": 写入的数据项数, "failed": 提取失败的检测记录数}
+        """
+        with self._lock, session_scope() as db:
+            pending = crud.get_signals_for_feature_extraction(db, FEATURE_VERSION, test_ids, rerun)
+            counts = {"tests": 0, "features": 0, "failed": 0}
+            if not pending:
+                return counts
+            grouped: Dict[int, List] = {}
+            signal_ids: Dict[int, List[int]] = {}
+            for signal in pending:
+                grouped.setdefault(signal.test_fk_id, []).append(
+                    (signal.channel, signal.file_path, signal.sample_rate))
+                signal_ids.setdefault(signal.test_fk_id, []).append(signal.id)
+            items = list(grouped.items())
+            batches = [items[start:start + self.batch_size] for start in range(0, len(items), self.batch_size)]
+
+            pool = self._pool()
+            results = pool.map(extract_batch, batches) if pool else map(extract_batch, batches)
+            for batch_results in results:
+                features_by_test = {}
+                for test_id, features, error in batch_results:
+                    if error:
+                        # 不标记特征版本，下一轮重试
+                        logger.warning(f"检测记录 {test_id} 信号特征提取失败: {error}")
+                        counts["failed"] += 1
+                    else:
+                        features_by_test[test_id] = features
+                done_signal_ids = [sid for test_id in features_by_test for sid in signal_ids[test_id]]
+                counts["tests"] += crud.save_signal_features(db, features_by_test, done_signal_ids,
+                                                             FEATURE_VERSION)
+                counts["features"] += sum(len(features) for features in features_by_test.values())
+            logger.info(f"信号特征提取完成: {counts}")
+            return counts
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+feature_pipeline = FeaturePipeline(process_pool_size(settings.FEATURE_WORKERS), settings.FEATURE_BATCH_SIZE)
+
+
+@job_queue.register("signal_features", lane="client")
+def run_signal_features(test_ids: Optional[List[int]] = None, rerun: bool = False) -> Dict[str, int]:
+    """队列任务处理函数：信号上传后和启动时各登记一次"""
+    return feature_pipeline.run(test_ids, rerun)
@@ -0,0 +1,290 @@
+"""
+后台导入任务服务
+上传文件先保存到磁盘，再由后台线程按块导入：每个数据块的学生数据、分块结果和任务检查点
+在同一个事务中提交。任务中断（进程重启或出错）后从最后一个检查点继续，已提交的块不会重复导入。
+多个进程之间按租约认领任务（与后台任务队列相同）：同一个任务同时只有一个进程在导入。
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import BinaryIO, Optional
+
+from sqlalchemy import and_, func, or_, update
+
+import models
+from config import settings
+from database import SessionLocal
+from utils.roster_index import roster_index
+from services.import_service import (
+    ON_CONFLICT_MODES, ImportFileError, estimate_rows, iter_import_chunks, process_chunk, validate_chunk,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _claimable(now: datetime):
+    """可认领的导入任务：排队中的任务，或租约已过期（执行进程已退出）的执行中任务"""
+    Job = models.ImportJob
+    return or_(
+        Job.status == "queued",
+        and_(Job.status == "running", or_(Job.lease_until.is_(None), Job.lease_until < now)),
+    )
+
+
+def _lease_until() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+
+class ImportJobManager:
+    """后台导入任务管理器，任务状态持久化在 import_jobs 表中"""
+
+    def __init__(self, max_workers: int):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="import-job")
+        self._stopping = threading.Event()
+        self._idle = threading.Condition()
+        self._running = 0
+
+    def create(self, fileobj: BinaryIO, filename: str, on_conflict: str = "skip") -> models.ImportJob:
+        """把上传文件分块写入导入目录并登记任务（在工作线程中调用，不阻塞事件循环）"""
+        if on_conflict not in ON_CONFLICT_MODES:
+            raise ValueError(f"on_conflict 必须是 {', '.join(ON_CONFLICT_MODES)} 之一")
+
+        job_id = uuid.uuid4().hex
+        os.makedirs(settings.IMPORT_DIR, exist_ok=True)
+        ext = os.path.splitext(filename or "")[1].lower() or ".xlsx"
+        file_path = os.path.join(settings.IMPORT_DIR, f"{job_id}{ext}")
+        with open(file_path, "wb") as f:
+            for block in iter(lambda: fileobj.read(1024 * 1024), b""):
+                f.write(block)
+
+        # 先检查文件能否读取、表头是否完整，避免无效文件进入队列
+        try:
+            with open(file_path, "rb") as f:
+                next(iter_import_chunks(f, filename, chunk_size=1), None)
+        except Exception:
+            os.remove(file_path)
+            raise
+
+        db = SessionLocal()
+        try:
+            job = models.ImportJob(
+                id=job_id,
+                filename=filename or os.path.basename(file_path),
+                file_path=file_path,
+                on_conflict=on_conflict,
+                chunk_size=settings.IMPORT_CHUNK_SIZE,
+                status="queued",
+                rows_total=estimate_rows(file_path, filename),
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+        finally:
+            db.close()
+
+        self.submit(job_id)
+        return job
+
+    def submit(self, job_id: str):
+        self.executor.submit(self._run, job_id)
+
+    def retry(self, job_id: str) -> Optional[models.ImportJob]:
+        """把失败的任务重新排队，从最后一个检查点继续"""
+        db = SessionLocal()
+        try:
+            job = db.get(models.ImportJob, job_id)
+            if job is None:
+                return None
+            if job.status != "failed":
+                raise ValueError("只能重试失败的导入任务")
+            if not os.path.exists(job.file_path):
+                raise ValueError("上传文件已不存在，请重新提交导入任务")
+            job.status = "queued"
+            job.finished_at = None
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+        finally:
+            db.close()
+        self.submit(job_id)
+        return job
+
+    def resume_pending(self) -> int:
+        """启动时重新调度上次未完成的任务；其他进程仍持有租约的任务在认领时跳过"""
+        db = SessionLocal()
+        try:
+            job_ids = [row[0] for row in db.query(models.ImportJob.id)
+                       .filter(models.ImportJob.status.in_(["queued", "running"]))
+                       .order_by(models.ImportJob.created_at)]
+        finally:
+            db.close()
+        for job_id in job_ids:
+            logger.info(f"恢复导入任务 {job_id}")
+            self.submit(job_id)
+        return len(job_ids)
+
+    def shutdown(self, timeout: Optional[float] = None) -> int:
+        """
+        停止导入（应用关闭时调用）：排队的任务不再启动，执行中的任务提交当前数据块后停下并回到排队状态，
+        下次启动从检查点继续。返回超过 timeout 秒仍未停下的任务数。
+        """
+        self._stopping.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._idle.wait(remaining)
+            return self._running
+
+    def _claim(self, db, job_id: str) -> bool:
+        """条件 UPDATE 认领任务：其他进程正在执行（租约未过期）或已结束的任务 rowcount 为 0"""
+        Job = models.ImportJob
+        now = datetime.utcnow()
+        claimed = db.execute(update(Job).where(Job.id == job_id, _claimable(now)).values(
+            status="running", worker=f"{socket.gethostname()}:{os.getpid()}", lease_until=_lease_until(),
+            started_at=func.coalesce(Job.started_at, now), error=None,
+        )).rowcount == 1
+        db.commit()
+        return claimed
+
+    def _run(self, job_id: str):
+        with self._idle:
+            self._running += 1
+        db = SessionLocal()
+        try:
+            if not self._claim(db, job_id):
+                logger.info(f"导入任务 {job_id} 已结束或正由其他进程执行，跳过")
+                return
+            job = db.get(models.ImportJob, job_id)
+            checkpoint = job.chunks_committed
+
+            seen_ids = set()
+            with open(job.file_path, "rb") as f:
+                for chunk_no, chunk in enumerate(iter_import_chunks(f, job.filename, job.chunk_size)):
+                    if chunk_no < checkpoint:
+                        # 已提交的块只重放文件内去重，保证跨块重复的判断与首次运行一致
+                        validate_chunk(db, chunk, seen_ids)
+                        continue
+                    if self._stopping.is_set():
+                        job.status = "queued"
+                        job.lease_until = None
+                        db.commit()
+                        logger.info(f"应用关闭，导入任务 {job_id} 停在第 {chunk_no} 块，下次启动后继续")
+                        return
+
+                    result = process_chunk(db, chunk, seen_ids, job.on_conflict)
+                    if result["conflicts"]:
+                        db.rollback()
+                        raise ImportFileError(
+                            f"第 {chunk_no + 1} 块有 {len(result['conflicts'])} 个学号已存在，"
+                            f"导入已停止（之前的 {chunk_no} 块已提交）")
+
+                    self._save_chunk(db, job, chunk_no, len(chunk), result)
+                    db.commit()
+                    roster_index.refresh(db, result["student_ids"])
+
+            job.status = "completed"
+            job.lease_until = None
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            os.remove(job.file_path)
+            logger.info(f"导入任务 {job_id} 完成：新增 {job.success_count}，更新 {job.updated_count}，"
+                        f"重复 {job.duplicate_count}，错误 {job.error_count}")
+        except Exception as e:
+            logger.error(f"导入任务 {job_id} 失败: {e}", exc_info=True)
+            db.rollback()
+            job = db.get(models.ImportJob, job_id)
+            if job is not None:
+                job.status = "failed"
+                job.lease_until = None
+                job.error = str(e)
+                job.finished_at = datetime.utcnow()
+                db.commit()
+        finally:
+            db.close()
+            with self._idle:
+                self._running -= 1
+                self._idle.notify_all()
+
+    @staticmethod
+    def _save_chunk(db, job: models.ImportJob, chunk_no: int, rows: int, result: dict):
+        """记录分块结果、推进检查点并续租（与该块的数据同一事务）"""
+        duplicates = result["duplicate_students"]
+        errors = result["error_rows"]
+        db.add(models.ImportJobChunk(
+            job_id=job.id,
+            chunk_no=chunk_no,
+            first_row=result["first_row"],
+            last_row=result["last_row"],
+            rows=rows,
+            success_count=result["success_count"],
+            updated_count=result["updated_count"],
+            duplicate_count=len(duplicates),
+            error_count=len(errors),
+            details=json.dumps({"duplicate_students": duplicates, "error_rows": errors}, ensure_ascii=False),
+        ))
+        job.chunks_committed = chunk_no + 1
+        job.lease_until = _lease_until()
+        job.rows_processed += rows
+        job.success_count += result["success_count"]
+        job.updated_count += result["updated_count"]
+        job.duplicate_count += len(duplicates)
+        job.error_count += len(errors)
+
+
+def import_job_to_dict(job: models.ImportJob) -> dict:
+    progress = None
+    if job.status == "completed":
+        progress = 100.0
+    elif job.rows_total:
+        progress = round(min(job.rows_processed / job.rows_total, 1.0) * 100, 1)
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "on_conflict": job.on_conflict,
+        "status": job.status,
+        "rows_total": job.rows_total,
+        "rows_processed": job.rows_processed,
+        "chunks_committed": job.chunks_committed,
+        "progress": progress,
+        "success_count": job.success_count,
+        "updated_count": job.updated_count,
+        "duplicate_count": job.duplicate_count,
+        "error_count": job.error_count,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def import_chunk_to_dict(chunk: models.ImportJobChunk) -> dict:
+    details = json.loads(chunk.details) if chunk.details else {}
+    return {
+        "chunk_no": chunk.chunk_no,
+        "first_row": chunk.first_row,
+        "last_row": chunk.last_row,
+        "rows": chunk.rows,
+        "success_count": chunk.success_count,
+        "updated_count": chunk.updated_count,
+        "duplicate_count": chunk.duplicate_count,
+        "error_count": chunk.error_count,
+        "duplicate_students": details.get("duplicate_students", []),
+        "error_rows": details.get("error_rows", []),
+        "committed_at": chunk.committed_at,
+    }
+
+
+# 初始化全局导入任务管理器
+import_job_manager = ImportJobManager(max_workers=settings.IMPORT_JOB_WORKERS)
@@ -0,0 +1,302 @@
+"""
+学生批量导入服务
+以流式方式读取 XLSX（read-only 模式）或 CSV 上传文件，按块构造 DataFrame，
+空值、去空格、文件内重复和已存在学号的检查都按列向量化完成，
+有效数据按块批量 INSERT，内存占用只与块大小有关。
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set
+
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import crud
+import models
+from config import settings
+from utils.roster_index import roster_index
+
+logger = logging.getLogger(__name__)
+
+IMPORT_COLUMNS = ["name", "student_id", "class_name", "gender"]
+
+# 与 students 表的列长度一致，超长的行记为格式错误而不是让整批插入失败
+IMPORT_FIELD_LIMITS = {"name": 100, "student_id": 50, "class_name": 100, "gender": 10}
+IMPORT_FIELD_LABELS = {"name": "姓名", "student_id": "学号", "class_name": "班级", "gender": "性别"}
+
+# 学号已存在时的处理方式：skip 记为重复并跳过，update 用文件内容覆盖，error 整批回滚
+ON_CONFLICT_MODES = ("skip", "update", "error")
+
+
+class ImportFileError(ValueError):
+    """上传文件无法读取或缺少必要列"""
+
+
+class ImportConflictError(ValueError):
+    """on_conflict=error 时文件中包含已存在的学号"""
+
+    def __init__(self, conflicts: List[Dict[str, Any]]):
+        super().__init__(f"{len(conflicts)} 个学号已存在，导入已取消")
+        self.conflicts = conflicts
+
+
+def _check_columns(columns: List[str]):
+    missing_cols = [col for col in IMPORT_COLUMNS if col not in columns]
+    if missing_cols:
+        raise ImportFileError(f"缺少必要列: {', '.join(missing_cols)}")
+
+
+def _normalize_cell(value):
+    # Excel 中数字格式的学号读出来可能是 2023001.0
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def iter_xlsx_chunks(fileobj: BinaryIO, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """以 read-only 模式逐行读取第一个工作表，每 chunk_size 行产出一个 DataFrame（row 列为 Excel 行号）"""
+    try:
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f"Excel读取失败: {str(e)}") from e
+
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        columns = [str(col).strip() if col is not None else "" for col in header]
+        _check_columns(columns)
+        positions = [columns.index(col) for col in IMPORT_COLUMNS]
+
+        records = []
+        row_numbers = []
+        for row_number, row in enumerate(rows, start=2):
+            values = [_normalize_cell(row[pos]) if pos < len(row) else None for pos in positions]
+            if all(value is None for value in values):
+                continue  # 跳过空行（read-only 模式下工作表末尾常带有格式化过的空行）
+            records.append(values)
+            row_numbers.append(row_number)
+            if len(records) >= chunk_size:
+                yield pd.DataFrame(records, columns=IMPORT_COLUMNS).assign(row=row_numbers)
+                records = []
+                row_numbers = []
+        if records:
+            yield pd.DataFrame(records, columns=IMPORT_COLUMNS).assign(row=row_numbers)
+    finally:
+        wb.close()
+
+
+def iter_csv_chunks(fileobj: BinaryIO, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """分块读取 CSV（兼容带 BOM 的 UTF-8），所有列按字符串读取，保留学号前导零"""
+    try:
+        reader = pd.read_csv(fileobj, dtype=str, encoding="utf-8-sig", chunksize=chunk_size,
+                             skip_blank_lines=False)
+        first = next(reader, None)
+    except Exception as e:
+        raise ImportFileError(f"CSV读取失败: {str(e)}") from e
+    if first is None:
+        raise ImportFileError(f"缺少必要列: {', '.join(IMPORT_COLUMNS)}")
+    _check_columns([str(col).strip() for col in first.columns])
+
+    def chunks():
+        yield first
+        yield from reader
+
+    for chunk in chunks():
+        chunk.columns = [str(col).strip() for col in chunk.columns]
+        chunk = chunk[IMPORT_COLUMNS].assign(row=chunk.index + 2)  # 第1行是标题
+        yield chunk[chunk[IMPORT_COLUMNS].notna().any(axis=1)]
+
+
+def iter_import_chunks(fileobj: BinaryIO, filename: Optional[str],
+                       chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """按文件扩展名选择读取方式"""
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    if (filename or "").lower().endswith(".csv"):
+        return iter_csv_chunks(fileobj, chunk_size)
+    return iter_xlsx_chunks(fileobj, chunk_size)
+
+
+def validate_chunk(db: Session, chunk: pd.DataFrame, seen_ids: Set[str]):
+    """
+    向量化校验一个数据块，返回 (有效行, 已存在学号的行, 重复行列表, 错误行列表)。
+    seen_ids 为本次导入中已处理过的学号，用于检测跨块的文件内重复。
+    """
+    missing = chunk[IMPORT_COLUMNS].isna().any(axis=1)
+    error_rows = [{"row": row, "error": "必填字段不能为空"} for row in chunk.loc[missing, "row"].tolist()]
+
+    data = chunk.loc[~missing].copy()
+    for col in IMPORT_COLUMNS:
+        data[col] = data[col].astype(str).str.strip()
+
+    invalid = pd.Series(False, index=data.index)
+    for col, max_len in IMPORT_FIELD_LIMITS.items():
+        too_long = (data[col].str.len() > max_len) & ~invalid
+        error_rows.extend(
+            {"row": row, "error": f"数据格式错误: {IMPORT_FIELD_LABELS[col]}长度不能超过{max_len}个字符"}
+            for row in data.loc[too_long, "row"].tolist()
+        )
+        invalid |= too_long
+    data = data.loc[~invalid]
+
+    # 文件内重复（同一块内或与之前的块）保留第一次出现的行；已存在的学号单独返回，由调用方按 on_conflict 处理
+    chunk_ids = data["student_id"].unique().tolist()
+    existing = {
+        row[0] for row in
+        db.query(models.Student.student_id).filter(models.Student.student_id.in_(chunk_ids))
+    } if chunk_ids else set()
+    duplicated = data["student_id"].duplicated(keep="first") | data["student_id"].isin(seen_ids)
+    seen_ids.update(data.loc[~duplicated, "student_id"].tolist())
+
+    duplicate_students = data.loc[duplicated, ["row", "student_id", "name"]].to_dict("records")
+    data = data.loc[~duplicated]
+    is_existing = data["student_id"].isin(existing)
+    return data.loc[~is_existing], data.loc[is_existing], duplicate_students, error_rows
+
+
+def insert_students(db: Session, valid: pd.DataFrame) -> int:
+    """一次 executemany 批量插入一个数据块（不提交）"""
+    if valid.empty:
+        return 0
+    records = valid[IMPORT_COLUMNS].assign(created_at=datetime.utcnow()).to_dict("records")
+    db.execute(insert(models.Student), records)
+    student_db_ids = [row[0] for row in db.query(models.Student.id).filter(
+        models.Student.student_id.in_(valid["student_id"].tolist()))]
+    crud.record_student_changes(db, student_db_ids)
+    return len(records)
+
+
+def upsert_students_chunk(db: Session, new: pd.DataFrame, existing: pd.DataFrame) -> int:
+    """
+    update 模式：新学号和已存在的学号一起用 INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE 写入（不提交），
+    返回写入的行数。已存在学生的当前检测记录同时记一次变更。
+    """
+    rows = pd.concat([new, existing])
+    if rows.empty:
+        return 0
+    records = rows[IMPORT_COLUMNS].to_dict("records")
+    crud.upsert_students(db, records)
+    id_map = dict(db.query(models.Student.student_id, models.Student.id).filter(
+        models.Student.student_id.in_(rows["student_id"].tolist())))
+    crud.record_student_changes(db, list(id_map.values()))
+    if not existing.empty:
+        crud.record_student_test_changes(db, [id_map[student_id] for student_id in existing["student_id"]])
+    return len(records)
+
+
+def _conflict_rows(existing: pd.DataFrame) -> List[Dict[str, Any]]:
+    return existing[["row", "student_id", "name"]].to_dict("records")
+
+
+def process_chunk(db: Session, chunk: pd.DataFrame, seen_ids: Set[str], on_conflict: str = "skip",
+                  write: bool = True) -> Dict[str, Any]:
+    """
+    校验并写入一个数据块（不提交），返回该块的结果。
+    on_conflict=error 时块内有已存在的学号则整块不写入，冲突行放在 conflicts 中；
+    write=False 时只校验不写入。
+    """
+    new, existing, duplicates, errors = validate_chunk(db, chunk, seen_ids)
+    result = {
+        "first_row": int(chunk["row"].min()) if not chunk.empty else None,
+        "last_row": int(chunk["row"].max()) if not chunk.empty else None,
+        "success_count": 0,
+        "updated_count": 0,
+        "duplicate_students": duplicates,
+        "error_rows": errors,
+        "conflicts": [],
+        "student_ids": [],  # 本块新增或更新的学号，提交后用于刷新名单索引
+    }
+    if on_conflict == "error":
+        result["conflicts"] = _conflict_rows(existing)
+        if result["conflicts"]:
+            return result
+    elif on_conflict == "update":
+        if write:
+            upsert_students_chunk(db, new, existing)
+            result["success_count"] = len(new)
+            result["updated_count"] = len(existing)
+            result["student_ids"].extend(new["student_id"].tolist() + existing["student_id"].tolist())
+        return result
+    else:
+        duplicates.extend(_conflict_rows(existing))
+    if write:
+        result["success_count"] = insert_students(db, new)
+        result["student_ids"].extend(new["student_id"].tolist())
+    return result
+
+
+def import_students(db: Session, fileobj: BinaryIO, filename: Optional[str],
+                    chunk_size: Optional[int] = None, on_conflict: str = "skip") -> Dict[str, Any]:
+    """
+    导入学生名单，返回与原接口一致的结果结构（update 模式额外返回 updated_count）。
+    文件读取失败或缺少必要列时抛出 ImportFileError；on_conflict=error 且存在已有学号时
+    回滚并抛出 ImportConflictError；插入失败时回滚并抛出原异常。
+    """
+    if on_conflict not in ON_CONFLICT_MODES:
+        raise ValueError(f"on_conflict 必须是 {', '.join(ON_CONFLICT_MODES)} 之一")
+
+    success_count = 0
+    updated_count = 0
+    duplicate_students: List[Dict[str, Any]] = []
+    conflicts: List[Dict[str, Any]] = []
+    error_rows: List[Dict[str, Any]] = []
+    seen_ids: Set[str] = set()
+    written_ids: List[str] = []
+
+    try:
+        for chunk in iter_import_chunks(fileobj, filename, chunk_size):
+            # 已确定要回滚时只继续收集冲突行
+            result = process_chunk(db, chunk, seen_ids, on_conflict, write=not conflicts)
+            success_count += result["success_count"]
+            updated_count += result["updated_count"]
+            duplicate_students.extend(result["duplicate_students"])
+            error_rows.extend(result["error_rows"])
+            conflicts.extend(result["conflicts"])
+            written_ids.extend(result["student_ids"])
+
+        if conflicts:
+            raise ImportConflictError(conflicts)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    roster_index.refresh(db, written_ids)
+
+    duplicate_students.sort(key=lambda item: item["row"])
+    error_rows.sort(key=lambda item: item["row"])
+    logger.info(f"学生导入完成：新增 {success_count}，更新 {updated_count}，"
+                f"重复 {len(duplicate_students)}，错误 {len(error_rows)}")
+    result = {
+        "success_count": success_count,
+        "duplicate_count": len(duplicate_students),
+        "error_count": len(error_rows),
+        "duplicate_students": duplicate_students,
+        "error_rows": error_rows,
+        "detail": f"导入完成：成功 {success_count} 条学生，重复 {len(duplicate_students)} 条，错误 {len(error_rows)} 条"
+    }
+    if on_conflict == "update":
+        result["updated_count"] = updated_count
+        result["detail"] = f"导入完成：新增 {success_count} 条学生，更新 {updated_count} 条，" \
+                           f"重复 {len(duplicate_students)} 条，错误 {len(error_rows)} 条"
+    return result
+
+
+def estimate_rows(path: str, filename: Optional[str]) -> Optional[int]:
+    """预估数据行数用于显示进度：CSV 统计换行数，XLSX 读取工作表的尺寸信息"""
+    try:
+        if (filename or "").lower().endswith(".csv"):
+            lines = 0
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    lines += block.count(b"\n")
+            return max(lines - 1, 0)
+        wb = load_workbook(path, read_only=True)
+        try:
+            max_row = wb.worksheets[0].max_row
+        finally:
+            wb.close()
+        return max(max_row - 1, 0) if max_row else None
+    except Exception:
+        return None
@@ -0,0 +1,431 @@
+"""
+持久化后台任务队列
+任务登记在 background_jobs 表中，进程重启后继续执行。任务按通道划分优先级：
+客户端数据处理（client）> 报告生成（report）> 导出（export），每个通道有独立的有界线程池和排队上限，
+低优先级通道的积压不会占用高优先级通道的线程。
+失败的任务按指数退避重试，超过最大次数后转为死信（status=dead），由管理员查看后手动重试。
+多个工作进程共享同一张表：认领任务使用条件 UPDATE，执行期间定期续租，
+租约过期（认领它的进程已退出）的任务会被重新认领。
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, func, or_, update
+
+import models
+from config import settings
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# 通道按优先级从高到低排列：(名称, 并发上限, 排队上限)
+LANES = [
+    ("client", settings.JOB_CLIENT_WORKERS, settings.JOB_CLIENT_MAX_PENDING),
+    ("report", settings.JOB_REPORT_WORKERS, settings.JOB_REPORT_MAX_PENDING),
+    ("export", settings.EXPORT_JOB_WORKERS, settings.EXPORT_JOB_MAX_PENDING),
+]
+
+JOB_STATUSES = ("queued", "running", "completed", "dead")
+
+
+class JobQueueFullError(RuntimeError):
+    """通道排队中的任务已达上限"""
+
+
+def retry_delay(attempts: int) -> float:
+    """第 attempts 次执行失败后的退避秒数"""
+    return min(settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_SECONDS)
+
+
+def _claimable(now: datetime):
+    """可认领的任务：到期的排队任务，或租约已过期且未用尽执行次数的执行中任务"""
+    Job = models.BackgroundJob
+    return or_(
+        and_(Job.status == "queued", Job.run_after <= now),
+        and_(Job.status == "running", Job.lease_until < now, Job.attempts < Job.max_attempts),
+    )
+
+
+def _abandoned(now: datetime):
+    """租约已过期且执行次数已用尽的任务：执行进程在处理函数返回前退出（如处理函数使进程崩溃），不会再走到失败处理"""
+    Job = models.BackgroundJob
+    return and_(Job.status == "running", Job.lease_until < now, Job.attempts >= Job.max_attempts)
+
+
+class JobQueue:
+    """后台任务队列：一个调度线程按优先级认领任务，交给各通道的线程池执行"""
+
+    def __init__(self, lanes):
+        self.lanes = {name: {"workers": workers, "max_pending": max_pending} for name, workers, max_pending in lanes}
+        self.handlers: Dict[str, Dict[str, Any]] = {}
+        self.worker_id = None
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._running: Dict[str, set] = {name: set() for name in self.lanes}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, kind: str, lane: str, max_attempts: Optional[int] = None):
+        """注册任务处理函数的装饰器；处理函数以 payload 为关键字参数调用，返回值需可 JSON 序列化"""
+        if lane not in self.lanes:
+            raise ValueError(f"未知的任务通道: {lane}")
+
+        def decorator(handler: Callable):
+            self.handlers[kind] = {"handler": handler, "lane": lane,
+                                   "max_attempts": max_attempts or settings.JOB_MAX_ATTEMPTS}
+            return handler
+        return decorator
+
+    def enqueue(self, kind: str, payload: Optional[Dict[str, Any]] = None,
+                job_id: Optional[str] = None) -> models.BackgroundJob:
+        """登记任务并唤醒调度线程；通道排队任务过多时抛出 JobQueueFullError"""
+        spec = self.handlers.get(kind)
+        if spec is None:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        lane = spec["lane"]
+        db = SessionLocal()
+        try:
+            pending = db.query(func.count(models.BackgroundJob.id)).filter(
+                models.BackgroundJob.lane == lane, models.BackgroundJob.status == "queued"
+            ).scalar()
+            if pending >= self.lanes[lane]["max_pending"]:
+                raise JobQueueFullError(f"{lane} 通道排队中的任务已达上限 ({self.lanes[lane]['max_pending']})")
+            job = models.BackgroundJob(
+                id=job_id or uuid.uuid4().hex,
+                kind=kind,
+                lane=lane,
+                status="queued",
+                payload=json.dumps(payload or {}, ensure_ascii=False, default=str),
+                attempts=0,
+                max_attempts=spec["max_attempts"],
+                run_after=datetime.utcnow(),
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+        finally:
+            db.close()
+        self._wakeup.set()
+        return job
+
+    def start(self):
+        """启动调度线程（应用启动时调用）"""
+        if self._thread and self._thread.is_alive():
+            return
+        # 在启动时取进程号，多进程部署时每个工作进程各自认领任务
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping.clear()
+        for name, lane in self.lanes.items():
+            self._executors[name] = ThreadPoolExecutor(max_workers=lane["workers"], thread_name_prefix=f"job-{name}")
+        self._thread = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> int:
+        """
+        停止认领新任务并等待执行中的任务结束（应用关闭时调用）
+
+        超过 timeout 秒仍未结束的任务释放回队列且不计执行次数，由其他进程或下次启动立即重新认领；
+        排队中的任务已持久化，不受影响。返回释放的任务数。
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            # 调度线程退出后不再续租，先续一次覆盖等待时间
+            self._renew_leases()
+        except Exception as e:
+            logger.error(f"续租后台任务失败: {e}")
+        with self._idle:
+            while any(self._running.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._idle.wait(remaining)
+            unfinished = [job_id for running in self._running.values() for job_id in running]
+        released = self._release(unfinished) if unfinished else 0
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = {}
+        return released
+
+    def get(self, job_id: str) -> Optional[models.BackgroundJob]:
+        db = SessionLocal()
+        try:
+            job = db.get(models.BackgroundJob, job_id)
+            if job is not None:
+                db.expunge(job)
+            return job
+        finally:
+            db.close()
+
+    def list_jobs(self, status: Optional[str] = None, lane: Optional[str] = None,
+                  limit: int = 100) -> List[models.BackgroundJob]:
+        """按创建时间倒序列出任务"""
+        db = SessionLocal()
+        try:
+            query = db.query(models.BackgroundJob)
+            if status:
+                query = query.filter(models.BackgroundJob.status == status)
+            if lane:
+                query = query.filter(models.BackgroundJob.lane == lane)
+            jobs = query.order_by(models.BackgroundJob.created_at.desc()).limit(limit).all()
+            db.expunge_all()
+            return jobs
+        finally:
+            db.close()
+
+    def active_job_ids(self, kind: str) -> List[str]:
+        """某类任务中排队或执行中的任务ID（包括其他进程认领的任务）"""
+        db = SessionLocal()
+        try:
+            return [row[0] for row in db.query(models.BackgroundJob.id).filter(
+                models.BackgroundJob.kind == kind,
+                models.BackgroundJob.status.in_(["queued", "running"]))]
+        finally:
+            db.close()
+
+    def retry(self, job_id: str) -> Optional[models.BackgroundJob]:
+        """把死信任务重新排队，执行次数清零"""
+        db = SessionLocal()
+        try:
+            job = db.get(models.BackgroundJob, job_id)
+            if job is None:
+                return None
+            if job.status != "dead":
+                raise ValueError("只能重试死信任务")
+            job.status = "queued"
+            job.attempts = 0
+            job.run_after = datetime.utcnow()
+            job.finished_at = None
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+        finally:
+            db.close()
+        self._wakeup.set()
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        """各通道的并发上限、本进程执行中的任务数和各状态任务数"""
+        db = SessionLocal()
+        try:
+            counts = db.query(models.BackgroundJob.lane, models.BackgroundJob.status,
+                              func.count(models.BackgroundJob.id)) \
+                .group_by(models.BackgroundJob.lane, models.BackgroundJob.status).all()
+        finally:
+            db.close()
+        lanes = {}
+        for priority, (name, lane) in enumerate(self.lanes.items()):
+            with self._lock:
+                running_here = len(self._running[name])
+            lanes[name] = {"priority": priority, "workers": lane["workers"], "max_pending": lane["max_pending"],
+                           "running_in_process": running_here, **{status: 0 for status in JOB_STATUSES}}
+        for lane, status, count in counts:
+            if lane in lanes:
+                lanes[lane][status] = count
+        return {"worker": self.worker_id, "lanes": lanes}
+
+    def saturation(self) -> Dict[str, Dict[str, Any]]:
+        """本进程各通道线程池的占用情况，不查询数据库"""
+        with self._lock:
+            return {name: {"workers": lane["workers"], "running": len(self._running[name]),
+                           "saturation": round(len(self._running[name]) / lane["workers"], 2)}
+                    for name, lane in self.lanes.items()}
+
+    def purge(self) -> int:
+        """删除超过保留时长的已完成任务；死信保留到管理员处理"""
+        cutoff = datetime.utcnow() - timedelta(hours=settings.JOB_RETENTION_HOURS)
+        db = SessionLocal()
+        try:
+            deleted = db.execute(delete(models.BackgroundJob).where(
+                models.BackgroundJob.status == "completed", models.BackgroundJob.finished_at < cutoff
+            )).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def _dispatch_loop(self):
+        last_purge = 0.0
+        while not self._stopping.is_set():
+            try:
+                self._bury_abandoned()
+                self._dispatch_once()
+                self._renew_leases()
+                if time.monotonic() - last_purge > 3600:
+                    self.purge()
+                    last_purge = time.monotonic()
+            except Exception as e:
+                logger.error(f"后台任务调度失败: {e}", exc_info=True)
+            self._wakeup.wait(settings.JOB_POLL_SECONDS)
+            self._wakeup.clear()
+
+    def _dispatch_once(self):
+        """按优先级依次为各通道认领任务，每个通道最多认领到空闲线程数"""
+        for name, lane in self.lanes.items():
+            with self._lock:
+                free = lane["workers"] - len(self._running[name])
+            if free <= 0:
+                continue
+            for job_id, kind, payload in self._claim(name, free):
+                with self._lock:
+                    self._running[name].add(job_id)
+                self._executors[name].submit(self._execute, name, job_id, kind, payload)
+
+    def _claim(self, lane: str, limit: int):
+        """条件 UPDATE 认领任务：另一个进程先认领的任务 rowcount 为 0，自然跳过"""
+        Job = models.BackgroundJob
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            candidates = [row[0] for row in db.query(Job.id).filter(Job.lane == lane, _claimable(now))
+                          .order_by(Job.run_after).limit(limit)]
+            claimed = []
+            for job_id in candidates:
+                result = db.execute(update(Job).where(Job.id == job_id, _claimable(now)).values(
+                    status="running", worker=self.worker_id, attempts=Job.attempts + 1, started_at=now,
+                    lease_until=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                ))
+                if result.rowcount == 1:
+                    claimed.append(job_id)
+            db.commit()
+            if not claimed:
+                return []
+            return db.query(Job.id, Job.kind, Job.payload).filter(Job.id.in_(claimed)).order_by(Job.run_after).all()
+        finally:
+            db.close()
+
+    def _bury_abandoned(self):
+        """租约过期的任务已用尽执行次数时直接转为死信，不再重新认领"""
+        Job = models.BackgroundJob
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            buried = db.execute(update(Job).where(_abandoned(now)).values(
+                status="dead", finished_at=now, lease_until=None,
+                last_error="执行进程在租约期内退出，执行次数已用尽",
+            )).rowcount
+            db.commit()
+        finally:
+            db.close()
+        if buried:
+            logger.warning(f"{buried} 个后台任务的执行进程在租约期内退出且执行次数已用尽，转为死信")
+
+    def _renew_leases(self):
+        with self._lock:
+            job_ids = [job_id for running in self._running.values() for job_id in running]
+        if not job_ids:
+            return
+        db = SessionLocal()
+        try:
+            db.execute(update(models.BackgroundJob).where(
+                models.BackgroundJob.id.in_(job_ids), models.BackgroundJob.worker == self.worker_id
+            ).values(lease_until=datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS)))
+            db.commit()
+        finally:
+            db.close()
+
+    def _execute(self, lane: str, job_id: str, kind: str, payload: Optional[str]):
+        try:
+            spec = self.handlers.get(kind)
+            if spec is None:
+                raise LookupError(f"未注册的任务类型: {kind}")
+            result = spec["handler"](**json.loads(payload or "{}"))
+            self._finish(job_id, result)
+        except Exception:
+            logger.error(f"后台任务 {kind} ({job_id}) 失败", exc_info=True)
+            self._fail(job_id, traceback.format_exc())
+        finally:
+            with self._lock:
+                self._running[lane].discard(job_id)
+                self._idle.notify_all()
+            # 空出线程后立即调度下一个任务
+            self._wakeup.set()
+
+    def _release(self, job_ids: List[str]) -> int:
+        """把本进程未执行完的任务放回队列，本次执行不计入执行次数"""
+        Job = models.BackgroundJob
+        db = SessionLocal()
+        try:
+            released = db.execute(update(Job).where(
+                Job.id.in_(job_ids), Job.worker == self.worker_id, Job.status == "running"
+            ).values(status="queued", worker=None, lease_until=None, run_after=datetime.utcnow(),
+                     attempts=Job.attempts - 1)).rowcount
+            db.commit()
+            return released
+        finally:
+            db.close()
+
+    def _finish(self, job_id: str, result: Any):
+        # 任务已被释放或租约过期后被其他进程认领时，不覆盖新的执行状态
+        Job = models.BackgroundJob
+        db = SessionLocal()
+        try:
+            db.execute(update(Job).where(
+                Job.id == job_id, Job.worker == self.worker_id, Job.status == "running"
+            ).values(
+                status="completed", finished_at=datetime.utcnow(), lease_until=None, last_error=None,
+                result=json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    def _fail(self, job_id: str, error: str):
+        """未用尽执行次数的任务按退避时间重新排队，否则转为死信"""
+        db = SessionLocal()
+        try:
+            job = db.get(models.BackgroundJob, job_id)
+            if job is None or job.worker != self.worker_id or job.status != "running":
+                return
+            now = datetime.utcnow()
+            job.last_error = error
+            job.lease_until = None
+            if job.attempts >= job.max_attempts:
+                job.status = "dead"
+                job.finished_at = now
+                logger.warning(f"后台任务 {job.kind} ({job_id}) 已失败 {job.attempts} 次，转为死信")
+            else:
+                job.status = "queued"
+                job.run_after = now + timedelta(seconds=retry_delay(job.attempts))
+            db.commit()
+        finally:
+            db.close()
+
+
+def job_to_dict(job: models.BackgroundJob) -> dict:
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "lane": job.lane,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "run_after": job.run_after,
+        "worker": job.worker,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.last_error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+# 初始化全局任务队列
+job_queue = JobQueue(LANES)
@@ -0,0 +1,24 @@
+"""
+后台报告生成任务
+批量生成报告登记为后台任务队列 report 通道中的任务，接口立即返回任务ID，结果通过任务查询接口获取。
+"""
+
+from typing import List
+
+import crud
+from services.job_queue import job_queue
+from utils.concurrent import session_scope
+
+
+@job_queue.register("batch_reports", lane="report")
+def run_batch_reports(record_ids: List[int], format: str) -> dict:
+    """队列任务处理函数：已被删除的检测记录计入失败数"""
+    # reportlab 在首次生成报告时才加载
+    from services.report_service import generate_batch_reports
+
+    with session_scope() as db:
+        records = [record for record in (crud.get_test_record_detail(db, record_id) for record_id in record_ids)
+                   if record is not None]
+        result = generate_batch_reports(db, records, format)
+    result["failed_count"] += len(record_ids) - len(records)
+    return result
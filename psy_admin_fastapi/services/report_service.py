@@ -1,3 +1,4 @@
+import logging
 import os
 from datetime import datetime
 from sqlalchemy.orm import Session
@@ -7,7 +8,10 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import pandas as pd
 
-from models import Student, Test, Score, PhysiologicalData
+from models import Student, Test
+from utils.report_files import atomic_report_path
+
+logger = logging.getLogger(__name__)
 
 # 报告存储目录配置
 REPORT_DIR = "reports"
@@ -36,19 +40,14 @@ def generate_report_content(db: Session, student_id: str) -> str:
     if not student:
         raise ValueError("Student not found")
 
-    tests = db.query(Test).join(Student).filter(Student.id == student.id).all()
+    # 得分和生理数据在检测记录的紧凑列中，一次查询即可
+    tests = db.query(Test).filter(Test.student_fk_id == student.id).all()
     if not tests:
         return "该学生暂无检测记录"
 
     # 过滤掉没有实际检测数据的空记录（既没有问卷得分也没有生理数据）
-    valid_tests = []
-    for test in tests:
-        scores = db.query(Score).filter(Score.test_fk_id == test.id).all()
-        phys_data = db.query(PhysiologicalData).filter(PhysiologicalData.test_fk_id == test.id).all()
-        # 只保留有问卷得分或生理数据的记录
-        if scores or phys_data:
-            valid_tests.append(test)
-    
+    valid_tests = [test for test in tests if test.score_list or test.phys_list]
+
     if not valid_tests:
         return "该学生暂无检测记录"
 
@@ -72,16 +71,16 @@ def generate_report_content(db: Session, student_id: str) -> str:
         ])
 
         # 添加问卷得分
-        scores = db.query(Score).filter(Score.test_fk_id == test.id).all()
+        scores = test.score_list
         if scores:
             content.append("问卷得分:")
-            content.extend([f"- {s.module_name}: {s.score}" for s in scores])
+            content.extend([f"- {s['module_name']}: {s['score']}" for s in scores])
 
         # 添加生理数据
-        phys_data = db.query(PhysiologicalData).filter(PhysiologicalData.test_fk_id == test.id).all()
+        phys_data = test.phys_list
         if phys_data:
             content.append("生理数据:")
-            content.extend([f"- {d.data_key}: {d.data_value}" for d in phys_data])
+            content.extend([f"- {d['data_key']}: {d['data_value']}" for d in phys_data])
 
         content.append("")  # 空行分隔
 
@@ -97,23 +96,24 @@ def generate_pdf_report(content: str, student_id: str, student_name: str = "Stud
     filename = f"{safe_name}_{student_id}.pdf"
     filepath = os.path.join(REPORT_DIR, filename)
 
-    # 创建PDF文档
-    c = canvas.Canvas(filepath, pagesize=letter)
-    width, height = letter
-    margin = 50
-    y_pos = height - margin
-
-    # 设置中文字体和内容
-    c.setFont(chinese_font, 12)
-    for line in content.split("\n"):
-        if y_pos < margin:
-            c.showPage()
-            c.setFont(chinese_font, 12)
-            y_pos = height - margin
-        c.drawString(margin, y_pos, line)
-        y_pos -= 15  # 行间距
-
-    c.save()
+    # 创建PDF文档（写完后再替换为正式文件名）
+    with atomic_report_path(filepath) as tmp_path:
+        c = canvas.Canvas(tmp_path, pagesize=letter)
+        width, height = letter
+        margin = 50
+        y_pos = height - margin
+
+        # 设置中文字体和内容
+        c.setFont(chinese_font, 12)
+        for line in content.split("\n"):
+            if y_pos < margin:
+                c.showPage()
+                c.setFont(chinese_font, 12)
+                y_pos = height - margin
+            c.drawString(margin, y_pos, line)
+            y_pos -= 15  # 行间距
+
+        c.save()
     return filepath
 
 def generate_excel_report(db: Session, student_id: str) -> str:
@@ -122,19 +122,13 @@ def generate_excel_report(db: Session, student_id: str) -> str:
     if not student:
         raise ValueError("Student not found")
 
-    tests = db.query(Test).join(Student).filter(Student.id == student.id).all()
+    tests = db.query(Test).filter(Test.student_fk_id == student.id).all()
     if not tests:
         raise ValueError("No test records")
 
     # 过滤掉没有实际检测数据的空记录（既没有问卷得分也没有生理数据）
-    valid_tests = []
-    for test in tests:
-        scores = db.query(Score).filter(Score.test_fk_id == test.id).all()
-        phys_data = db.query(PhysiologicalData).filter(PhysiologicalData.test_fk_id == test.id).all()
-        # 只保留有问卷得分或生理数据的记录
-        if scores or phys_data:
-            valid_tests.append(test)
-    
+    valid_tests = [test for test in tests if test.score_list or test.phys_list]
+
     if not valid_tests:
         raise ValueError("No test records with actual data")
 
@@ -155,22 +149,22 @@ def generate_excel_report(db: Session, student_id: str) -> str:
         }
 
         # 添加问卷得分数据
-        for score in db.query(Score).filter(Score.test_fk_id == test.id).all():
+        for score in test.score_list:
             row = base_info.copy()
             row.update({
                 "数据类型": "问卷得分",
-                "项目名称": score.module_name,
-                "数值": score.score
+                "项目名称": score["module_name"],
+                "数值": score["score"]
             })
             data.append(row)
 
         # 添加生理数据
-        for phys in db.query(PhysiologicalData).filter(PhysiologicalData.test_fk_id == test.id).all():
+        for phys in test.phys_list:
             row = base_info.copy()
             row.update({
                 "数据类型": "生理数据",
-                "项目名称": phys.data_key,
-                "数值": phys.data_value
+                "项目名称": phys["data_key"],
+                "数值": phys["data_value"]
             })
             data.append(row)
 
@@ -180,6 +174,34 @@ def generate_excel_report(db: Session, student_id: str) -> str:
     safe_name = "".join(c for c in student.name if c.isalnum() or c in (" ", "-", "_"))
     filename = f"{safe_name}_{student_id}.xlsx"
     filepath = os.path.join(REPORT_DIR, filename)
-    df.to_excel(filepath, index=False)
+    with atomic_report_path(filepath) as tmp_path:
+        df.to_excel(tmp_path, index=False)
 
     return filepath
+
+def generate_batch_reports(db: Session, records, format: str) -> dict:
+    """为多条检测记录逐条生成报告，单条失败只计入失败数"""
+    report_files = []
+    for record in records:
+        try:
+            student_id = record.student.student_id
+            if format == "pdf":
+                content = generate_report_content(db, student_id)
+                filepath = generate_pdf_report(content, student_id, record.student.name or "Student")
+            else:
+                filepath = generate_excel_report(db, student_id)
+
+            if os.path.exists(filepath):
+                report_files.append({
+                    "record_id": record.id,
+                    "student_id": student_id,
+                    "file_path": filepath,
+                    "file_name": os.path.basename(filepath)
+                })
+        except Exception as e:
+            logger.error(f"为记录 {record.id} 生成报告失败: {e}")
+    return {
+        "message": f"成功生成 {len(report_files)} 份报告",
+        "report_files": report_files,
+        "failed_count": len(records) - len(report_files),
+    }
@@ -1,86 +1,238 @@
+"""
+后台线程池与数据库会话作用域
+- session_scope：线程内的会话作用域，正常结束提交、异常回滚、最后关闭；嵌套调用复用最外层的会话，
+  由最外层负责提交和关闭
+- WorkerPool：有界线程池，submit_with_session 为每个任务打开独立的会话作用域，并统计排队、执行和等待时长
+- 线程池和进程池大小按数据库连接池容量和 CPU 核数校验，超出时收紧，启动时记录警告
+"""
+
+import functools
+import inspect
+import os
 import threading
-from concurrent.futures import ThreadPoolExecutor
-from queue import Queue
-from typing import Callable, Any
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
-from database import SessionLocal  # 导入数据库会话工厂
+from sqlalchemy.pool import QueuePool
+
+from config import settings
+from database import SessionLocal, engine  # 导入数据库会话工厂
 
-# 线程本地存储：用于保存每个线程的数据库会话
+# 线程本地存储：保存当前线程最外层作用域的数据库会话
 thread_local = threading.local()
 
-class ThreadPoolManager:
-    """ThreadPoolExecutor 单例管理器"""
-    _instance = None
-    _lock = threading.Lock()
 
-    def __new__(cls):
-        if not cls._instance:
-            with cls._lock:
-                if not cls._instance:
-                    cls._instance = super().__new__(cls)
-                    cls._instance.executor = ThreadPoolExecutor(max_workers=4)
-        return cls._instance
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    数据库会话作用域
 
-    def submit(self, func: Callable, *args, **kwargs) -> Any:
-        """提交任务到线程池"""
-        return self.executor.submit(func, *args, **kwargs)
+    提交时不过期对象，任务返回的 ORM 对象在会话关闭后仍可读取已加载的属性。
+    """
+    outer = getattr(thread_local, "db", None)
+    if outer is not None:
+        yield outer
+        return
 
-    def shutdown(self, wait: bool = True):
-        """关闭线程池"""
-        self.executor.shutdown(wait=wait)
+    db = SessionLocal(expire_on_commit=False)
+    thread_local.db = db
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        thread_local.db = None
+        db.close()
 
-# 初始化线程池管理器
-thread_pool = ThreadPoolManager()
 
 def thread_safe_db(func: Callable) -> Callable:
-    """线程安全的数据库操作装饰器：为每个线程创建独立的DB会话"""
+    """会话作用域装饰器：函数声明了 db 参数且调用方未传入时注入会话，嵌套调用共用最外层的会话"""
+    accepts_db = "db" in inspect.signature(func).parameters
+
+    @functools.wraps(func)
     def wrapper(*args, **kwargs) -> Any:
-        # 为当前线程创建独立的数据库会话
-        if not hasattr(thread_local, "db"):
-            thread_local.db = SessionLocal()
-        
-        try:
-            # 将db会话注入到函数参数（如果函数接受db参数）
-            if "db" in func.__code__.co_varnames:
-                kwargs["db"] = thread_local.db
+        if not accepts_db or "db" in kwargs:
             return func(*args, **kwargs)
-        finally:
-            # 确保会话关闭（避免连接泄漏）
-            if hasattr(thread_local, "db"):
-                thread_local.db.close()
-                del thread_local.db
+        with session_scope() as db:
+            return func(*args, db=db, **kwargs)
     return wrapper
 
-class TaskQueue:
-    """简单的任务队列实现"""
-    def __init__(self):
-        self.queue = Queue()
-        self.is_running = False
-
-    def start(self):
-        """启动任务队列消费线程"""
-        if self.is_running:
-            return
-        self.is_running = True
-        thread_pool.submit(self._process_tasks)
-
-    def stop(self):
-        """停止任务队列"""
-        self.is_running = False
-
-    def add_task(self, func: Callable, *args, **kwargs):
-        """添加任务到队列"""
-        self.queue.put((func, args, kwargs))
-
-    def _process_tasks(self):
-        """消费队列中的任务"""
-        while self.is_running:
-            try:
-                func, args, kwargs = self.queue.get(timeout=1)
-                thread_pool.submit(func, *args, **kwargs)
-                self.queue.task_done()
-            except Exception:
-                continue
-
-# 初始化全局任务队列
-task_queue = TaskQueue()
+
+def _call_with_session(func: Callable, *args, **kwargs) -> Any:
+    with session_scope() as db:
+        return func(db, *args, **kwargs)
+
+
+def db_pool_capacity(bind: Engine = engine) -> Optional[int]:
+    """连接池最多可同时检出的连接数；不限制溢出或不使用 QueuePool 时返回 None"""
+    pool = bind.pool
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return None
+    return pool.size() + pool._max_overflow
+
+
+def db_pool_stats(bind: Engine = engine) -> Dict[str, Any]:
+    """连接池使用情况"""
+    pool = bind.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    capacity = db_pool_capacity(bind)
+    checked_out = pool.checkedout()
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "capacity": capacity,
+        "checked_out": checked_out,
+        "overflow": max(pool.overflow(), 0),
+        "saturation": round(checked_out / capacity, 2) if capacity else None,
+    }
+
+
+def background_threads() -> Dict[str, int]:
+    """各后台线程池的大小：其中每个线程执行任务时最多持有一个数据库连接"""
+    return {
+        "worker": settings.WORKER_THREADS,
+        "job_client": settings.JOB_CLIENT_WORKERS,
+        "job_report": settings.JOB_REPORT_WORKERS,
+        "job_export": settings.EXPORT_JOB_WORKERS,
+        "import": settings.IMPORT_JOB_WORKERS,
+    }
+
+
+def validate_pool_sizes(bind: Engine = engine) -> List[str]:
+    """校验线程池和进程池大小，返回警告信息"""
+    warnings = []
+    capacity = db_pool_capacity(bind)
+    if capacity is not None:
+        if settings.WORKER_THREADS > capacity:
+            warnings.append(f"WORKER_THREADS={settings.WORKER_THREADS} 超过数据库连接池容量 {capacity}，"
+                            f"按 {capacity} 创建线程池")
+        total = sum(background_threads().values())
+        if total > capacity:
+            warnings.append(f"后台线程共 {total} 个，超过数据库连接池容量 {capacity}（DB_POOL_SIZE + DB_MAX_OVERFLOW），"
+                            f"同时执行时请求可能等待 DB_POOL_TIMEOUT 后失败")
+    cpus = os.cpu_count() or 1
+    if settings.FEATURE_WORKERS > cpus:
+        warnings.append(f"FEATURE_WORKERS={settings.FEATURE_WORKERS} 超过 CPU 核数 {cpus}，按 {cpus} 创建进程池")
+    return warnings
+
+
+def thread_pool_size(requested: int, bind: Engine = engine) -> int:
+    """按数据库连接池容量收紧线程池大小，至少为 1"""
+    capacity = db_pool_capacity(bind)
+    if capacity is not None:
+        requested = min(requested, capacity)
+    return max(requested, 1)
+
+
+def process_pool_size(requested: int) -> int:
+    """按 CPU 核数收紧进程池大小；0 表示不使用进程池"""
+    return min(max(requested, 0), os.cpu_count() or 1)
+
+
+class WorkerPoolClosedError(RuntimeError):
+    """线程池已关闭（应用正在关闭），不再接受新任务"""
+
+
+class WorkerPool:
+    """有界线程池：记录排队、执行、完成和失败的任务数，以及任务在队列中的等待时长"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._queued = 0
+        self._active = 0
+        self._peak_active = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """提交任务到线程池"""
+        with self._lock:
+            if self._closed:
+                raise WorkerPoolClosedError(f"线程池 {self.name} 已关闭")
+            self._queued += 1
+        return self.executor.submit(self._run, time.monotonic(), func, args, kwargs)
+
+    def submit_with_session(self, func: Callable, *args, **kwargs) -> Future:
+        """提交需要数据库的任务：以 func(db, *args, **kwargs) 调用，正常返回后提交，抛出异常时回滚"""
+        return self.submit(_call_with_session, func, *args, **kwargs)
+
+    def _run(self, submitted: float, func: Callable, args: tuple, kwargs: dict) -> Any:
+        waited = time.monotonic() - submitted
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._peak_active = max(self._peak_active, self._active)
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            with self._lock:
+                self._active -= 1
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                self._idle.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """线程池饱和度：执行中的任务数占线程数的比例，排队任务数和平均等待时长"""
+        with self._lock:
+            started = self._completed + self._failed + self._active
+            return {
+                "max_workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "peak_active": self._peak_active,
+                "completed": self._completed,
+                "failed": self._failed,
+                "saturation": round(self._active / self.max_workers, 2),
+                "avg_wait_ms": round(self._wait_total / started * 1000, 1) if started else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 1),
+            }
+
+    def close(self, timeout: Optional[float] = None) -> int:
+        """
+        停止接受新任务，等待排队和执行中的任务结束（应用关闭时调用）
+
+        超过 timeout 秒后取消仍在排队的任务，返回未完成的任务数。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            self._closed = True
+            while self._queued or self._active:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._idle.wait(remaining)
+            unfinished = self._queued + self._active
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        return unfinished
+
+    def shutdown(self, wait: bool = True):
+        """关闭线程池"""
+        with self._lock:
+            self._closed = True
+        self.executor.shutdown(wait=wait)
+
+
+# 初始化线程池
+thread_pool = WorkerPool("worker", thread_pool_size(settings.WORKER_THREADS))
@@ -0,0 +1,340 @@
+"""
+慢查询监控
+通过引擎事件为每条 SQL 计时，按语句形状（参数占位、IN 列表折叠后的 SQL）汇总次数和耗时；
+超过阈值的语句连同参数、调用它的 crud 函数写入滚动慢查询日志，
+每种语句形状第一次变慢时抓取一次 EXPLAIN 执行计划。
+
+请求级查询计数
+QueryCounterMiddleware 统计每个请求的 SQL 条数、读取行数和数据库耗时，写入 Server-Timing 响应头；
+同一语句形状在一个请求内重复超过 N_PLUS_ONE_THRESHOLD 次时记录 N+1 警告；
+接口用 query_budget 声明查询预算，严格模式（QUERY_BUDGET_STRICT）下超出预算直接抛错，用于测试。
+"""
+
+import contextvars
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 折叠 IN (?, ?, ?) / VALUES (...), (...) 等长度可变的占位符列表，使同一语句只对应一种形状
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+_REPEATED_GROUPS = re.compile(r"(\(\?\.\.\.\))(?:\s*,\s*\(\?\.\.\.\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+# 抓取执行计划的语句类型；INSERT 的计划没有参考价值
+_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+_THIS_FILE = os.path.normcase(os.path.abspath(__file__))
+
+
+def statement_shape(statement: str) -> str:
+    """把 SQL 归一化为语句形状"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _PLACEHOLDER_LIST.sub("(?...)", shape)
+    return _REPEATED_GROUPS.sub(r"\1, ...", shape)
+
+
+def _find_caller() -> Optional[str]:
+    """沿调用栈找到第一个项目内（非 SQLAlchemy、非本模块）的函数，优先返回 crud.py 中的函数"""
+    frame = sys._getframe(2)
+    first_app_frame = None
+    while frame is not None:
+        filename = os.path.normcase(os.path.abspath(frame.f_code.co_filename))
+        if (filename != _THIS_FILE and not frame.f_code.co_filename.startswith("<")
+                and "sqlalchemy" not in filename and "site-packages" not in filename):
+            location = f"{os.path.basename(filename)}:{frame.f_code.co_name}:{frame.f_lineno}"
+            if os.path.basename(filename) == "crud.py":
+                return location
+            first_app_frame = first_app_frame or location
+        frame = frame.f_back
+    return first_app_frame
+
+
+def _short_params(parameters: Any, limit: int = 500) -> str:
+    text = repr(parameters)
+    return text if len(text) <= limit else f"{text[:limit]}...（共 {len(text)} 字符）"
+
+
+class QueryMonitor:
+    """按语句形状汇总 SQL 耗时，记录慢查询"""
+
+    def __init__(self, threshold_ms: float = 200, log_path: Optional[str] = None,
+                 max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5, max_shapes: int = 2000):
+        self.threshold_ms = threshold_ms
+        self.max_shapes = max_shapes
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._engines = set()
+        self.slow_logger = logging.getLogger("slow_query")
+        self.slow_logger.propagate = False
+        self.slow_logger.setLevel(logging.INFO)
+        if log_path and not self.slow_logger.handlers:
+            os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+            handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count,
+                                          encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s", "%Y-%m-%d %H:%M:%S"))
+            self.slow_logger.addHandler(handler)
+
+    def install(self, engine: Engine):
+        """在引擎上注册计时事件，重复调用只注册一次"""
+        if id(engine) in self._engines:
+            return
+        self._engines.add(id(engine))
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    def _handle_error(self, exception_context):
+        """执行失败的语句不会触发 after_cursor_execute，在这里弹出它的开始时间，避免与后续语句错配"""
+        conn = exception_context.connection
+        if conn is None or exception_context.statement is None:
+            return
+        starts = conn.info.get("query_start_time")
+        if starts:
+            starts.pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start_time")
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        shape = statement_shape(statement)
+        slow = elapsed_ms >= self.threshold_ms
+
+        with self._lock:
+            stats = self._stats.get(shape)
+            if stats is None:
+                if len(self._stats) >= self.max_shapes:
+                    # 语句形状过多时丢弃累计耗时最少的一个，避免内存无限增长
+                    del self._stats[min(self._stats, key=lambda k: self._stats[k]["total_ms"])]
+                stats = self._stats[shape] = {
+                    "shape": shape, "count": 0, "total_ms": 0.0, "max_ms": 0.0, "slow_count": 0,
+                    "caller": None, "last_slow_params": None, "plan": None,
+                }
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            need_plan = False
+            if slow:
+                stats["slow_count"] += 1
+                need_plan = stats["plan"] is None
+        if not slow:
+            return
+
+        caller = _find_caller()
+        params = _short_params(parameters)
+        plan = self._explain(conn, statement, parameters) if need_plan and not executemany else None
+        with self._lock:
+            stats["caller"] = caller
+            stats["last_slow_params"] = params
+            if plan is not None:
+                stats["plan"] = plan
+
+        message = f"{elapsed_ms:.1f}ms caller={caller} sql={shape} params={params}"
+        if plan is not None:
+            message += f" plan={plan}"
+        self.slow_logger.warning(message)
+
+    def _explain(self, conn, statement: str, parameters) -> Optional[List[str]]:
+        """用同一个 DBAPI 连接执行 EXPLAIN；不经过引擎事件，不会被再次计时"""
+        if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+        cursor = None
+        try:
+            cursor = conn.connection.dbapi_connection.cursor()
+            cursor.execute(prefix + statement, parameters)
+            return [" | ".join(str(col) for col in row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.debug(f"获取执行计划失败: {e}")
+            return [f"EXPLAIN 失败: {e}"]
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def top(self, n: int = 20, order_by: str = "total_ms") -> List[Dict[str, Any]]:
+        """按累计耗时（或 max_ms、count、slow_count）排序的前 N 种语句形状"""
+        with self._lock:
+            rows = [dict(stats) for stats in self._stats.values()]
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        for row in rows[:n]:
+            row["avg_ms"] = round(row["total_ms"] / row["count"], 3) if row["count"] else 0.0
+            row["total_ms"] = round(row["total_ms"], 3)
+            row["max_ms"] = round(row["max_ms"], 3)
+        return rows[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# 全局查询监控
+query_monitor = QueryMonitor(
+    threshold_ms=settings.SLOW_QUERY_MS,
+    log_path=settings.SLOW_QUERY_LOG,
+    max_bytes=settings.SLOW_QUERY_LOG_MAX_MB * 1024 * 1024,
+    backup_count=settings.SLOW_QUERY_LOG_BACKUPS,
+)
+
+
+# === 请求级查询计数 ===
+
+class QueryBudgetExceeded(AssertionError):
+    """严格模式下接口的 SQL 条数超出 query_budget 声明的预算"""
+
+
+class RequestQueryStats:
+    """单个请求内的 SQL 统计"""
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.db_ms = 0.0
+        self.shapes: Counter = Counter()
+        self._starts: List[float] = []
+
+    def repeated_shapes(self, threshold: int) -> List[tuple]:
+        """请求内重复次数超过阈值的语句形状，疑似 N+1 查询"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.db_ms:.2f};desc="{self.queries} queries, {self.rows} rows"'
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestQueryStats]] = contextvars.ContextVar(
+    "request_query_stats", default=None
+)
+
+
+class _CountingCursor:
+    """包装 DBAPI 游标，统计结果集实际读取的行数"""
+
+    def __init__(self, cursor, stats: RequestQueryStats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _count_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats._starts.append(time.perf_counter())
+
+
+def _count_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is None or not stats._starts:
+        return
+    stats.db_ms += (time.perf_counter() - stats._starts.pop()) * 1000
+    stats.queries += 1
+    stats.shapes[statement_shape(statement)] += 1
+    # 结果集由 SQLAlchemy 通过 context.cursor 读取，换成计数游标即可统计读取行数
+    if context is not None and cursor.description is not None:
+        context.cursor = _CountingCursor(cursor, stats)
+
+
+def _count_handle_error(exception_context):
+    stats = _request_stats.get()
+    if stats is None or exception_context.statement is None or not stats._starts:
+        return
+    stats.db_ms += (time.perf_counter() - stats._starts.pop()) * 1000
+    stats.queries += 1
+
+
+_counter_installed = False
+
+
+def install_request_counter():
+    """在 Engine 类上注册请求计数事件，对所有引擎（含测试引擎）生效"""
+    global _counter_installed
+    if _counter_installed:
+        return
+    _counter_installed = True
+    event.listen(Engine, "before_cursor_execute", _count_before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _count_after_cursor_execute)
+    event.listen(Engine, "handle_error", _count_handle_error)
+
+
+def query_budget(max_queries: int) -> Callable:
+    """声明接口单次请求允许的最大 SQL 条数，放在 @app.get 等路由装饰器下方"""
+    def decorator(endpoint):
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+
+class QueryCounterMiddleware:
+    """统计每个请求的 SQL，写入 Server-Timing 响应头并检查 N+1 和查询预算"""
+
+    def __init__(self, app):
+        self.app = app
+        install_request_counter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                self._check(scope, stats)
+                total_ms = (time.perf_counter() - started) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", f"{stats.server_timing()}, total;dur={total_ms:.2f}".encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+
+    def _check(self, scope, stats: RequestQueryStats):
+        path = f"{scope['method']} {scope['path']}"
+        for shape, count in stats.repeated_shapes(settings.N_PLUS_ONE_THRESHOLD):
+            logger.warning(f"疑似 N+1 查询: {path} 同一语句执行 {count} 次: {shape[:300]}")
+
+        budget = getattr(scope.get("endpoint"), "query_budget", None)
+        if budget is None or stats.queries <= budget:
+            return
+        message = f"{path} 执行了 {stats.queries} 条 SQL，超出查询预算 {budget}"
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,228 @@
+"""
+导出写入工具模块
+提供按行流式写入导出文件的功能，避免一次性把全部数据加载到内存
+"""
+
+import codecs
+import csv
+import io
+import json
+import os
+import shutil
+import zipfile
+from typing import Callable, Iterable, Iterator, Optional, Sequence, Tuple
+
+from openpyxl import Workbook
+
+# 单个工作表：(工作表名, 表头, 数据行迭代器)
+SheetSpec = Tuple[str, Sequence[str], Iterable[Sequence]]
+
+
+def write_xlsx(filepath: str, sheets: Iterable[SheetSpec],
+               progress: Optional[Callable[[int], None]] = None,
+               progress_every: int = 1000) -> int:
+    """
+    以 write-only 模式流式写入 xlsx 文件
+
+    Args:
+        filepath: 目标文件路径
+        sheets: 工作表定义列表，数据行可以是任意迭代器（如数据库游标）
+        progress: 进度回调，参数为已写入的数据行数
+        progress_every: 每写入多少行回调一次进度
+
+    Returns:
+        写入的数据行总数（不含表头）
+    """
+    # write-only 工作簿逐行写入临时文件，内存占用与数据量无关
+    wb = Workbook(write_only=True)
+    written = 0
+    for title, headers, rows in sheets:
+        ws = wb.create_sheet(title=title)
+        ws.append(list(headers))
+        for row in rows:
+            ws.append(list(row))
+            written += 1
+            if progress and written % progress_every == 0:
+                progress(written)
+
+    # 先写入临时文件再重命名，避免下载到写了一半的文件
+    tmp_path = f"{filepath}.part"
+    try:
+        wb.save(tmp_path)
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if progress:
+        progress(written)
+    return written
+
+
+def _buffered(chunks: Iterable[bytes], flush_bytes: int) -> Iterator[bytes]:
+    """合并小块输出；第一块立即发送，保证首字节尽快到达客户端"""
+    buffer = []
+    size = 0
+    first = True
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if first or size >= flush_bytes:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+            first = False
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_csv(headers: Sequence[str], rows: Iterable[Sequence],
+             flush_bytes: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    把数据行流式编码为 CSV 字节块
+    输出带 UTF-8 BOM，Excel 直接打开时中文不会乱码
+    """
+    def lines():
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(headers)
+        yield codecs.BOM_UTF8 + out.getvalue().encode("utf-8")
+        for row in rows:
+            out.seek(0)
+            out.truncate()
+            writer.writerow(row)
+            yield out.getvalue().encode("utf-8")
+
+    return _buffered(lines(), flush_bytes)
+
+
+def iter_ndjson(headers: Sequence[str], rows: Iterable[Sequence],
+                flush_bytes: int = 64 * 1024) -> Iterator[bytes]:
+    """把数据行流式编码为 NDJSON（每行一个 JSON 对象）字节块"""
+    def lines():
+        for row in rows:
+            record = dict(zip(headers, row))
+            yield (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+    return _buffered(lines(), flush_bytes)
+
+
+class ColumnarExportUnavailable(RuntimeError):
+    """未安装 pyarrow，无法进行 Parquet/Arrow 导出"""
+
+
+def _require_pyarrow():
+    """pyarrow 为可选依赖，只有列式导出需要"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ColumnarExportUnavailable("Parquet/Arrow 导出需要安装 pyarrow：pip install pyarrow") from e
+    return pyarrow
+
+
+def _arrow_schema(pa, fields: Sequence[Tuple[str, str]]):
+    type_map = {
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "string": pa.string(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("us"),
+    }
+    return pa.schema([(name, type_map[type_name]) for name, type_name in fields])
+
+
+def _open_columnar_writer(pa, path: str, schema, format: str):
+    if format == "parquet":
+        return pa.parquet.ParquetWriter(path, schema, compression="snappy")
+    return pa.ipc.new_file(path, schema)
+
+
+def write_columnar(filepath: str, fields: Sequence[Tuple[str, str]],
+                   batches: Iterable[Tuple[Optional[str], dict]],
+                   format: str = "parquet", partition_column: Optional[str] = None,
+                   progress: Optional[Callable[[int], None]] = None) -> int:
+    """
+    把按列分批的数据写成带类型的 Parquet 或 Arrow IPC 文件，每批对应一个 row group / record batch。
+
+    Args:
+        filepath: 目标文件路径；分区导出时为 zip 文件路径
+        fields: 字段定义 [(列名, 类型名)]，类型名取值 int32/int64/float64/string/bool/timestamp
+        batches: (分区值, {列名: 值列表}) 迭代器，分区值为 None 表示不分区
+        format: parquet 或 arrow
+        partition_column: 分区列名；设置后按 hive 风格目录（列名=值/part-N）写出并打包为 zip
+        progress: 进度回调，参数为已写入的数据行数
+
+    Returns:
+        写入的数据行总数
+    """
+    if format not in ("parquet", "arrow"):
+        raise ValueError(f"不支持的列式格式: {format}")
+    pa = _require_pyarrow()
+    schema = _arrow_schema(pa, fields)
+    ext = "parquet" if format == "parquet" else "arrow"
+
+    staging = f"{filepath}.part"
+    written = 0
+    writer = None
+    current_key = None
+    part_numbers = {}
+    try:
+        if partition_column:
+            os.makedirs(staging, exist_ok=True)
+        for key, columns in batches:
+            if writer is None or key != current_key:
+                # 数据按分区列排序，分区变化时只需切换到新文件，同一时刻只保持一个文件打开
+                if writer is not None:
+                    writer.close()
+                if partition_column:
+                    part_dir = os.path.join(staging, f"{partition_column}={key}")
+                    os.makedirs(part_dir, exist_ok=True)
+                    part_no = part_numbers.get(key, 0)
+                    part_numbers[key] = part_no + 1
+                    path = os.path.join(part_dir, f"part-{part_no}.{ext}")
+                else:
+                    path = staging
+                writer = _open_columnar_writer(pa, path, schema, format)
+                current_key = key
+
+            batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+            if format == "parquet":
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            written += batch.num_rows
+            if progress:
+                progress(written)
+
+        if writer is None and not partition_column:
+            # 没有数据时也写出只有表头结构的文件
+            writer = _open_columnar_writer(pa, staging, schema, format)
+        if writer is not None:
+            writer.close()
+            writer = None
+
+        if partition_column:
+            # 分区目录打包为单个 zip 便于下载；列式文件本身已压缩，这里只做存储
+            tmp_zip = f"{filepath}.zip.part"
+            with zipfile.ZipFile(tmp_zip, "w", compression=zipfile.ZIP_STORED) as zf:
+                for root, _dirs, files in os.walk(staging):
+                    for name in files:
+                        full_path = os.path.join(root, name)
+                        zf.write(full_path, os.path.relpath(full_path, staging))
+            os.replace(tmp_zip, filepath)
+        else:
+            os.replace(staging, filepath)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.isdir(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+        elif os.path.exists(staging):
+            os.remove(staging)
+        if os.path.exists(f"{filepath}.zip.part"):
+            os.remove(f"{filepath}.zip.part")
+
+    return written
@@ -0,0 +1,87 @@
+"""
+文件下载响应工具
+提供支持 HTTP Range 的文件下载响应，用于大文件的断点续传
+"""
+
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 Range 请求头，返回闭区间 (start, end)
+    不支持多段 Range，遇到时返回 None 按完整文件响应
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+    start_str, end_str = match.groups()
+    if not start_str and not end_str:
+        return None
+
+    if not start_str:
+        # 后缀形式：bytes=-500 表示最后 500 字节
+        length = int(end_str)
+        if length == 0:
+            raise HTTPException(status_code=416, detail="Range 不可满足",
+                                headers={"Content-Range": f"bytes */{file_size}"})
+        return max(0, file_size - length), file_size - 1
+
+    start = int(start_str)
+    end = int(end_str) if end_str else file_size - 1
+    if start >= file_size or end < start:
+        raise HTTPException(status_code=416, detail="Range 不可满足",
+                            headers={"Content-Range": f"bytes */{file_size}"})
+    return start, min(end, file_size - 1)
+
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def range_file_response(request: Request, path: str, filename: str,
+                        media_type: str = "application/octet-stream") -> StreamingResponse:
+    """返回支持 Range/If-Range 的文件下载响应"""
+    stat = os.stat(path)
+    file_size = stat.st_size
+    etag = f'"{int(stat.st_mtime)}-{file_size}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+    }
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and file_size > 0:
+        # If-Range 与当前文件不一致时说明文件已变化，按完整文件返回
+        if_range = request.headers.get("if-range")
+        if not if_range or if_range == etag:
+            byte_range = _parse_range(range_header, file_size)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(file_size)
+        return StreamingResponse(_iter_file(path, 0, file_size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(_iter_file(path, start, length), status_code=206,
+                             media_type=media_type, headers=headers)
@@ -0,0 +1,57 @@
+"""
+报告文件的原子写入
+报告先写到同目录的临时文件（文件名含 .part 和进程号），写完后 os.replace 为正式文件名，
+进程中断时 reports/ 下只会残留临时文件，不会出现写了一半的正式报告；残留的临时文件在关闭和启动时清理。
+"""
+
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+PARTIAL_PATTERN = re.compile(r"\.(\d+)-[0-9a-f]{8}\.part\.[^.]+$")
+
+
+@contextmanager
+def atomic_report_path(filepath: str) -> Iterator[str]:
+    """产出临时文件路径供写入，正常结束后替换为 filepath，异常时删除临时文件"""
+    root, ext = os.path.splitext(filepath)
+    # 保留扩展名，pandas 等按扩展名选择写入格式
+    tmp_path = f"{root}.{os.getpid()}-{uuid.uuid4().hex[:8]}.part{ext}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def remove_partial_reports(report_dir: str, pid: Optional[int] = None, min_age_seconds: float = 0) -> int:
+    """
+    删除未写完的临时报告文件
+
+    Args:
+        report_dir: 报告目录（含按日期划分的子目录）
+        pid: 只删除该进程写入的临时文件；为空时不限进程
+        min_age_seconds: 只删除超过该时长未修改的文件，避免误删其他工作进程正在写入的文件
+
+    Returns:
+        删除的文件数
+    """
+    removed = 0
+    cutoff = time.time() - min_age_seconds
+    for dirpath, _, filenames in os.walk(report_dir):
+        for name in filenames:
+            match = PARTIAL_PATTERN.search(name)
+            if not match or (pid is not None and int(match.group(1)) != pid):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.getmtime(path) <= cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    return removed
@@ -0,0 +1,133 @@
+"""
+学生名单内存索引
+按学号索引全部学生的基本信息，供客户端学号验证和状态查询使用。
+启动时全量加载，学生写操作提交后按学号刷新；不存在的学号做负缓存，
+稳定状态下验证请求不访问数据库。
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 单条 IN 查询的学号个数，与 SQLite 的绑定参数上限保持距离
+_REFRESH_CHUNK_SIZE = 900
+
+
+def _student_entry(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "student_id": row.student_id,
+        "name": row.name,
+        "class_name": row.class_name,
+        "gender": row.gender,
+    }
+
+
+class RosterIndex:
+    """学号 -> 学生基本信息的内存索引，带负缓存和命中率统计"""
+
+    def __init__(self, negative_ttl: int = 300, max_negative: int = 10000):
+        self.negative_ttl = negative_ttl
+        self.max_negative = max_negative
+        self._students: Dict[str, Dict[str, Any]] = {}
+        self._negative: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loaded_at: Optional[datetime] = None
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def load(self, db: Session) -> int:
+        """全量加载学生名单，替换当前索引"""
+        rows = db.query(models.Student.id, models.Student.student_id, models.Student.name,
+                        models.Student.class_name, models.Student.gender).all()
+        students = {row.student_id: _student_entry(row) for row in rows}
+        with self._lock:
+            self._students = students
+            self._negative.clear()
+            self.loaded_at = datetime.utcnow()
+        logger.info(f"学生名单索引已加载，共 {len(students)} 名学生")
+        return len(students)
+
+    def get(self, db: Optional[Session], student_id: str) -> Optional[Dict[str, Any]]:
+        """
+        按学号查询学生。索引命中或负缓存命中时不访问数据库；
+        否则回源查询一次（其他进程可能新增了学生），结果写回索引或负缓存。
+        """
+        with self._lock:
+            student = self._students.get(student_id)
+            if student is not None:
+                self.hits += 1
+                return student
+            expires = self._negative.get(student_id)
+            if expires is not None and expires > time.monotonic():
+                self.negative_hits += 1
+                return None
+            self.misses += 1
+
+        if db is None:
+            return None
+        row = db.query(models.Student.id, models.Student.student_id, models.Student.name,
+                       models.Student.class_name, models.Student.gender) \
+            .filter(models.Student.student_id == student_id).first()
+        with self._lock:
+            if row is None:
+                self._remember_missing(student_id)
+                return None
+            student = _student_entry(row)
+            self._students[student_id] = student
+            self._negative.pop(student_id, None)
+            return student
+
+    def refresh(self, db: Session, student_ids: Iterable[str]):
+        """学生写操作提交后调用：从数据库重新读取这些学号，已删除的从索引中移除"""
+        student_ids = list(dict.fromkeys(student_ids))
+        found = {}
+        for start in range(0, len(student_ids), _REFRESH_CHUNK_SIZE):
+            chunk = student_ids[start:start + _REFRESH_CHUNK_SIZE]
+            rows = db.query(models.Student.id, models.Student.student_id, models.Student.name,
+                            models.Student.class_name, models.Student.gender) \
+                .filter(models.Student.student_id.in_(chunk))
+            for row in rows:
+                found[row.student_id] = _student_entry(row)
+
+        with self._lock:
+            for student_id in student_ids:
+                self._negative.pop(student_id, None)
+                if student_id in found:
+                    self._students[student_id] = found[student_id]
+                else:
+                    self._students.pop(student_id, None)
+
+    def _remember_missing(self, student_id: str):
+        self._negative[student_id] = time.monotonic() + self.negative_ttl
+        self._negative.move_to_end(student_id)
+        while len(self._negative) > self.max_negative:
+            self._negative.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "loaded_at": self.loaded_at,
+                "size": len(self._students),
+                "negative_size": len(self._negative),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else None,
+            }
+
+
+# 全局学生名单索引
+roster_index = RosterIndex(negative_ttl=settings.ROSTER_NEGATIVE_TTL_SECONDS)
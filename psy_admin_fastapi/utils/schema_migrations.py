@@ -1,6 +1,7 @@
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 from sqlalchemy.exc import SQLAlchemyError
-from database import engine
+from database import engine, Base
+from models import Test
 
 
 def ensure_core_schema() -> None:
@@ -10,6 +11,134 @@ def ensure_core_schema() -> None:
     注意：此函数仅用于过渡期，后续应改为 Alembic 迁移。
     """
     # SQLite不需要复杂的迁移，表结构已在models.py中定义
+    ensure_test_is_latest()
+    ensure_student_latest_test()
+    ensure_test_summaries()
+    ensure_signal_feature_version()
+    ensure_indexes()
+    backfill_change_log()
     print("SQLite数据库迁移检查完成")
     return
 
+
+def ensure_test_is_latest() -> None:
+    """旧库的 tests 表没有 is_latest 列时补上，并把每个学生最新的一条记为当前记录"""
+    try:
+        columns = {column["name"] for column in inspect(engine).get_columns("tests")}
+        if "is_latest" in columns:
+            return
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE tests ADD COLUMN is_latest BOOLEAN NOT NULL DEFAULT 0"))
+            conn.execute(text(
+                "UPDATE tests SET is_latest = 1 WHERE id IN (SELECT id FROM ("
+                "SELECT id, ROW_NUMBER() OVER (PARTITION BY student_fk_id ORDER BY test_time DESC, id DESC) AS rn "
+                "FROM tests) ranked WHERE rn = 1)"
+            ))
+            conn.execute(text("CREATE INDEX ix_tests_is_latest_student ON tests (is_latest, student_fk_id)"))
+    except SQLAlchemyError as e:
+        print(f"检测记录 is_latest 列迁移失败: {e}")
+
+
+def ensure_student_latest_test() -> None:
+    """旧库的 students 表没有当前检测记录冗余字段时补上并回填"""
+    try:
+        columns = {column["name"] for column in inspect(engine).get_columns("students")}
+        if "test_count" in columns:
+            return
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE students ADD COLUMN latest_test_id INTEGER"))
+            conn.execute(text("ALTER TABLE students ADD COLUMN latest_test_time DATETIME"))
+            conn.execute(text("ALTER TABLE students ADD COLUMN latest_is_abnormal BOOLEAN"))
+            conn.execute(text("ALTER TABLE students ADD COLUMN test_count INTEGER NOT NULL DEFAULT 0"))
+            conn.execute(text("CREATE INDEX ix_students_latest_test_id ON students (latest_test_id)"))
+            conn.execute(text("CREATE INDEX ix_students_latest_test_time ON students (latest_test_time)"))
+            conn.execute(text(
+                "UPDATE students SET "
+                "latest_test_id = (SELECT MAX(t.id) FROM tests t WHERE t.student_fk_id = students.id AND t.is_latest = 1), "
+                "latest_test_time = (SELECT MAX(t.test_time) FROM tests t WHERE t.student_fk_id = students.id AND t.is_latest = 1), "
+                "latest_is_abnormal = (SELECT MAX(t.is_abnormal) FROM tests t WHERE t.student_fk_id = students.id AND t.is_latest = 1), "
+                "test_count = (SELECT COUNT(*) FROM tests t WHERE t.student_fk_id = students.id) "
+                "+ (SELECT COUNT(*) FROM tests_archive a WHERE a.student_fk_id = students.id)"
+            ))
+    except SQLAlchemyError as e:
+        print(f"学生当前检测记录字段迁移失败: {e}")
+
+
+def ensure_test_summaries() -> None:
+    """旧库的 tests 表没有得分/生理数据紧凑列时补上，从 scores / physiological_data 回填，再追加已知模块的生成列"""
+    try:
+        columns = {column["name"] for column in inspect(engine).get_columns("tests")}
+        if "score_summary" in columns:
+            return
+        json_type = "JSON" if engine.dialect.name == "mysql" else "TEXT"
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE tests ADD COLUMN score_summary {json_type}"))
+            conn.execute(text(f"ALTER TABLE tests ADD COLUMN phys_summary {json_type}"))
+            if engine.dialect.name == "mysql":
+                conn.execute(text(
+                    "UPDATE tests SET "
+                    "score_summary = COALESCE((SELECT JSON_OBJECTAGG(s.module_name, JSON_OBJECT("
+                    "'score', s.score, 'max_score', s.max_score, 'level', s.level, "
+                    "'questionnaire_feedback', s.questionnaire_feedback)) FROM scores s WHERE s.test_fk_id = tests.id), "
+                    "JSON_OBJECT()), "
+                    "phys_summary = COALESCE((SELECT JSON_OBJECTAGG(p.data_key, p.data_value) "
+                    "FROM physiological_data p WHERE p.test_fk_id = tests.id), JSON_OBJECT()) "
+                    "WHERE score_summary IS NULL"
+                ))
+            else:
+                conn.execute(text(
+                    "UPDATE tests SET "
+                    "score_summary = (SELECT json_group_object(s.module_name, json_object("
+                    "'score', s.score, 'max_score', s.max_score, 'level', s.level, "
+                    "'questionnaire_feedback', s.questionnaire_feedback)) FROM scores s WHERE s.test_fk_id = tests.id), "
+                    "phys_summary = (SELECT json_group_object(p.data_key, p.data_value) "
+                    "FROM physiological_data p WHERE p.test_fk_id = tests.id) "
+                    "WHERE score_summary IS NULL"
+                ))
+            # SQLite 的 ALTER TABLE 只能追加 VIRTUAL 生成列，计算结果由 ix_tests_latest_scores 索引保存
+            generated = "STORED" if engine.dialect.name == "mysql" else "VIRTUAL"
+            for column in Test.__table__.columns:
+                if column.computed is None:
+                    continue
+                conn.execute(text(
+                    f"ALTER TABLE tests ADD COLUMN {column.name} {column.type.compile(engine.dialect)} "
+                    f"GENERATED ALWAYS AS ({column.computed.sqltext}) {generated}"
+                ))
+    except SQLAlchemyError as e:
+        print(f"检测记录紧凑列迁移失败: {e}")
+
+
+def ensure_signal_feature_version() -> None:
+    """旧库的 physiological_signals 表没有 feature_version 列时补上，已有信号全部视为未提取特征"""
+    try:
+        columns = {column["name"] for column in inspect(engine).get_columns("physiological_signals")}
+        if "feature_version" in columns:
+            return
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE physiological_signals ADD COLUMN feature_version INTEGER"))
+    except SQLAlchemyError as e:
+        print(f"信号特征版本列迁移失败: {e}")
+
+
+def ensure_indexes() -> None:
+    """create_all 不会给已存在的表补建索引，这里按 models.py 中声明的索引补齐"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except SQLAlchemyError as e:
+                print(f"创建索引 {index.name} 失败: {e}")
+
+
+def backfill_change_log() -> None:
+    """变更日志为空时，为已有检测记录补写一条 upsert，使 since=0 的增量导出等同于全量导出"""
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO change_log (entity, entity_id, op, changed_at) "
+                "SELECT 'test', id, 'upsert', CURRENT_TIMESTAMP FROM tests "
+                "WHERE NOT EXISTS (SELECT 1 FROM change_log) ORDER BY id"
+            ))
+    except SQLAlchemyError as e:
+        print(f"变更日志回填失败: {e}")
+
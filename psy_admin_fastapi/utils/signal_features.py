@@ -0,0 +1,164 @@
+"""
+生理信号特征提取模块
+从原始采样计算脑电各频段功率（Welch 法）和心率变异性（R-R 间期），替代客户端上报的心率、脑电alpha 摘要。
+只依赖 numpy，在进程池的子进程中执行，不访问数据库。
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.signal_store import read_range
+
+# 算法版本：修改下列算法或参数时加一，重跑模式据此找出需要重新计算的检测记录
+FEATURE_VERSION = 1
+
+# 脑电频段（Hz），左闭右开
+EEG_BANDS = {
+    "delta": (0.5, 4),
+    "theta": (4, 8),
+    "alpha": (8, 13),
+    "beta": (13, 30),
+    "gamma": (30, 45),
+}
+WELCH_SEGMENT_SECONDS = 2.0  # Welch 分段长度，频率分辨率 0.5Hz；相邻分段重叠 50%
+
+# 合理的 R-R 间期范围（毫秒），对应 30～200 次/分，超出范围的间期视为漏检或误检
+RR_MIN_MS, RR_MAX_MS = 300, 2000
+BEAT_REFRACTORY_SECONDS = 0.33  # 两次心搏峰值的最小间隔
+BASELINE_WINDOW_SECONDS = 0.6  # 基线漂移估计的滑动平均窗口
+
+# 通道 -> 特征类型；eeg_ 前缀的多导联通道按频段取平均
+WAVEFORM_CHANNELS = ("ecg", "ppg")  # 心电/脉搏波原始波形，先检测心搏再算 R-R 间期
+RR_CHANNEL = "rr_interval"  # 设备直接给出的 R-R 间期序列（毫秒）
+HEART_RATE_CHANNEL = "heart_rate"  # 逐秒心率序列（次/分），只用于心率
+
+
+def is_eeg_channel(channel: str) -> bool:
+    return channel == "eeg" or channel.startswith("eeg_")
+
+
+def welch_psd(samples: np.ndarray, sample_rate: float,
+              segment_seconds: float = WELCH_SEGMENT_SECONDS) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Welch 功率谱密度估计：Hann 窗、50% 重叠、逐段去均值，所有分段一次 rfft 完成。
+    采样不足一个分段时返回 None。
+
+    Returns:
+        (频率数组, 单边功率谱密度数组)
+    """
+    nperseg = int(segment_seconds * sample_rate)
+    if nperseg < 8 or len(samples) < nperseg:
+        return None
+    segments = sliding_window_view(samples.astype(np.float64, copy=False), nperseg)[::nperseg // 2]
+    segments = segments - segments.mean(axis=1, keepdims=True)
+    window = np.hanning(nperseg)
+    spectrum = np.abs(np.fft.rfft(segments * window, axis=1)) ** 2 / (sample_rate * (window ** 2).sum())
+    # 单边谱：除直流和奈奎斯特频率外的分量乘 2
+    spectrum[:, 1:(nperseg + 1) // 2] *= 2
+    return np.fft.rfftfreq(nperseg, 1 / sample_rate), spectrum.mean(axis=0)
+
+
+def eeg_band_powers(samples: np.ndarray, sample_rate: float) -> Dict[str, float]:
+    """各频段的绝对功率（信号单位的平方，如 μV²）；超过奈奎斯特频率的频段不输出"""
+    psd = welch_psd(samples, sample_rate)
+    if psd is None:
+        return {}
+    freqs, density = psd
+    resolution = freqs[1] - freqs[0]
+    powers = {}
+    for band, (low, high) in EEG_BANDS.items():
+        if high > sample_rate / 2:
+            continue
+        mask = (freqs >= low) & (freqs < high)
+        powers[band] = float(density[mask].sum() * resolution)
+    return powers
+
+
+def detect_beats(samples: np.ndarray, sample_rate: float) -> np.ndarray:
+    """
+    心搏峰值检测：减去滑动平均去除基线漂移，取超过 99% 分位数一半的局部极大值，
+    不应期内只保留最高的一个。适用于 R 波明显的心电和脉搏波；返回峰值所在的采样下标。
+    """
+    x = samples.astype(np.float64, copy=False)
+    window = max(int(BASELINE_WINDOW_SECONDS * sample_rate), 1)
+    x = x - np.convolve(x, np.ones(window) / window, mode="same")
+    threshold = 0.5 * np.percentile(x, 99)
+    middle = x[1:-1]
+    candidates = np.flatnonzero((middle > x[:-2]) & (middle >= x[2:]) & (middle > threshold)) + 1
+    refractory = int(BEAT_REFRACTORY_SECONDS * sample_rate)
+    peaks: List[int] = []
+    for index in candidates:
+        if peaks and index - peaks[-1] < refractory:
+            if x[index] > x[peaks[-1]]:
+                peaks[-1] = index
+        else:
+            peaks.append(index)
+    return np.asarray(peaks, dtype=np.int64)
+
+
+def hrv_metrics(rr_ms: np.ndarray) -> Dict[str, float]:
+    """由 R-R 间期（毫秒）计算平均心率、SDNN、RMSSD；有效间期少于 3 个时返回空"""
+    rr = np.asarray(rr_ms, dtype=np.float64)
+    valid = (rr >= RR_MIN_MS) & (rr <= RR_MAX_MS)
+    if valid.sum() < 3:
+        return {}
+    # RMSSD 只统计相邻两个间期都有效的差值，避免漏检的心搏放大差值
+    successive = np.diff(rr)[valid[1:] & valid[:-1]]
+    rr = rr[valid]
+    metrics = {
+        "heart_rate": float(60000 / rr.mean()),
+        "sdnn": float(rr.std(ddof=1)),
+    }
+    if len(successive):
+        metrics["rmssd"] = float(np.sqrt(np.mean(successive ** 2)))
+    return metrics
+
+
+def extract_features(channels: Iterable[Tuple[str, str, float]]) -> Dict[str, float]:
+    """
+    计算一次检测的全部特征
+
+    Args:
+        channels: (通道名, .npy 文件路径, 采样率) 列表
+
+    Returns:
+        {生理数据项: 数值}，数据项名与 physiological_data.data_key 一致
+    """
+    band_powers: Dict[str, List[float]] = {}
+    hrv: Dict[str, float] = {}
+    mean_heart_rate = None
+    for channel, path, sample_rate in channels:
+        samples = read_range(path, 0, None)
+        if is_eeg_channel(channel):
+            for band, power in eeg_band_powers(samples, sample_rate).items():
+                band_powers.setdefault(band, []).append(power)
+        elif channel in WAVEFORM_CHANNELS and not hrv:
+            hrv = hrv_metrics(np.diff(detect_beats(samples, sample_rate)) * 1000 / sample_rate)
+        elif channel == RR_CHANNEL:
+            hrv = hrv_metrics(samples)
+        elif channel == HEART_RATE_CHANNEL and len(samples):
+            mean_heart_rate = float(samples.astype(np.float64).mean())
+
+    features = {f"脑电{band}": float(np.mean(powers)) for band, powers in band_powers.items()}
+    # 心搏检测得到的心率优先于逐秒心率序列的均值
+    heart_rate = hrv.get("heart_rate", mean_heart_rate)
+    if heart_rate is not None:
+        features["心率"] = round(heart_rate, 2)
+    if "sdnn" in hrv:
+        features["心率变异SDNN"] = round(hrv["sdnn"], 2)
+    if "rmssd" in hrv:
+        features["心率变异RMSSD"] = round(hrv["rmssd"], 2)
+    return features
+
+
+def extract_batch(batch: List[Tuple[int, List[Tuple[str, str, float]]]]) -> List[Tuple[int, Dict[str, float], Optional[str]]]:
+    """进程池任务：逐个检测记录提取特征，单条失败不影响同批其他记录；返回 (检测记录ID, 特征, 错误信息)"""
+    results = []
+    for test_id, channels in batch:
+        try:
+            results.append((test_id, extract_features(channels), None))
+        except Exception as e:
+            results.append((test_id, {}, f"{type(e).__name__}: {e}"))
+    return results
@@ -0,0 +1,144 @@
+"""
+生理信号原始数据存储模块
+客户端上传的心率、脑电等原始采样以 float32 .npy 文件保存在 SIGNAL_DIR/<检测记录ID>/<通道>.npy，
+读取时按内存映射打开，区间查询只触及所需的采样段；长录音按桶取 min/max 降采样后返回，
+前端绘图不需要下载全部采样点。
+"""
+
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+from config import settings
+
+# 上传的原始采样：小端 float32
+SAMPLE_DTYPE = np.dtype("<f4")
+# 通道名同时用作文件名，只允许小写字母、数字和下划线
+CHANNEL_PATTERN = re.compile(r"^[a-z0-9_]{1,32}$")
+
+
+def valid_channel(channel: str) -> bool:
+    return bool(CHANNEL_PATTERN.match(channel))
+
+
+def parse_samples(payload: bytes) -> np.ndarray:
+    """把二进制负载解析为 float32 数组；长度不是 4 的倍数、为空或含 NaN/Inf 时抛出 ValueError"""
+    if not payload or len(payload) % SAMPLE_DTYPE.itemsize:
+        raise ValueError(f"数据长度必须是 {SAMPLE_DTYPE.itemsize} 字节的正整数倍")
+    samples = np.frombuffer(payload, dtype=SAMPLE_DTYPE)
+    if not np.isfinite(samples).all():
+        raise ValueError("采样数据包含 NaN 或 Inf")
+    return samples
+
+
+def summarize(samples: np.ndarray) -> Dict[str, float]:
+    """服务端计算的通道摘要：最小值、最大值、均值、标准差（float64 累加，避免长录音精度损失）"""
+    values = samples.astype(np.float64, copy=False)
+    return {
+        "min_value": float(values.min()),
+        "max_value": float(values.max()),
+        "mean_value": float(values.mean()),
+        "std_value": float(values.std()),
+    }
+
+
+def signal_path(test_id: int, channel: str) -> str:
+    return os.path.join(settings.SIGNAL_DIR, str(test_id), f"{channel}.npy")
+
+
+@contextmanager
+def staged_signal(test_id: int, channel: str, samples: np.ndarray) -> Iterator[str]:
+    """
+    把采样写入同目录的临时文件，产出正式文件路径；with 块正常结束后原子替换为正式文件，
+    异常时删除临时文件、保留原文件。数据库事务在 with 块内提交，提交失败时磁盘上仍是与旧记录一致的文件。
+    """
+    path = signal_path(test_id, channel)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, samples.astype(SAMPLE_DTYPE, copy=False))
+        yield path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def save_signal(test_id: int, channel: str, samples: np.ndarray) -> str:
+    """写入临时文件后原子替换，读者不会读到写了一半的文件；返回文件路径"""
+    with staged_signal(test_id, channel, samples) as path:
+        return path
+
+
+def remove_test_signals(test_ids: Iterable[int]) -> None:
+    """删除检测记录的全部信号文件（数据库事务提交后调用）"""
+    for test_id in test_ids:
+        shutil.rmtree(os.path.join(settings.SIGNAL_DIR, str(test_id)), ignore_errors=True)
+
+
+def read_range(path: str, start: int, end: int) -> np.ndarray:
+    """内存映射读取 [start, end) 区间的采样，只复制该区间"""
+    samples = np.load(path, mmap_mode="r")
+    try:
+        return np.array(samples[start:end])
+    finally:
+        # 及时释放映射，Windows 下映射中的文件无法被覆盖
+        del samples
+
+
+def downsample(samples: np.ndarray, points: int) -> Dict[str, list]:
+    """
+    按桶降采样：把采样分成至多 points 个等长桶，每桶保留最小值和最大值，
+    绘制成包络线时不会丢失尖峰。采样数不超过 points 时原样返回（min == max）。
+
+    Returns:
+        {"bucket_size": 每桶采样数, "offsets": 各桶起始采样相对偏移, "min": [...], "max": [...]}
+    """
+    count = len(samples)
+    if count <= points:
+        values = samples.tolist()
+        return {"bucket_size": 1, "offsets": list(range(count)), "min": values, "max": values}
+
+    bucket_size = -(-count // points)
+    full = count // bucket_size * bucket_size
+    blocks = samples[:full].reshape(-1, bucket_size)
+    mins, maxs = blocks.min(axis=1), blocks.max(axis=1)
+    if full < count:
+        # 末尾不足一桶的采样单独成桶
+        tail = samples[full:]
+        mins = np.append(mins, tail.min())
+        maxs = np.append(maxs, tail.max())
+    return {
+        "bucket_size": bucket_size,
+        "offsets": list(range(0, count, bucket_size)),
+        "min": mins.tolist(),
+        "max": maxs.tolist(),
+    }
+
+
+def load_series(path: str, sample_rate: float, sample_count: int, start: float = 0,
+                end: Optional[float] = None, points: int = 1000) -> Dict:
+    """
+    读取 [start, end) 秒区间并降采样为绘图序列
+
+    Returns:
+        {"start", "end", "bucket_seconds", "time": 各桶起始时间（秒）, "min", "max"}
+    """
+    first = min(max(int(start * sample_rate), 0), sample_count)
+    last = sample_count if end is None else min(max(int(np.ceil(end * sample_rate)), first), sample_count)
+    series = downsample(read_range(path, first, last), points)
+    return {
+        "start": first / sample_rate,
+        "end": last / sample_rate,
+        "bucket_seconds": series["bucket_size"] / sample_rate,
+        "time": [(first + offset) / sample_rate for offset in series["offsets"]],
+        "min": series["min"],
+        "max": series["max"],
+    }
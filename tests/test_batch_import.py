@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+学生批量导入测试
+覆盖向量化校验（空值、超长、去空格、跨块的文件内重复）、XLSX 流式读取，
+以及导入提交后客户端学号验证直接命中名单索引。
+"""
+import io
+import pytest
+import sys
+import os
+import tempfile
+from fastapi.testclient import TestClient
+from openpyxl import Workbook
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.main import app
+from psy_admin_fastapi.database import get_db_session
+from psy_admin_fastapi.dependencies import get_current_admin_user
+from psy_admin_fastapi.models import Base, AdminUser, Student
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.services import import_service
+from psy_admin_fastapi.services.import_service import ImportFileError, import_students
+from psy_admin_fastapi.utils.roster_index import RosterIndex
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_batch_import.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    """覆盖数据库依赖"""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add(Student(student_id="S001", name="张三", class_name="一班", gender="男"))
+    db.commit()
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def roster(db, monkeypatch):
+    """每个测试使用独立的名单索引，不受其他测试数据库的影响"""
+    index = RosterIndex()
+    index.load(db)
+    monkeypatch.setattr(crud, "roster_index", index)
+    monkeypatch.setattr(import_service, "roster_index", index)
+    return index
+
+
+@pytest.fixture
+def client(db, roster):
+    app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_current_admin_user] = lambda: AdminUser(id=1, username="admin")
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def csv_file(lines):
+    return io.BytesIO("\n".join(["name,student_id,class_name,gender"] + lines).encode("utf-8"))
+
+
+def xlsx_file(rows):
+    wb = Workbook()
+    ws = wb.active
+    for row in rows:
+        ws.append(row)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def students(db):
+    db.expire_all()
+    return {s.student_id: (s.name, s.class_name, s.gender) for s in db.query(Student)}
+
+
+def test_blank_and_overlong_rows_reported(db, roster):
+    result = import_students(db, csv_file([
+        "  王五 , S003 ,二班, 男 ",
+        ",S004,二班,女",
+        "赵六,S005,,男",
+        f"钱七,S006,二班,{'男' * 11}",
+    ]), "students.csv")
+    assert result["success_count"] == 1
+    assert result["error_rows"] == [
+        {"row": 3, "error": "必填字段不能为空"},
+        {"row": 4, "error": "必填字段不能为空"},
+        {"row": 5, "error": "数据格式错误: 性别长度不能超过10个字符"},
+    ]
+    # 前后空格在插入前去掉
+    assert students(db)["S003"] == ("王五", "二班", "男")
+
+
+def test_in_file_duplicates_detected_across_chunks(db, roster):
+    """chunk_size=2 时重复的学号分在不同块中，仍只保留第一次出现的行；已存在的学号记为重复"""
+    result = import_students(db, csv_file([
+        "王五,S003,二班,男",
+        "赵六,S004,二班,女",
+        "王五五,S003,三班,男",
+        "张三,S001,一班,男",
+        "赵六六,S004,三班,女",
+    ]), "students.csv", chunk_size=2)
+    assert result["success_count"] == 2
+    assert [(item["row"], item["student_id"]) for item in result["duplicate_students"]] == \
+        [(4, "S003"), (5, "S001"), (6, "S004")]
+    assert students(db)["S003"] == ("王五", "二班", "男")
+
+
+def test_xlsx_streaming_read(db, roster):
+    """数字格式的学号读出为整数字符串，末尾空行被跳过，行号与 Excel 一致"""
+    result = import_students(db, xlsx_file([
+        ["name", "student_id", "class_name", "gender"],
+        ["王五", 2023001, "二班", "男"],
+        [None, None, None, None],
+        ["赵六", "2023002", "二班", None],
+        ["孙八", 2023003.0, "三班", "女"],
+    ]), "students.xlsx", chunk_size=1)
+    assert result["success_count"] == 2
+    assert result["error_rows"] == [{"row": 4, "error": "必填字段不能为空"}]
+    assert {"2023001", "2023003"} <= set(students(db))
+
+
+def test_missing_column_rejected(db, roster):
+    with pytest.raises(ImportFileError, match="gender"):
+        import_students(db, io.BytesIO("name,student_id,class_name\n王五,S003,二班".encode("utf-8")),
+                        "students.csv")
+
+
+def test_imported_students_validate_from_roster_index(client, db, roster):
+    """导入提交后刷新名单索引：新学号的验证不访问数据库，未知学号走一次数据库后负缓存"""
+    response = client.post("/api/students/batch-import",
+                           files={"file": ("students.csv", csv_file(["王五,S003,二班,男"]), "text/csv")})
+    assert response.status_code == 200 and response.json()["success_count"] == 1
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        known = client.post("/api/client/validate-student", json={"student_id": "S003"}).json()
+        assert not statements
+        assert known == {"exists": True, "student_info": {
+            "student_id": "S003", "name": "王五", "class_name": "二班", "gender": "男"}}
+
+        assert client.post("/api/client/validate-student", json={"student_id": "S404"}).json()["exists"] is False
+        assert len(statements) == 1
+        assert client.post("/api/client/validate-student", json={"student_id": "S404"}).json()["exists"] is False
+        assert len(statements) == 1
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    stats = roster.stats()
+    assert (stats["size"], stats["hits"], stats["negative_hits"], stats["misses"]) == (2, 1, 1, 1)
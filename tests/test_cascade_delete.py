@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+级联删除测试
+批量删除学生或检测记录时，得分、生理数据、信号元数据和信号文件一并删除，
+变更日志留下 delete 墓碑；分块执行的结果与一次执行一致，失败时整批回滚。
+"""
+import pytest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.models import (
+    Base, ChangeLog, PhysiologicalData, PhysiologicalSignal, Score, Student, Test,
+)
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.schemas import TestDataUpload
+from psy_admin_fastapi.utils.roster_index import RosterIndex
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_cascade_delete.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(settings, "SIGNAL_DIR", str(tmp_path))
+    monkeypatch.setattr(crud, "roster_index", RosterIndex())
+    db = TestingSessionLocal()
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def upload(db, student_id, hours_ago):
+    """上传一条检测记录并保存一个通道的原始信号，返回检测记录ID"""
+    test = crud.create_test_data(db, TestDataUpload(
+        student_id=student_id,
+        name="测试学生",
+        gender="男",
+        age=15,
+        class_name="一班",
+        test_time=datetime.now() - timedelta(hours=hours_ago),
+        questionnaire_scores={"学习焦虑": {"score": 5, "max_score": 15, "level": "轻度"}},
+        physiological_data_summary={"心率": 72.0, "脑电alpha": 9.5},
+        ai_summary="检测结果正常",
+        report_file_path="reports/test.pdf",
+    ))
+    crud.save_physiological_signal(db, test.id, "eeg", 256, np.arange(8, dtype="<f4").tobytes())
+    return test.id
+
+
+def remaining(db, test_ids):
+    """各关联表中仍属于这些检测记录的行数"""
+    db.expire_all()
+    return {
+        "tests": db.query(Test).filter(Test.id.in_(test_ids)).count(),
+        "scores": db.query(Score).filter(Score.test_fk_id.in_(test_ids)).count(),
+        "physiological_data": db.query(PhysiologicalData).filter(PhysiologicalData.test_fk_id.in_(test_ids)).count(),
+        "physiological_signals": db.query(PhysiologicalSignal)
+        .filter(PhysiologicalSignal.test_fk_id.in_(test_ids)).count(),
+        "signal_dirs": sum(os.path.isdir(os.path.join(settings.SIGNAL_DIR, str(test_id))) for test_id in test_ids),
+    }
+
+
+def tombstones(db, entity):
+    return sorted(row[0] for row in db.query(ChangeLog.entity_id)
+                  .filter(ChangeLog.entity == entity, ChangeLog.op == "delete"))
+
+
+EMPTY = {"tests": 0, "scores": 0, "physiological_data": 0, "physiological_signals": 0, "signal_dirs": 0}
+
+
+@pytest.mark.parametrize("chunk_size", [999, 1])
+def test_delete_students_cascades(db, monkeypatch, chunk_size):
+    monkeypatch.setattr(crud, "in_chunk_size", lambda session: chunk_size)
+    deleted_tests = [upload(db, "S0001", 2), upload(db, "S0001", 1), upload(db, "S0002", 1)]
+    kept_test = upload(db, "S0003", 1)
+    student_db_ids = sorted(row[0] for row in db.query(Student.id).filter(Student.student_id.in_(["S0001", "S0002"])))
+
+    assert crud.delete_students(db, ["S0001", "S0002", "S0404"]) == 2
+    assert remaining(db, deleted_tests) == EMPTY
+    assert remaining(db, [kept_test]) == {"tests": 1, "scores": 1, "physiological_data": 2,
+                                          "physiological_signals": 1, "signal_dirs": 1}
+    assert [row[0] for row in db.query(Student.student_id)] == ["S0003"]
+    assert tombstones(db, "test") == sorted(deleted_tests)
+    assert tombstones(db, "student") == student_db_ids
+    assert crud.roster_index.get(None, "S0001") is None
+
+
+def test_delete_test_records_cascades_and_promotes_history(db):
+    history = upload(db, "S0001", 2)
+    latest = upload(db, "S0001", 1)
+
+    assert crud.delete_test_records(db, [latest, 999]) == 1
+    assert remaining(db, [latest]) == EMPTY
+    assert remaining(db, [history])["signal_dirs"] == 1
+    assert tombstones(db, "test") == [latest]
+    student = db.query(Student).filter(Student.student_id == "S0001").one()
+    assert student.latest_test_id == history
+    assert db.get(Test, history).is_latest
+
+
+def test_failed_delete_rolls_back_and_keeps_files(db, monkeypatch):
+    """提交前失败时数据库整批回滚，信号文件只在提交后删除，因此全部保留"""
+    test_ids = [upload(db, "S0001", 2), upload(db, "S0002", 1)]
+
+    def failing(session, student_db_ids, op="upsert"):
+        raise RuntimeError("change log unavailable")
+
+    monkeypatch.setattr(crud, "record_student_changes", failing)
+    with pytest.raises(RuntimeError):
+        crud.delete_students(db, ["S0001", "S0002"])
+    assert remaining(db, test_ids) == {"tests": 2, "scores": 2, "physiological_data": 4,
+                                       "physiological_signals": 2, "signal_dirs": 2}
+    assert tombstones(db, "test") == []
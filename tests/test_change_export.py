@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+增量导出测试
+覆盖新增、修改（学生信息变化）和删除的墓碑行，按 X-Next-Since 分页续传，
+以及未过等待期的变更留到下次导出。
+"""
+import json
+import pytest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi import main
+from psy_admin_fastapi.main import app
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.database import get_db_session
+from psy_admin_fastapi.dependencies import get_current_admin_user
+from psy_admin_fastapi.models import Base, AdminUser, ChangeLog
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.schemas import StudentUpdate, TestDataUpload
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_change_export.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    """覆盖数据库依赖"""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(settings, "CHANGE_EXPORT_SETTLE_SECONDS", 0)
+    db = TestingSessionLocal()
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(main.read_replica, "session", TestingSessionLocal)
+    app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_current_admin_user] = lambda: AdminUser(id=1, username="admin")
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def upload(db, student_id, learning=5):
+    return crud.create_test_data(db, TestDataUpload(
+        student_id=student_id,
+        name="测试学生",
+        gender="男",
+        age=15,
+        class_name="一班",
+        test_time=datetime.now(),
+        questionnaire_scores={"学习焦虑": {"score": learning, "max_score": 15, "level": "轻度"}},
+        physiological_data_summary={"心率": 72.0, "脑电alpha": 9.5},
+        ai_summary="检测结果正常",
+        report_file_path="reports/test.pdf",
+    ))
+
+
+def changes(db, since):
+    until, has_more = crud.get_test_record_change_window(db, since=since)
+    headers, rows = crud.get_test_record_changes(db, since=since, until=until)
+    return until, has_more, [dict(zip(headers, row)) for row in rows]
+
+
+def test_upsert_update_and_delete_tombstones(db):
+    first = upload(db, "S0001")
+    second = upload(db, "S0002", learning=9)
+    since, _, rows = changes(db, 0)
+    assert [(row["变更类型"], row["记录ID"]) for row in rows] == [("upsert", first.id), ("upsert", second.id)]
+    assert rows[1]["学习焦虑"] == 9
+
+    # 学生信息修改记为其当前检测记录的更新，导出新的班级
+    crud.update_student(db, "S0001", StudentUpdate(class_name="二班"))
+    crud.delete_test_record(db, second.id)
+    until, _, rows = changes(db, since)
+    assert [(row["变更类型"], row["记录ID"]) for row in rows] == [("upsert", first.id), ("delete", second.id)]
+    assert rows[0]["班级"] == "二班"
+    assert rows[1]["学号"] is None and rows[1]["学习焦虑"] is None
+
+    assert changes(db, until)[2] == []
+
+
+def test_record_deleted_after_window_exports_tombstone(db):
+    """窗口内最后一次变更是 upsert，但读取时记录已被删除：输出墓碑行"""
+    test = upload(db, "S0001")
+    until, _ = crud.get_test_record_change_window(db, since=0)
+    crud.delete_test_record(db, test.id)
+    headers, rows = crud.get_test_record_changes(db, since=0, until=until)
+    assert [row[:3] for row in rows] == [("delete", until, test.id)]
+
+
+def test_next_since_paging(client, db):
+    test_ids = [upload(db, f"S{i:04d}").id for i in range(5)]
+    since, pages, exported = 0, [], []
+    while True:
+        response = client.get(f"/api/export/test-records/changes?since={since}&limit=2")
+        assert response.status_code == 200
+        records = [json.loads(line) for line in response.text.splitlines()]
+        exported.extend(record["记录ID"] for record in records)
+        pages.append(len(records))
+        since = int(response.headers["X-Next-Since"])
+        if response.headers["X-Has-More"] == "false":
+            break
+    assert pages == [2, 2, 1]
+    assert exported == test_ids
+    assert since == max(row[0] for row in db.query(ChangeLog.id))
+
+
+def test_recent_changes_wait_for_settle_window(db, monkeypatch):
+    """未过等待期的变更不进入窗口，水位线不会越过可能仍有未提交事务的序号"""
+    settled = upload(db, "S0001")
+    db.execute(update(ChangeLog).values(changed_at=datetime.utcnow() - timedelta(minutes=5)))
+    db.commit()
+    upload(db, "S0002")
+    monkeypatch.setattr(settings, "CHANGE_EXPORT_SETTLE_SECONDS", 30)
+    until, has_more, rows = changes(db, 0)
+    assert [row["记录ID"] for row in rows] == [settled.id]
+    assert not has_more
+    assert changes(db, until)[2] == []
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+客户端名单同步测试
+全量快照之后按 since_version 增量同步：新增、修改、转班和删除的学生分别进入 students 或 deleted_ids；
+版本号不越过等待期内的变更，避免并发事务提交后被跳过。
+"""
+import pytest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.main import app
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.database import get_db_session
+from psy_admin_fastapi.dependencies import get_current_admin_user
+from psy_admin_fastapi.models import Base, AdminUser, ChangeLog, Student
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.schemas import StudentCreate, StudentUpdate
+from psy_admin_fastapi.utils.roster_index import RosterIndex
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_client_roster.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    """覆盖数据库依赖"""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(settings, "CHANGE_EXPORT_SETTLE_SECONDS", 0)
+    monkeypatch.setattr(crud, "roster_index", RosterIndex())
+    db = TestingSessionLocal()
+    for student_id, name, class_name in [("S001", "张三", "一班"), ("S002", "李四", "一班"), ("S003", "王五", "二班")]:
+        crud.create_student(db, StudentCreate(student_id=student_id, name=name, class_name=class_name, gender="男"))
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client(db):
+    app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_current_admin_user] = lambda: AdminUser(id=1, username="admin")
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def db_id(db, student_id):
+    return db.query(Student.id).filter(Student.student_id == student_id).scalar()
+
+
+def test_snapshot_then_delta(client, db):
+    snapshot = client.get("/api/client/roster?class_name=一班").json()
+    assert snapshot["full"] is True and snapshot["deleted_ids"] == []
+    assert [s["student_id"] for s in snapshot["students"]] == ["S001", "S002"]
+    version = snapshot["version"]
+    assert version > 0
+
+    moved, deleted = db_id(db, "S002"), db_id(db, "S001")
+    crud.create_student(db, StudentCreate(student_id="S004", name="赵六", class_name="一班", gender="女"))
+    crud.update_student(db, "S003", StudentUpdate(name="王五五", class_name="一班"))
+    crud.update_student(db, "S002", StudentUpdate(class_name="二班"))
+    crud.delete_student(db, "S001")
+
+    delta = client.get(f"/api/client/roster?class_name=一班&since_version={version}").json()
+    assert delta["full"] is False and delta["version"] > version
+    assert [(s["student_id"], s["name"], s["class_name"]) for s in delta["students"]] == \
+        [("S003", "王五五", "一班"), ("S004", "赵六", "一班")]
+    # 转出班级与删除的学生都按删除下发
+    assert sorted(delta["deleted_ids"]) == sorted([moved, deleted])
+
+    # 不按班级筛选时转班的学生是修改，不是删除
+    delta = client.get(f"/api/client/roster?since_version={version}").json()
+    assert [s["student_id"] for s in delta["students"]] == ["S002", "S003", "S004"]
+    assert delta["deleted_ids"] == [deleted]
+
+    latest = client.get(f"/api/client/roster?since_version={delta['version']}").json()
+    assert latest["full"] is False and latest["students"] == [] and latest["deleted_ids"] == []
+
+
+def test_invalid_version_returns_snapshot(client):
+    assert client.get("/api/client/roster?since_version=99999").json()["full"] is True
+    assert client.get("/api/client/roster?since_version=-1").json()["full"] is True
+
+
+def test_version_waits_for_settle_window(db, monkeypatch):
+    """等待期内的变更不计入版本号，之后的增量同步仍能拿到它"""
+    db.execute(update(ChangeLog).values(changed_at=datetime.utcnow() - timedelta(minutes=5)))
+    db.commit()
+    settled = crud.get_roster_version(db)
+    crud.create_student(db, StudentCreate(student_id="S004", name="赵六", class_name="一班", gender="女"))
+
+    monkeypatch.setattr(settings, "CHANGE_EXPORT_SETTLE_SECONDS", 30)
+    roster = crud.get_client_roster(db, since_version=settled)
+    assert roster["version"] == settled
+    assert roster["students"] == [] and roster["deleted_ids"] == []
+
+    delta = crud.get_client_roster(db, since_version=settled, settle_seconds=0)
+    assert [s["student_id"] for s in delta["students"]] == ["S004"]
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+列式导出测试
+Parquet 读回后校验列类型（得分 int32、生理数据 float64）、历史记录与 is_latest 标记、
+按月分区的目录结构，以及未安装 pyarrow 时接口返回 501。
+"""
+import pytest
+import sys
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.main import app
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.database import get_db_session
+from psy_admin_fastapi.dependencies import get_current_admin_user
+from psy_admin_fastapi.models import Base, AdminUser
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.schemas import TestDataUpload
+from psy_admin_fastapi.utils import export_writers
+from psy_admin_fastapi.utils.export_writers import ColumnarExportUnavailable
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_columnar_export.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# (学号, 检测时间, 学习焦虑, 心率)：S0001 的一月记录在二月上传后转为历史记录
+UPLOADS = [
+    ("S0001", datetime(2024, 1, 10, 9), 12, 70.5),
+    ("S0002", datetime(2024, 1, 20, 9), 4, 82.0),
+    ("S0001", datetime(2024, 2, 5, 9), 7, 75.25),
+]
+
+
+def override_get_db():
+    """覆盖数据库依赖"""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="module")
+def db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    for student_id, test_time, learning, heart_rate in UPLOADS:
+        crud.create_test_data(db, TestDataUpload(
+            student_id=student_id,
+            name="测试学生",
+            gender="男",
+            age=15,
+            class_name="一班",
+            test_time=test_time,
+            questionnaire_scores={"学习焦虑": {"score": learning, "max_score": 15, "level": "轻度"}},
+            physiological_data_summary={"心率": heart_rate, "脑电alpha": 9.5},
+            ai_summary="检测结果正常",
+            report_file_path="reports/test.pdf",
+        ))
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_parquet_round_trip_types_and_history(db, tmp_path):
+    path = crud.export_test_records_to_columnar(db, format="parquet", filepath=str(tmp_path / "records.parquet"))
+    table = pq.read_table(path)
+    assert table.schema.field("record_id").type == pa.int64()
+    assert table.schema.field("score_学习焦虑").type == pa.int32()
+    assert table.schema.field("phys_心率").type == pa.float64()
+    assert table.schema.field("is_latest").type == pa.bool_()
+    assert table.schema.field("test_time").type == pa.timestamp("us")
+
+    rows = sorted(zip(*(table.column(name).to_pylist()
+                        for name in ("student_id", "test_time", "score_学习焦虑", "phys_心率", "is_latest"))),
+                  key=lambda row: row[1])
+    assert rows == [
+        ("S0001", datetime(2024, 1, 10, 9), 12, 70.5, False),
+        ("S0002", datetime(2024, 1, 20, 9), 4, 82.0, True),
+        ("S0001", datetime(2024, 2, 5, 9), 7, 75.25, True),
+    ]
+
+
+def test_partitioned_export_layout(db, tmp_path):
+    path = crud.export_test_records_to_columnar(db, format="parquet", partition_by="month",
+                                                filepath=str(tmp_path / "records.zip"))
+    with zipfile.ZipFile(path) as zf:
+        names = sorted(zf.namelist())
+        zf.extractall(tmp_path / "unzipped")
+    assert names == ["test_month=2024-01/part-0.parquet", "test_month=2024-02/part-0.parquet"]
+    january = pq.read_table(tmp_path / "unzipped" / "test_month=2024-01" / "part-0.parquet")
+    assert sorted(january.column("student_id").to_pylist()) == ["S0001", "S0002"]
+    assert january.schema.field("score_学习焦虑").type == pa.int32()
+
+
+def test_count_includes_history_for_columnar(db):
+    assert crud.count_export_rows(db, "test-records") == 2
+    assert crud.count_export_rows(db, "test-records", latest_only=False) == 3
+
+
+def test_missing_pyarrow_returns_501(db, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "EXPORT_DIR", str(tmp_path))
+    app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_current_admin_user] = lambda: AdminUser(id=1, username="admin")
+    try:
+        client = TestClient(app)
+
+        def unavailable():
+            raise ColumnarExportUnavailable("Parquet/Arrow 导出需要安装 pyarrow：pip install pyarrow")
+
+        monkeypatch.setattr(export_writers, "_require_pyarrow", unavailable)
+        assert client.get("/api/export/test-records?format=parquet").status_code == 501
+
+        def broken():
+            raise RuntimeError("disk full")
+
+        # 其他运行时错误不再被当作缺少依赖
+        monkeypatch.setattr(export_writers, "_require_pyarrow", broken)
+        assert client.get("/api/export/test-records?format=parquet").status_code == 500
+    finally:
+        app.dependency_overrides.clear()
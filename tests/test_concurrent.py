@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+后台线程池与会话作用域测试
+覆盖会话作用域的提交和回滚、嵌套调用共用会话、线程池统计，以及按连接池容量收紧线程池大小。
+"""
+import pytest
+import sys
+import os
+import tempfile
+import threading
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.models import Base, Student
+from psy_admin_fastapi.utils import concurrent as concurrent_module
+from psy_admin_fastapi.utils.concurrent import (
+    WorkerPool, WorkerPoolClosedError, session_scope, thread_safe_db, thread_pool_size, validate_pool_sizes,
+)
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_concurrent.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(autouse=True)
+def db(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(concurrent_module, "SessionLocal", TestingSessionLocal)
+    db = TestingSessionLocal()
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def add_student(db, student_id):
+    db.add(Student(student_id=student_id, name="测试学生", class_name="一班", gender="男"))
+
+
+def test_session_scope_commits_and_rolls_back(db):
+    with session_scope() as scoped:
+        add_student(scoped, "S001")
+    with pytest.raises(RuntimeError):
+        with session_scope() as scoped:
+            add_student(scoped, "S002")
+            scoped.flush()
+            raise RuntimeError("boom")
+    assert [s.student_id for s in db.query(Student).all()] == ["S001"]
+
+
+def test_nested_calls_share_outer_session(db):
+    """内层调用结束后不关闭外层会话，由最外层统一提交"""
+    sessions = []
+
+    @thread_safe_db
+    def inner(db=None):
+        sessions.append(db)
+        add_student(db, "S002")
+
+    @thread_safe_db
+    def outer(db=None):
+        sessions.append(db)
+        add_student(db, "S001")
+        inner()
+        add_student(db, "S003")
+
+    outer()
+    assert sessions[0] is sessions[1]
+    assert db.query(Student).count() == 3
+
+
+def test_worker_pool_session_task_and_stats(db):
+    pool = WorkerPool("test-worker", 2)
+    release = threading.Event()
+
+    def task(scoped, student_id):
+        release.wait(5)
+        add_student(scoped, student_id)
+        return student_id
+
+    futures = [pool.submit_with_session(task, f"S00{i}") for i in range(3)]
+    stats = pool.stats()
+    assert stats["queued"] + stats["active"] == 3
+    release.set()
+    assert [future.result(5) for future in futures] == ["S000", "S001", "S002"]
+
+    def failing(scoped):
+        add_student(scoped, "S009")
+        scoped.flush()
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError):
+        pool.submit_with_session(failing).result(5)
+    pool.shutdown()
+
+    stats = pool.stats()
+    assert stats["completed"] == 3 and stats["failed"] == 1
+    assert stats["active"] == 0 and stats["queued"] == 0
+    assert stats["peak_active"] == 2
+    assert db.query(Student).count() == 3
+
+
+def test_close_drains_then_rejects_new_tasks():
+    pool = WorkerPool("test-worker", 1)
+    release = threading.Event()
+    futures = [pool.submit(release.wait, 5) for _ in range(2)]
+    assert pool.close(timeout=0.05) == 2
+    with pytest.raises(WorkerPoolClosedError):
+        pool.submit(lambda: None)
+    release.set()
+    assert futures[0].result(5) is True
+    assert futures[1].cancelled()
+
+
+def test_pool_sizes_follow_db_pool_capacity(monkeypatch):
+    bounded = create_engine("sqlite://", poolclass=QueuePool, pool_size=2, max_overflow=1)
+    monkeypatch.setattr(settings, "WORKER_THREADS", 8)
+    assert thread_pool_size(8, bounded) == 3
+    assert thread_pool_size(0, bounded) == 1
+    warnings = validate_pool_sizes(bounded)
+    assert any("WORKER_THREADS=8" in message for message in warnings)
+    assert any("后台线程共" in message for message in warnings)
+    unbounded = create_engine("sqlite://", poolclass=QueuePool, pool_size=2, max_overflow=-1)
+    assert thread_pool_size(8, unbounded) == 8
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+SQL 计时测试
+执行失败的语句不触发 after_cursor_execute，其开始时间必须在 handle_error 中弹出，
+否则连接上的计时栈不断增长，后续语句的耗时与错误的开始时间配对。
+"""
+import pytest
+import sys
+import os
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.utils import db_monitor
+from psy_admin_fastapi.utils.db_monitor import QueryMonitor, RequestQueryStats, install_request_counter
+
+
+def test_failed_statement_does_not_skew_next_timing():
+    engine = create_engine("sqlite://")
+    monitor = QueryMonitor(threshold_ms=100)
+    monitor.install(engine)
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing_table"))
+        assert conn.info["query_start_time"] == []
+
+        time.sleep(0.15)
+        conn.execute(text("SELECT 1"))
+        assert conn.info["query_start_time"] == []
+
+    stats = {row["shape"]: row for row in monitor.top()}
+    assert stats["SELECT 1"]["max_ms"] < 100
+    assert stats["SELECT 1"]["slow_count"] == 0
+
+
+def test_request_counter_pops_failed_statement():
+    install_request_counter()
+    engine = create_engine("sqlite://")
+    stats = RequestQueryStats()
+    token = db_monitor._request_stats.set(stats)
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing_table"))
+            time.sleep(0.15)
+            conn.execute(text("SELECT 1"))
+    finally:
+        db_monitor._request_stats.reset(token)
+    assert stats._starts == []
+    assert stats.queries == 2
+    assert stats.db_ms < 100
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+后台导出任务测试
+覆盖任务从排队到完成/失败的状态变化、过期清理后的 410（其他进程写入中的文件不被清理），
+以及下载接口的 Range 请求（206/416/If-Range）。
+"""
+import csv
+import io
+import pytest
+import sys
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.main import app
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.dependencies import get_current_admin_user
+from psy_admin_fastapi.models import Base, AdminUser, BackgroundJob
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.schemas import TestDataUpload
+from psy_admin_fastapi.services import job_queue as job_queue_module
+from psy_admin_fastapi.services.job_queue import job_queue
+from psy_admin_fastapi.services.export_jobs import export_job_manager, read_replica, sweep_export_dir
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_export_jobs.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """全局任务队列和导出读取都指向测试数据库，导出文件写入临时目录"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    for i in range(3):
+        crud.create_test_data(db, TestDataUpload(
+            student_id=f"S{i:04d}",
+            name="测试学生",
+            gender="男",
+            age=15,
+            test_time=datetime.now(),
+            questionnaire_scores={"学习焦虑": {"score": 5, "max_score": 15, "level": "轻度"}},
+            physiological_data_summary={"心率": 72.0},
+            ai_summary="检测结果正常",
+            report_file_path="reports/test.pdf",
+        ))
+    db.close()
+    monkeypatch.setattr(job_queue_module, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(read_replica, "session", TestingSessionLocal)
+    monkeypatch.setattr(settings, "EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "JOB_POLL_SECONDS", 0.05)
+    app.dependency_overrides[get_current_admin_user] = lambda: AdminUser(id=1, username="admin")
+    job_queue.start()
+    yield TestClient(app)
+    job_queue.stop()
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def wait_for(client, job_id, statuses=("completed", "failed"), timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/api/export/jobs/{job_id}").json()
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"导出任务 {job_id} 未在 {timeout} 秒内结束，当前状态 {job['status']}")
+
+
+def submit(client, **body):
+    response = client.post("/api/export/jobs", json={"kind": "students", "format": "csv", **body})
+    assert response.status_code == 202
+    return response.json()
+
+
+def test_job_completes_and_downloads(client):
+    created = submit(client)
+    assert created["status"] == "queued" and created["progress"] is None
+    job = wait_for(client, created["job_id"])
+    assert job["status"] == "completed"
+    assert (job["rows_written"], job["rows_total"], job["progress"]) == (3, 3, 100.0)
+    assert job["file_name"].endswith(".csv")
+
+    response = client.get(f"/api/export/jobs/{created['job_id']}/download")
+    assert response.status_code == 200
+    assert response.headers["accept-ranges"] == "bytes"
+    rows = list(csv.reader(io.StringIO(response.content.decode("utf-8-sig"))))
+    assert rows[0] == crud.STUDENT_EXPORT_HEADERS and len(rows) == 4
+
+
+def test_invalid_job_rejected(client):
+    response = client.post("/api/export/jobs", json={"kind": "students", "format": "parquet"})
+    assert response.status_code == 400
+    assert client.get("/api/export/jobs/missing").status_code == 404
+
+
+def test_failed_job_reports_error_and_refuses_download(client, monkeypatch):
+    """导出失败且不再重试时任务显示为 failed，只返回异常信息，未写完的文件被删除"""
+    def broken(db, kind, **params):
+        raise RuntimeError("replica unavailable")
+
+    monkeypatch.setitem(job_queue.handlers["export"], "max_attempts", 1)
+    monkeypatch.setattr(crud, "get_export_rows", broken)
+    job = wait_for(client, submit(client)["job_id"])
+    assert job["status"] == "failed"
+    assert job["error"] == "RuntimeError: replica unavailable"
+    response = client.get(f"/api/export/jobs/{job['job_id']}/download")
+    assert response.status_code == 409
+    assert os.listdir(settings.EXPORT_DIR) == []
+
+
+def test_swept_file_expires_job(client, monkeypatch):
+    job = wait_for(client, submit(client)["job_id"])
+    monkeypatch.setattr(settings, "EXPORT_RETENTION_HOURS", 0)
+    assert len(export_job_manager.sweep()) == 1
+    assert client.get(f"/api/export/jobs/{job['job_id']}").json()["status"] == "expired"
+    assert client.get(f"/api/export/jobs/{job['job_id']}/download").status_code == 410
+
+
+def test_sweep_keeps_files_of_jobs_running_elsewhere(client, monkeypatch):
+    """另一个进程认领的导出任务正在写入：即使超过总大小上限，它写入中的文件也不会被删除"""
+    db = TestingSessionLocal()
+    db.add(BackgroundJob(id="ab12cd34" + "0" * 24, kind="export", lane="export", status="running",
+                         max_attempts=3, worker="other-host:1", lease_until=datetime.utcnow() + timedelta(minutes=5)))
+    db.commit()
+    db.close()
+    export_dir = settings.EXPORT_DIR
+    in_flight = os.path.join(export_dir, "学生数据_20240101_000000_ab12cd34.csv.part")
+    finished = os.path.join(export_dir, "学生数据_20240101_000000_ffffffff.csv")
+    for path in (in_flight, finished):
+        with open(path, "wb") as f:
+            f.write(b"x" * 1024)
+
+    monkeypatch.setattr(settings, "EXPORT_MAX_TOTAL_MB", 0)
+    assert export_job_manager.sweep() == [finished]
+    assert os.listdir(export_dir) == [os.path.basename(in_flight)]
+
+
+def test_sweep_removes_only_stale_part_files(tmp_path):
+    """没有任务记录的 .part 文件不参与总大小清理，只在超过保留时长后删除"""
+    young = tmp_path / "a.csv.part"
+    stale = tmp_path / "b.csv.part"
+    young.write_bytes(b"x" * 1024)
+    stale.write_bytes(b"x" * 1024)
+    old = datetime.now().timestamp() - 3 * 3600
+    os.utime(stale, (old, old))
+    deleted = sweep_export_dir(str(tmp_path), max_age_hours=2, max_total_mb=0)
+    assert deleted == [str(stale)]
+    assert os.listdir(tmp_path) == ["a.csv.part"]
+
+
+def test_range_download(client):
+    job_id = wait_for(client, submit(client)["job_id"])["job_id"]
+    url = f"/api/export/jobs/{job_id}/download"
+    full = client.get(url)
+    size = len(full.content)
+    etag = full.headers["etag"]
+
+    partial = client.get(url, headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == f"bytes 0-9/{size}"
+    assert partial.content == full.content[:10]
+
+    # 断点续传：从第 10 字节继续，与 ETag 一致时只返回剩余部分
+    rest = client.get(url, headers={"Range": "bytes=10-", "If-Range": etag})
+    assert rest.status_code == 206
+    assert partial.content + rest.content == full.content
+
+    unsatisfiable = client.get(url, headers={"Range": f"bytes={size}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{size}"
+
+    # 文件已变化（If-Range 不一致）时返回完整文件
+    stale = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"0-0"'})
+    assert stale.status_code == 200
+    assert stale.content == full.content
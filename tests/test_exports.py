@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+导出接口测试
+xlsx 导出从服务器端游标流式写入只写工作簿，读回后校验表头和数据行；
+CSV/NDJSON 导出边查询边编码直接流式返回，不在导出目录落盘。
+"""
+import csv
+import json
+import pytest
+import sys
+import os
+import io
+import tempfile
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from openpyxl import load_workbook
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi import main
+from psy_admin_fastapi.main import app
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.database import get_db_session
+from psy_admin_fastapi.dependencies import get_current_admin_user
+from psy_admin_fastapi.models import Base, AdminUser, Student
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.schemas import TestDataUpload
+from psy_admin_fastapi.utils import export_writers
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_exports.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# (学号, 姓名, 班级, 学习焦虑)
+STUDENTS = [("S0001", "张三", "一班", 12), ("S0002", "李四", "二班", 4), ("S0003", "王五", "一班", 15)]
+
+
+def override_get_db():
+    """覆盖数据库依赖"""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add_all([Student(student_id=student_id, name=name, class_name=class_name, gender="男")
+                for student_id, name, class_name, _ in STUDENTS])
+    db.commit()
+    for student_id, name, _, learning in STUDENTS:
+        crud.create_test_data(db, TestDataUpload(
+            student_id=student_id,
+            name=name,
+            gender="男",
+            age=15,
+            test_time=datetime.now() - timedelta(hours=1),
+            questionnaire_scores={"学习焦虑": {"score": learning, "max_score": 15, "level": "轻度"}},
+            physiological_data_summary={"心率": 72.0, "脑电alpha": 9.5},
+            ai_summary="检测结果正常",
+            report_file_path="reports/test.pdf",
+        ))
+    db.close()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def client(seeded, export_dir, monkeypatch):
+    # 流式导出在生成器内自行打开会话
+    monkeypatch.setattr(main.read_replica, "session", TestingSessionLocal)
+    app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_current_admin_user] = lambda: AdminUser(id=1, username="admin")
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def read_sheets(content):
+    wb = load_workbook(io.BytesIO(content), read_only=True)
+    try:
+        return {ws.title: [tuple(row) for row in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+    finally:
+        wb.close()
+
+
+def test_students_xlsx(client):
+    response = client.get("/api/export/students")
+    assert response.status_code == 200
+    rows = read_sheets(response.content)["Sheet1"]
+    assert rows[0] == tuple(crud.STUDENT_EXPORT_HEADERS)
+    assert sorted(row[:3] for row in rows[1:]) == [student[:3] for student in STUDENTS]
+
+
+def test_test_records_xlsx_has_score_columns(client):
+    response = client.get("/api/export/test-records")
+    assert response.status_code == 200
+    rows = read_sheets(response.content)["Sheet1"]
+    header = rows[0]
+    assert header[:len(crud.TEST_RECORD_EXPORT_HEADERS)] == tuple(crud.TEST_RECORD_EXPORT_HEADERS)
+    assert header[-6:] == ("学习焦虑", "对人焦虑", "孤独倾向", "自责倾向", "心率", "脑电alpha")
+    scores = {row[header.index("学号")]: row[header.index("学习焦虑")] for row in rows[1:]}
+    assert scores == {student_id: learning for student_id, _, _, learning in STUDENTS}
+
+
+def test_dashboard_xlsx_sheets(client):
+    response = client.get("/api/export/dashboard-stats")
+    assert response.status_code == 200
+    sheets = read_sheets(response.content)
+    assert list(sheets) == ["统计概览", "班级分布", "得分分布"]
+    assert dict(sheets["统计概览"][1:])["总检测记录数"] == 3
+    assert dict(sheets["班级分布"][1:]) == {"一班": 2, "二班": 1}
+    learning = {row[1]: row[2] for row in sheets["得分分布"][1:] if row[0] == "学习焦虑"}
+    assert learning["11-15"] == 2 and learning["0-10"] == 1
+
+
+def test_score_stats_matches_dashboard_export(client):
+    """仪表板图表与仪表板导出统计同一组模块"""
+    stats = client.get("/api/dashboard/score-stats").json()
+    assert list(stats) == crud.DASHBOARD_SCORE_MODULES
+    sheet = read_sheets(client.get("/api/export/dashboard-stats").content)["得分分布"]
+    assert {(module, bucket): count for module, bucket, count in sheet[1:]} == \
+        {(module, bucket): count for module, buckets in stats.items() for bucket, count in buckets.items()}
+    assert stats["学习焦虑"]["11-15"] == 2
+
+
+def test_write_xlsx_streams_rows(export_dir):
+    """数据行边读边写：每次进度回调时只从迭代器取出了已写入的行，不会先全部加载到内存"""
+    consumed = []
+    checkpoints = []
+
+    def rows():
+        for i in range(5000):
+            consumed.append(i)
+            yield (i, f"学生{i}")
+
+    path = str(export_dir / "stream.xlsx")
+    written = export_writers.write_xlsx(path, [("Sheet1", ["序号", "姓名"], rows())],
+                                        progress=lambda n: checkpoints.append((n, len(consumed))))
+    assert written == 5000
+    assert checkpoints[:3] == [(1000, 1000), (2000, 2000), (3000, 3000)]
+    with open(path, "rb") as f:
+        sheet = read_sheets(f.read())["Sheet1"]
+    assert len(sheet) == 5001 and sheet[-1] == (4999, "学生4999")
+    assert os.listdir(export_dir) == ["stream.xlsx"]
+
+
+def test_students_csv_streams_without_file(client, export_dir):
+    response = client.get("/api/export/students?format=csv")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "filename*=utf-8''" in response.headers["content-disposition"]
+    assert response.content.startswith(b"\xef\xbb\xbf")
+    rows = list(csv.reader(io.StringIO(response.content.decode("utf-8-sig"))))
+    assert rows[0] == crud.STUDENT_EXPORT_HEADERS
+    assert sorted(tuple(row[:3]) for row in rows[1:]) == [student[:3] for student in STUDENTS]
+    assert os.listdir(export_dir) == []
+
+
+def test_test_records_ndjson(client, export_dir):
+    response = client.get("/api/export/test-records?format=ndjson")
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert {record["学号"]: record["学习焦虑"] for record in records} == \
+        {student_id: learning for student_id, _, _, learning in STUDENTS}
+    assert all(record["心率"] == 72.0 for record in records)
+    assert os.listdir(export_dir) == []
+
+
+def test_test_records_csv_filters(client):
+    response = client.get("/api/export/test-records?format=csv&user_id=S0002")
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.content.decode("utf-8-sig"))))
+    assert len(rows) == 2 and rows[1][rows[0].index("学号")] == "S0002"
+
+
+def test_dashboard_ndjson_flattens_sheets(client, export_dir):
+    response = client.get("/api/export/dashboard-stats?format=ndjson")
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert all(list(record) == crud.DASHBOARD_FLAT_EXPORT_HEADERS for record in records)
+    classes = {record["项目"]: record["数值"] for record in records if record["工作表"] == "班级分布"}
+    assert classes == {"一班": 2, "二班": 1}
+    assert os.listdir(export_dir) == []
+
+
+def test_unknown_format_rejected(client):
+    assert client.get("/api/export/students?format=pdf").status_code == 400
+
+
+def test_iter_csv_yields_header_before_reading_rows():
+    """第一块（表头）在读取任何数据行之前发出，后续小块按 flush_bytes 合并"""
+    consumed = []
+
+    def rows():
+        for i in range(100):
+            consumed.append(i)
+            yield (i, f"学生{i}")
+
+    chunks = export_writers.iter_csv(["序号", "姓名"], rows(), flush_bytes=256)
+    assert next(chunks) == "\ufeff序号,姓名\r\n".encode("utf-8")
+    assert consumed == []
+    rest = list(chunks)
+    assert len(consumed) == 100 and len(rest) > 1
+    assert all(len(chunk) >= 256 for chunk in rest[:-1])
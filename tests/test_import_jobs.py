@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+后台导入任务测试
+导入中途失败时已提交的块保留、失败块整体回滚；从检查点重试后只处理剩余的块，
+不重复插入，跨检查点的文件内重复仍能识别；另一个进程持有租约的任务不会被重复执行。
+"""
+import io
+import pytest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.models import Base, ImportJob, ImportJobChunk, Student
+from psy_admin_fastapi.services import import_jobs
+from psy_admin_fastapi.services.import_jobs import ImportJobManager
+from psy_admin_fastapi.utils.roster_index import RosterIndex
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_import_jobs.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# 每块 2 行共 4 块；第 6 行的 S001 与第一块重复
+ROWS = [
+    "张三,S001,一班,男",
+    "李四,S002,一班,女",
+    "王五,S003,二班,男",
+    "赵六,S004,二班,女",
+    "张三三,S001,三班,男",
+    "孙八,S005,三班,女",
+    "周九,S006,三班,男",
+]
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """任务在调用线程中同步执行，便于在失败后检查检查点"""
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(import_jobs, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(import_jobs, "roster_index", RosterIndex())
+    monkeypatch.setattr(settings, "IMPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "IMPORT_CHUNK_SIZE", 2)
+    manager = ImportJobManager(max_workers=1)
+    monkeypatch.setattr(manager, "submit", manager._run)
+    yield manager
+    manager.executor.shutdown()
+    Base.metadata.drop_all(bind=engine)
+
+
+def csv_file():
+    return io.BytesIO(("\n".join(["name,student_id,class_name,gender"] + ROWS) + "\n").encode("utf-8"))
+
+
+def load(job_id):
+    db = TestingSessionLocal()
+    try:
+        job = db.get(ImportJob, job_id)
+        chunks = [row[0] for row in db.query(ImportJobChunk.chunk_no)
+                  .filter(ImportJobChunk.job_id == job_id).order_by(ImportJobChunk.chunk_no)]
+        student_ids = sorted(row[0] for row in db.query(Student.student_id))
+        db.expunge(job)
+        return job, chunks, student_ids
+    finally:
+        db.close()
+
+
+def fail_on_chunk(monkeypatch, failing_chunk):
+    """第 failing_chunk 块写入后再抛出，模拟写到一半时数据库连接中断"""
+    real = import_jobs.process_chunk
+    calls = []
+
+    def flaky(db, chunk, seen_ids, on_conflict="skip", write=True):
+        result = real(db, chunk, seen_ids, on_conflict, write)
+        calls.append(int(chunk["row"].min()))
+        if len(calls) == failing_chunk + 1:
+            raise RuntimeError("connection lost")
+        return result
+
+    monkeypatch.setattr(import_jobs, "process_chunk", flaky)
+    return calls
+
+
+def test_job_completes_with_chunk_results(manager):
+    job = manager.create(csv_file(), "students.csv")
+    job, chunks, student_ids = load(job.id)
+    assert job.status == "completed"
+    assert (job.rows_total, job.rows_processed, job.chunks_committed) == (7, 7, 4)
+    assert (job.success_count, job.duplicate_count) == (6, 1)
+    assert chunks == [0, 1, 2, 3]
+    assert student_ids == ["S001", "S002", "S003", "S004", "S005", "S006"]
+    assert not os.path.exists(job.file_path)
+
+
+def test_resume_from_checkpoint_after_mid_file_failure(manager, monkeypatch):
+    fail_on_chunk(monkeypatch, 2)
+    job = manager.create(csv_file(), "students.csv")
+    job, chunks, student_ids = load(job.id)
+    assert job.status == "failed" and job.error == "connection lost"
+    # 前两块已提交，失败的第三块整体回滚
+    assert (job.chunks_committed, job.rows_processed, job.success_count) == (2, 4, 4)
+    assert chunks == [0, 1]
+    assert student_ids == ["S001", "S002", "S003", "S004"]
+    assert os.path.exists(job.file_path)
+
+    calls = fail_on_chunk(monkeypatch, 99)
+    manager.retry(job.id)
+    job, chunks, student_ids = load(job.id)
+    assert job.status == "completed" and job.error is None
+    # 重试只处理检查点之后的块
+    assert calls == [6, 8]
+    assert chunks == [0, 1, 2, 3]
+    assert (job.rows_processed, job.success_count, job.duplicate_count) == (7, 6, 1)
+    assert student_ids == ["S001", "S002", "S003", "S004", "S005", "S006"]
+
+
+def test_interrupted_running_job_resumes_on_startup(manager, monkeypatch):
+    """进程在任务执行中退出时任务停留在 running，启动后从检查点继续"""
+    fail_on_chunk(monkeypatch, 1)
+    job = manager.create(csv_file(), "students.csv")
+    db = TestingSessionLocal()
+    db.get(ImportJob, job.id).status = "running"
+    db.commit()
+    db.close()
+
+    fail_on_chunk(monkeypatch, 99)
+    assert manager.resume_pending() == 1
+    job, chunks, student_ids = load(job.id)
+    assert job.status == "completed"
+    assert chunks == [0, 1, 2, 3]
+    assert len(student_ids) == 6
+
+
+def test_retry_rejects_unfinished_job(manager):
+    job = manager.create(csv_file(), "students.csv")
+    with pytest.raises(ValueError):
+        manager.retry(job.id)
+    assert manager.retry("missing") is None
+
+
+def interrupt(job_id, **values):
+    """把失败的任务改成另一个进程执行中的状态"""
+    db = TestingSessionLocal()
+    db.execute(update(ImportJob).where(ImportJob.id == job_id).values(status="running", worker="other-host:1", **values))
+    db.commit()
+    db.close()
+
+
+def test_job_leased_by_another_process_is_not_rerun(manager, monkeypatch):
+    """另一个进程仍在执行（租约未过期）时启动恢复不会重复导入，租约过期后才接手"""
+    fail_on_chunk(monkeypatch, 1)
+    job = manager.create(csv_file(), "students.csv")
+    interrupt(job.id, lease_until=datetime.utcnow() + timedelta(minutes=5))
+
+    calls = fail_on_chunk(monkeypatch, 99)
+    manager.resume_pending()
+    job, chunks, _ = load(job.id)
+    assert calls == []
+    assert (job.status, job.worker, chunks) == ("running", "other-host:1", [0])
+
+    interrupt(job.id, lease_until=datetime.utcnow() - timedelta(seconds=1))
+    manager.resume_pending()
+    job, chunks, student_ids = load(job.id)
+    assert calls == [4, 6, 8]
+    assert job.status == "completed" and job.lease_until is None
+    assert chunks == [0, 1, 2, 3] and len(student_ids) == 6
+
+
+def test_claim_is_exclusive(manager, monkeypatch):
+    """两个进程同时认领同一个排队任务，只有一个成功"""
+    monkeypatch.setattr(manager, "submit", lambda job_id: None)
+    job = manager.create(csv_file(), "students.csv")
+    db = TestingSessionLocal()
+    try:
+        assert manager._claim(db, job.id)
+        assert not ImportJobManager(max_workers=1)._claim(db, job.id)
+        claimed = db.get(ImportJob, job.id)
+        assert claimed.status == "running" and claimed.lease_until > datetime.utcnow()
+    finally:
+        db.close()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+后台任务队列测试
+覆盖任务持久化、失败重试和死信、通道排队上限以及租约过期任务的重新认领。
+"""
+import pytest
+import sys
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.models import Base, BackgroundJob
+from psy_admin_fastapi.services import job_queue as job_queue_module
+from psy_admin_fastapi.services.job_queue import JobQueue, JobQueueFullError
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_job_queue.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    """使用测试数据库的任务队列，缩短轮询间隔和重试退避"""
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(job_queue_module, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(settings, "JOB_POLL_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "JOB_RETRY_BASE_SECONDS", 0.05)
+    queue = JobQueue([("client", 1, 10), ("report", 1, 1)])
+    yield queue
+    queue.stop()
+    Base.metadata.drop_all(bind=engine)
+
+
+def wait_for(queue, job_id, statuses=("completed", "dead"), timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job.status in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"任务 {job_id} 未在 {timeout} 秒内结束，当前状态 {job.status}")
+
+
+def test_job_completes_with_result(queue):
+    queue.register("add", lane="client")(lambda a, b: {"sum": a + b})
+    queue.start()
+    job = wait_for(queue, queue.enqueue("add", {"a": 1, "b": 2}).id)
+    assert job.status == "completed"
+    assert job.result == '{"sum": 3}'
+    assert job.attempts == 1
+
+
+def test_failed_job_retries_then_dead_letters(queue):
+    """失败的任务按退避重试，用尽执行次数后转为死信，手动重试后重新执行"""
+    calls = []
+
+    def flaky():
+        calls.append(time.monotonic())
+        raise RuntimeError("boom")
+
+    queue.register("flaky", lane="client", max_attempts=3)(flaky)
+    queue.start()
+    job_id = queue.enqueue("flaky").id
+    job = wait_for(queue, job_id)
+    assert job.status == "dead"
+    assert job.attempts == 3 and len(calls) == 3
+    assert "RuntimeError: boom" in job.last_error
+    # 第二次重试的退避时间是第一次的两倍
+    assert calls[2] - calls[1] > calls[1] - calls[0]
+
+    queue.retry(job_id)
+    wait_for(queue, job_id, statuses=("dead",))
+    assert len(calls) == 6
+
+
+def test_lane_backpressure(queue):
+    """通道排队任务达到上限后拒绝新任务，其他通道不受影响"""
+    queue.register("report", lane="report")(lambda: None)
+    queue.register("ingest", lane="client")(lambda: None)
+    queue.enqueue("report")
+    with pytest.raises(JobQueueFullError):
+        queue.enqueue("report")
+    queue.enqueue("ingest")
+
+
+def test_expired_lease_is_reclaimed(queue):
+    """认领任务的进程退出后，租约过期的任务被重新执行"""
+    queue.register("noop", lane="client")(lambda: "ok")
+    db = TestingSessionLocal()
+    db.add(BackgroundJob(id="stale", kind="noop", lane="client", status="running", payload="{}", attempts=1,
+                         max_attempts=3, run_after=datetime.utcnow(), worker="other-host:1",
+                         lease_until=datetime.utcnow() - timedelta(seconds=1)))
+    db.commit()
+    db.close()
+    queue.start()
+    job = wait_for(queue, "stale")
+    assert job.status == "completed"
+    assert job.attempts == 2
+    assert job.worker == queue.worker_id
+
+
+def test_stop_releases_unfinished_jobs(queue):
+    """关闭时超过截止时间仍在执行的任务释放回队列，不计执行次数，之后结束的执行不覆盖任务状态"""
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    queue.register("slow", lane="client")(slow)
+    queue.start()
+    job_id = queue.enqueue("slow").id
+    assert started.wait(5)
+    assert queue.stop(timeout=0.1) == 1
+    job = queue.get(job_id)
+    assert job.status == "queued" and job.attempts == 0 and job.worker is None
+
+    release.set()
+    time.sleep(0.2)
+    assert queue.get(job_id).status == "queued"
+
+
+def test_expired_lease_with_attempts_exhausted_is_dead_lettered(queue):
+    """处理函数使进程崩溃时不会走到失败处理，执行次数用尽后不再重新认领"""
+    calls = []
+    queue.register("crash", lane="client")(lambda: calls.append(1))
+    db = TestingSessionLocal()
+    db.add(BackgroundJob(id="crashed", kind="crash", lane="client", status="running", payload="{}", attempts=3,
+                         max_attempts=3, run_after=datetime.utcnow(), worker="other-host:1",
+                         lease_until=datetime.utcnow() - timedelta(seconds=1)))
+    db.commit()
+    db.close()
+    queue.start()
+    job = wait_for(queue, "crashed", statuses=("dead",))
+    assert job.attempts == 3
+    assert "租约" in job.last_error
+    assert calls == []
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+查询预算测试
+在严格模式下请求声明了 query_budget 的接口，SQL 条数超出预算即抛出 QueryBudgetExceeded。
+接口新增循环查询（N+1）时，这里会直接失败。
+"""
+import pytest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.main import app
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.database import get_db_session
+from psy_admin_fastapi.dependencies import get_current_admin_user
+from psy_admin_fastapi.models import Base, AdminUser
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.schemas import TestDataUpload
+from psy_admin_fastapi.utils.db_monitor import QueryBudgetExceeded
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_query_budgets.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+STUDENT_IDS = [f"S{i:04d}" for i in range(30)]
+
+# 覆盖全部声明了预算的接口
+ENDPOINTS = [
+    ("get", "/test-data/records/?limit=50", None),
+    ("get", "/api/students?limit=50", None),
+    ("get", "/api/students/S0001", None),
+    ("post", "/api/students/batch-query", {"student_ids": STUDENT_IDS}),
+    ("get", "/api/test-records/status/S0001", None),
+    ("get", "/api/students/S0001/test-history", None),
+    ("get", "/api/test-records/batch-status?" + "&".join(f"student_ids={s}" for s in STUDENT_IDS), None),
+    ("get", "/api/dashboard/stats", None),
+    ("get", "/api/reports/S0001", None),
+    ("post", "/api/client/validate-student", {"student_id": "S0001"}),
+    ("get", "/api/client/roster", None),
+    ("get", "/api/client/test-status/S0001", None),
+]
+
+
+def override_get_db():
+    """覆盖数据库依赖"""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="module")
+def client():
+    """写入测试数据（每个学生两次检测），开启严格模式"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    for round_no in range(2):
+        for i, student_id in enumerate(STUDENT_IDS):
+            crud.create_test_data(db, TestDataUpload(
+                student_id=student_id,
+                name=f"学生{i}",
+                gender="男" if i % 2 else "女",
+                age=15,
+                class_name="一班" if i % 3 else "二班",
+                test_time=datetime.now() - timedelta(days=round_no),
+                questionnaire_scores={"学习焦虑": {"score": i % 15, "max_score": 15, "level": "轻度"}},
+                physiological_data_summary={"心率": 70 + i % 20, "脑电alpha": 9.5},
+                ai_summary="检测结果正常",
+                report_file_path="reports/test.pdf",
+            ))
+    db.close()
+
+    app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_current_admin_user] = lambda: AdminUser(id=1, username="admin")
+    strict = settings.QUERY_BUDGET_STRICT
+    settings.QUERY_BUDGET_STRICT = True
+    yield TestClient(app)
+    settings.QUERY_BUDGET_STRICT = strict
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.mark.parametrize("method,url,body", ENDPOINTS, ids=[f"{m} {u.split('?')[0]}" for m, u, _ in ENDPOINTS])
+def test_endpoint_within_query_budget(client, method, url, body):
+    """接口的 SQL 条数不超过预算，并返回 Server-Timing 响应头"""
+    response = client.request(method, url, json=body)
+    assert response.status_code == 200, response.text
+    assert response.headers["server-timing"].startswith("db;dur=")
+
+
+def test_budget_exceeded_raises(client):
+    """超出预算的接口在严格模式下直接报错"""
+    route = next(r for r in app.routes if getattr(r, "path", None) == "/api/students/{student_id}/test-history")
+    budget = route.endpoint.query_budget
+    route.endpoint.query_budget = 0
+    try:
+        with pytest.raises(QueryBudgetExceeded):
+            client.get("/api/students/S0002/test-history")
+    finally:
+        route.endpoint.query_budget = budget
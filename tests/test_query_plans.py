@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+查询计划测试
+对 crud.py 中的热点查询执行 EXPLAIN QUERY PLAN，任何一条 SQL 对数据表做全表扫描即失败。
+新增查询或修改筛选条件时，需要在 models.py 和 alembic 迁移中补充对应的索引。
+"""
+import pytest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.models import Base
+from psy_admin_fastapi.schemas import TestDataUpload
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_query_plans.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+NOW = datetime.now()
+
+# (用例名, 调用) —— 覆盖 crud.py 中所有筛选/排序组合
+QUERIES = [
+    ("test_records", lambda db: crud.get_test_records(db)),
+    ("test_records_by_user", lambda db: crud.get_test_records(db, user_id="S0001")),
+    ("test_records_by_class_gender", lambda db: crud.get_test_records(db, class_name="一班", gender="男")),
+    ("test_records_by_time", lambda db: crud.get_test_records(db, start_time=NOW - timedelta(days=2), end_time=NOW)),
+    ("test_records_abnormal", lambda db: crud.get_test_records(db, is_abnormal=True)),
+    ("test_records_by_status", lambda db: crud.get_test_records(db, status="pending")),
+    ("test_count", lambda db: crud.get_test_count(db, is_abnormal=True, start_time=NOW - timedelta(days=2))),
+    ("students_with_filters", lambda db: crud.get_students_with_filters(db, class_name="一班", gender="男")),
+    ("students_by_ids", lambda db: crud.get_students_by_ids(db, ["S0001", "S0002"], include_latest_test=True)),
+    ("client_test_status", lambda db: crud.get_student_test_status_for_client(db, "S0003")),
+    ("student_test_history", lambda db: crud.get_student_test_history(db, "S0003")),
+    ("batch_status", lambda db: crud.get_test_records_batch_status(db, ["S0001", "S0002"])),
+    ("student_records_status", lambda db: crud.get_student_test_records_status(db, "S0001")),
+    ("export_test_records", lambda db: list(crud.iter_test_record_export_rows(
+        db, *crud.get_test_record_export_columns(db), class_name="一班"))),
+    ("export_abnormal_since", lambda db: list(crud.iter_test_record_export_rows(
+        db, *crud.get_test_record_export_columns(db), is_abnormal=True, start_time=NOW - timedelta(days=3)))),
+    ("test_record_changes", lambda db: list(crud.get_test_record_changes(db, 10, 50)[1])),
+    ("change_window", lambda db: crud.get_test_record_change_window(db, 10, 20)),
+    ("change_watermark", lambda db: crud.get_change_watermark_for_time(db, NOW)),
+    ("client_roster_delta", lambda db: crud.get_client_roster(db, class_name="一班", since_version=5,
+                                                              settle_seconds=0)),
+    ("score_distribution", lambda db: crud.get_score_distribution(db)),
+    ("class_distribution", lambda db: crud.get_class_distribution(db)),
+    ("dashboard_stats", lambda db: crud.get_dashboard_stats_aggregated(db)),
+]
+
+
+@pytest.fixture(scope="module")
+def db():
+    """创建测试数据库并写入检测数据（每个学生含一条历史记录）"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    for round_no in range(2):
+        for i in range(40):
+            crud.create_test_data(db, TestDataUpload(
+                student_id=f"S{i:04d}",
+                name=f"学生{i}",
+                gender="男" if i % 2 else "女",
+                age=15,
+                class_name="一班" if i % 3 else "二班",
+                test_time=NOW - timedelta(days=(i + round_no) % 5),
+                questionnaire_scores={
+                    "学习焦虑": {"score": i % 15, "max_score": 15, "level": "轻度"},
+                    "对人焦虑": {"score": 3, "max_score": 10, "level": "重度" if i % 7 == 0 else "轻度"},
+                },
+                physiological_data_summary={"心率": 70 + i % 20, "脑电alpha": 9.5},
+                ai_summary="检测结果正常",
+                report_file_path="reports/test.pdf",
+            ))
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def capture_selects(fn, db):
+    """执行 fn，返回其间发出的全部 SELECT 语句及参数"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def full_table_scans(statement, parameters):
+    """返回查询计划中对数据表的全表扫描（不含子查询物化结果的扫描和索引扫描）"""
+    tables = set(Base.metadata.tables)
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        words = detail.split()
+        if len(words) >= 2 and words[0] == "SCAN" and words[1] in tables and "USING" not in detail:
+            scans.append(detail)
+    return scans
+
+
+@pytest.mark.parametrize("name,fn", QUERIES, ids=[name for name, _ in QUERIES])
+def test_query_uses_index(db, name, fn):
+    """每条查询都应命中索引，不能退化为全表扫描"""
+    statements = capture_selects(fn, db)
+    assert statements, f"{name} 没有执行任何查询"
+    for statement, parameters in statements:
+        scans = full_table_scans(statement, parameters)
+        assert not scans, f"{name} 出现全表扫描 {scans}: {' '.join(statement.split())}"
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+只读副本路由测试
+主库和副本各用一个 SQLite 文件，通过复制 change_log 模拟复制进度：
+覆盖正常、延迟过大、副本不可用以及恢复后的路由，检查结果缓存、副本会话拒绝写入和并发读计数。
+"""
+import pytest
+import sys
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi import dependencies
+from psy_admin_fastapi.database import ReadReplica
+from psy_admin_fastapi.models import Base, ChangeLog, Student
+
+
+def sqlite_engine(path):
+    return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+
+@pytest.fixture
+def engines(tmp_path):
+    primary = sqlite_engine(tmp_path / "primary.db")
+    replica = sqlite_engine(tmp_path / "replica.db")
+    for engine in (primary, replica):
+        Base.metadata.create_all(bind=engine)
+    yield primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+def record_change(engine, seq, seconds_ago=0):
+    with engine.begin() as conn:
+        conn.execute(insert(ChangeLog).values(
+            id=seq, entity="student", entity_id=seq, op="upsert",
+            changed_at=datetime.utcnow() - timedelta(seconds=seconds_ago)))
+
+
+def replicate(primary, replica):
+    """把主库上副本还没有的变更复制过去"""
+    with replica.connect() as conn:
+        applied = conn.execute(select(ChangeLog.id)).scalars().all()
+    with primary.connect() as conn:
+        rows = [dict(row._mapping) for row in conn.execute(select(ChangeLog.__table__)) if row.id not in applied]
+    if rows:
+        with replica.begin() as conn:
+            conn.execute(insert(ChangeLog), rows)
+
+
+def routed_to(session: Session, engine) -> bool:
+    try:
+        return session.get_bind() is engine
+    finally:
+        session.close()
+
+
+def test_healthy_replica_serves_reads(engines):
+    primary, replica = engines
+    record_change(primary, 1, seconds_ago=60)
+    replicate(primary, replica)
+    router = ReadReplica(replica, primary, max_lag_seconds=10, check_interval=0)
+
+    assert router.available()
+    assert router.lag_seconds == 0.0
+    assert routed_to(router.session(), replica)
+    assert router.stats()["reads"] == {"replica": 1, "primary": 0}
+
+
+def test_replica_session_rejects_writes(engines):
+    primary, replica = engines
+    router = ReadReplica(replica, primary, max_lag_seconds=10, check_interval=0)
+    session = router.session()
+    try:
+        session.add(Student(student_id="S001", name="张三", class_name="一班", gender="男"))
+        with pytest.raises(RuntimeError):
+            session.flush()
+    finally:
+        session.close()
+
+
+def test_lagging_replica_falls_back_then_recovers(engines):
+    """主库上最早一条未复制的变更已超过 max_lag_seconds：回退主库，复制追上后恢复使用副本"""
+    primary, replica = engines
+    record_change(primary, 1, seconds_ago=120)
+    replicate(primary, replica)
+    record_change(primary, 2, seconds_ago=30)
+    record_change(primary, 3, seconds_ago=5)
+    router = ReadReplica(replica, primary, max_lag_seconds=10, check_interval=0)
+
+    assert not router.available()
+    assert 29 <= router.lag_seconds < 60
+    assert routed_to(router.session(), primary)
+
+    replicate(primary, replica)
+    assert router.available()
+    assert routed_to(router.session(), replica)
+    assert router.stats()["reads"] == {"replica": 1, "primary": 1}
+
+
+def test_small_lag_is_tolerated(engines):
+    primary, replica = engines
+    record_change(primary, 1, seconds_ago=3)
+    router = ReadReplica(replica, primary, max_lag_seconds=10, check_interval=0)
+    assert router.available()
+    assert 0 < router.lag_seconds <= 10
+
+
+def test_unreachable_replica_falls_back_then_recovers(tmp_path, engines):
+    primary, _ = engines
+    missing_dir = tmp_path / "replica"
+    replica = sqlite_engine(missing_dir / "replica.db")
+    router = ReadReplica(replica, primary, max_lag_seconds=10, check_interval=0)
+
+    assert not router.available()
+    assert router.stats()["last_error"] and router.lag_seconds is None
+    assert routed_to(router.session(), primary)
+
+    missing_dir.mkdir()
+    Base.metadata.create_all(bind=replica)
+    assert router.available()
+    assert router.stats()["last_error"] is None
+    replica.dispose()
+
+
+def test_check_result_cached_for_interval(engines):
+    primary, replica = engines
+    router = ReadReplica(replica, primary, max_lag_seconds=10, check_interval=3600)
+    assert router.available()
+
+    record_change(primary, 1, seconds_ago=60)
+    # 检查间隔内沿用上次结果
+    assert router.available()
+    router._checked_at = 0.0
+    assert not router.available()
+
+
+def test_unconfigured_replica_uses_primary(engines):
+    primary, _ = engines
+    router = ReadReplica(None, primary, max_lag_seconds=10, check_interval=0)
+    assert not router.available()
+    assert routed_to(router.session(), primary)
+    assert router.stats()["configured"] is False
+
+
+def test_read_dependency_follows_routing(engines, monkeypatch):
+    primary, replica = engines
+    router = ReadReplica(replica, primary, max_lag_seconds=10, check_interval=0)
+    monkeypatch.setattr(dependencies, "read_replica", router)
+    primary_db = Session(bind=primary)
+
+    dependency = dependencies.get_read_db_session(primary_db)
+    db = next(dependency)
+    assert db is not primary_db and db.get_bind() is replica
+    dependency.close()
+
+    record_change(primary, 1, seconds_ago=60)
+    dependency = dependencies.get_read_db_session(primary_db)
+    assert next(dependency) is primary_db
+    dependency.close()
+    primary_db.close()
+    assert router.stats()["reads"] == {"replica": 1, "primary": 1}
+
+
+def test_concurrent_read_counts(engines):
+    primary, replica = engines
+    router = ReadReplica(replica, primary, max_lag_seconds=10, check_interval=3600)
+    router.available()
+
+    def worker():
+        for _ in range(2000):
+            router.count_read("replica")
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert router.stats()["reads"]["replica"] == 16000
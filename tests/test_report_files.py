@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+报告文件原子写入测试
+写入失败或进程中断时 reports/ 下不出现写了一半的正式报告，残留的临时文件按进程号和修改时间清理。
+"""
+import pytest
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.utils.report_files import atomic_report_path, remove_partial_reports
+
+
+def test_atomic_write_replaces_on_success(tmp_path):
+    target = tmp_path / "张三_S001.pdf"
+    with atomic_report_path(str(target)) as tmp:
+        assert tmp.endswith(".pdf") and ".part" in tmp
+        with open(tmp, "wb") as f:
+            f.write(b"%PDF")
+        assert not target.exists()
+    assert target.read_bytes() == b"%PDF"
+    assert os.listdir(tmp_path) == ["张三_S001.pdf"]
+
+
+def test_atomic_write_keeps_previous_report_on_failure(tmp_path):
+    target = tmp_path / "张三_S001.pdf"
+    target.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with atomic_report_path(str(target)) as tmp:
+            with open(tmp, "wb") as f:
+                f.write(b"half")
+            raise RuntimeError("interrupted")
+    assert target.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["张三_S001.pdf"]
+
+
+def test_remove_partial_reports(tmp_path):
+    day = tmp_path / "2026-01-01"
+    day.mkdir()
+    mine = day / f"a_S1.{os.getpid()}-0123abcd.part.pdf"
+    other = tmp_path / "b_S2.999999-89abcdef.part.xlsx"
+    report = tmp_path / "c_S3.pdf"
+    for path in (mine, other, report):
+        path.write_bytes(b"x")
+
+    assert remove_partial_reports(str(tmp_path), pid=os.getpid()) == 1
+    assert not mine.exists() and other.exists()
+    # 刚修改过的文件可能仍在写入，按最短时长跳过
+    assert remove_partial_reports(str(tmp_path), min_age_seconds=3600) == 0
+    assert remove_partial_reports(str(tmp_path)) == 1
+    assert report.exists()
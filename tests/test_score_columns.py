@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+检测记录紧凑列与生成列测试
+使用未配置 json_serializer 的普通引擎写入，校验中文键名按原文存储、生成列取到数值，
+以及按生成列筛选排序、检测记录导出和仪表板得分分布。
+"""
+import pytest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.models import Base, Test
+from psy_admin_fastapi.schemas import TestDataUpload
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_score_columns.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# (学号, 学习焦虑, 对人焦虑, 心率)
+STUDENTS = [("S0001", 12, 3, 70.5), ("S0002", 4, 8, 82.0), ("S0003", 18, 1, 65.25), ("S0004", 27, 5, 90.0)]
+
+
+@pytest.fixture(scope="module")
+def db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    for student_id, learning, social, heart_rate in STUDENTS:
+        crud.create_test_data(db, TestDataUpload(
+            student_id=student_id,
+            name=f"学生{student_id[-1]}",
+            gender="男",
+            age=15,
+            class_name="一班",
+            test_time=datetime.now() - timedelta(hours=1),
+            questionnaire_scores={
+                "学习焦虑": {"score": learning, "max_score": 30, "level": "轻度"},
+                "对人焦虑": {"score": social, "max_score": 10, "level": "轻度"},
+                "孤独倾向": {"score": learning // 2, "max_score": 15, "level": "轻度"},
+            },
+            physiological_data_summary={"心率": heart_rate, "脑电alpha": 9.5},
+            ai_summary="检测结果正常",
+            report_file_path="reports/test.pdf",
+        ))
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_summary_keys_stored_verbatim(db):
+    raw = db.execute(text("SELECT score_summary FROM tests ORDER BY id LIMIT 1")).scalar()
+    assert '"学习焦虑"' in raw and "\\u" not in raw
+
+
+def test_generated_columns(db):
+    rows = db.query(Test.score_learning_anxiety, Test.score_social_anxiety, Test.heart_rate, Test.eeg_alpha) \
+        .order_by(Test.id).all()
+    assert [tuple(row) for row in rows] == [(learning, social, heart_rate, 9.5)
+                                            for _, learning, social, heart_rate in STUDENTS]
+
+
+def test_filter_and_sort_on_typed_columns(db):
+    tests = db.query(Test).filter(Test.score_learning_anxiety > 10) \
+        .order_by(Test.score_learning_anxiety.desc()).all()
+    assert [test.score_learning_anxiety for test in tests] == [27, 18, 12]
+    score_list = {score["module_name"]: score["score"] for score in tests[0].score_list}
+    assert score_list == {"学习焦虑": 27, "对人焦虑": 5, "孤独倾向": 13}
+    assert {item["data_key"]: item["data_value"] for item in tests[0].phys_list} == {"心率": 90.0, "脑电alpha": 9.5}
+
+
+def test_export_reads_typed_and_json_values(db):
+    module_names, phys_keys = crud.get_test_record_export_columns(db)
+    assert module_names == ["学习焦虑", "对人焦虑", "孤独倾向", "自责倾向"]
+    # 固定列（记录ID、学号 …… 报告路径）之后依次是各模块得分和生理数据，没有数据的模块为空值
+    rows = {row[1]: row[-6:] for row in crud.iter_test_record_export_rows(db, module_names, phys_keys)}
+    assert rows == {student_id: (learning, social, learning // 2, None, heart_rate, 9.5)
+                    for student_id, learning, social, heart_rate in STUDENTS}
+
+
+def test_score_distribution_uses_uploaded_modules(db):
+    distribution = crud.get_score_distribution(db)
+    assert list(distribution) == ["学习焦虑", "对人焦虑", "孤独倾向", "自责倾向"]
+    assert distribution["学习焦虑"] == {"0-10": 1, "11-15": 1, "16-20": 1, "21-25": 0, "26-30": 1}
+    assert distribution["对人焦虑"] == {"0-10": 4, "11-15": 0, "16-20": 0, "21-25": 0, "26-30": 0}
+    assert distribution["孤独倾向"] == {"0-10": 3, "11-15": 1, "16-20": 0, "21-25": 0, "26-30": 0}
+    assert sum(distribution["自责倾向"].values()) == 0
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+生理信号特征提取测试
+用已知频率的合成脑电和已知 R-R 间期的合成心电校验频段功率和心率变异性指标。
+"""
+import pytest
+import sys
+import os
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.utils.signal_features import eeg_band_powers, detect_beats, hrv_metrics
+
+FS = 256
+
+
+def test_band_power_of_sine():
+    """幅值为 A 的正弦波功率为 A²/2，全部落在其频率所在的频段"""
+    t = np.arange(FS * 60) / FS
+    eeg = 20 * np.sin(2 * np.pi * 10 * t) + 5 * np.sin(2 * np.pi * 2 * t)
+    powers = eeg_band_powers(eeg.astype(np.float32), FS)
+    assert powers["alpha"] == pytest.approx(200, rel=0.01)
+    assert powers["delta"] == pytest.approx(12.5, rel=0.01)
+    assert powers["beta"] < 0.1
+
+
+def test_band_power_too_short():
+    assert eeg_band_powers(np.zeros(FS, dtype=np.float32), FS) == {}
+
+
+def test_hrv_from_synthetic_ecg():
+    """基线漂移下仍能检出每个 R 波，HRV 指标与真实 R-R 间期一致"""
+    rng = np.random.default_rng(0)
+    t = np.arange(FS * 120) / FS
+    beats = (np.cumsum(rng.normal(800, 40, 200)) / 1000 * FS).astype(int)
+    beats = beats[beats < t.size - 3]
+    ecg = 0.25 * np.sin(2 * np.pi * 0.3 * t) + rng.normal(0, 0.02, t.size)
+    for offset, height in zip(range(-2, 3), (0.3, 0.7, 1.0, 0.7, 0.3)):
+        ecg[beats + offset] += height
+
+    peaks = detect_beats(ecg.astype(np.float32), FS)
+    assert peaks.tolist() == beats.tolist()
+
+    rr = np.diff(beats) / FS * 1000
+    metrics = hrv_metrics(np.diff(peaks) / FS * 1000)
+    assert metrics["heart_rate"] == pytest.approx(60000 / rr.mean())
+    assert metrics["sdnn"] == pytest.approx(rr.std(ddof=1))
+    assert metrics["rmssd"] == pytest.approx(np.sqrt(np.mean(np.diff(rr) ** 2)))
+
+
+def test_hrv_ignores_implausible_intervals():
+    """漏检造成的超长间期不计入均值，也不参与相邻差值"""
+    metrics = hrv_metrics(np.array([800, 810, 3000, 790, 800]))
+    assert metrics["heart_rate"] == pytest.approx(60000 / 800)
+    assert metrics["rmssd"] == pytest.approx(np.sqrt((10 ** 2 + 10 ** 2) / 2))
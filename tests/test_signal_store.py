@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+生理信号存储测试
+覆盖二进制采样解析、.npy 文件写入/区间读取和 min/max 降采样。
+"""
+import pytest
+import sys
+import os
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.utils import signal_store
+
+
+@pytest.fixture
+def signal_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SIGNAL_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_parse_samples_rejects_invalid_payload():
+    """长度不是 4 的倍数、空数据和 NaN 都拒绝"""
+    for payload in (b"", b"123", np.array([1, np.nan], "<f4").tobytes()):
+        with pytest.raises(ValueError):
+            signal_store.parse_samples(payload)
+    assert signal_store.parse_samples(np.array([1.5, 2.5], "<f4").tobytes()).tolist() == [1.5, 2.5]
+
+
+def test_downsample_keeps_peaks():
+    """每桶保留最小值和最大值，尖峰不会被平均掉；末尾不足一桶的采样单独成桶"""
+    samples = np.zeros(1005, dtype=np.float32)
+    samples[503] = 9
+    samples[1004] = -3
+    series = signal_store.downsample(samples, 100)
+    assert series["bucket_size"] == 11
+    assert len(series["min"]) == len(series["max"]) == len(series["offsets"]) <= 100
+    assert max(series["max"]) == 9
+    assert series["min"][-1] == -3
+
+
+def test_downsample_short_series_unchanged():
+    samples = np.arange(10, dtype=np.float32)
+    series = signal_store.downsample(samples, 100)
+    assert series["min"] == series["max"] == samples.tolist()
+
+
+def test_save_and_load_range(signal_dir):
+    """写入后按秒区间读取，时间轴从区间起点开始"""
+    samples = np.arange(1000, dtype=np.float32)
+    path = signal_store.save_signal(7, "eeg", samples)
+    series = signal_store.load_series(path, 100, len(samples), start=2, end=3, points=10)
+    assert series["start"] == 2 and series["end"] == 3
+    assert series["time"][0] == 2 and series["bucket_seconds"] == 0.1
+    assert series["min"][0] == 200 and series["max"][-1] == 299
+
+    signal_store.remove_test_signals([7])
+    assert not os.path.exists(path)
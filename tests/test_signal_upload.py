@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+生理信号上传测试
+覆盖分块上传的大小限制、提交失败时保留原文件、首次上传并发时按覆盖上传重试。
+"""
+import asyncio
+import pytest
+import sys
+import os
+import tempfile
+from datetime import datetime
+import numpy as np
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi import main
+from psy_admin_fastapi.main import app
+from psy_admin_fastapi.config import settings
+from psy_admin_fastapi.database import get_db_session
+from psy_admin_fastapi.models import Base, Student, Test, PhysiologicalSignal
+from psy_admin_fastapi import crud
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_signal_upload.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    """覆盖数据库依赖"""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(settings, "SIGNAL_DIR", str(tmp_path))
+    db = TestingSessionLocal()
+    student = Student(student_id="S0001", name="测试学生", class_name="一班", gender="男")
+    db.add(student)
+    db.flush()
+    db.add(Test(id=1, student_fk_id=student.id, test_time=datetime.now(), status="completed"))
+    db.commit()
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(main.job_queue, "enqueue", lambda *args, **kwargs: None)
+    app.dependency_overrides[get_db_session] = override_get_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def payload(values):
+    return np.asarray(values, dtype="<f4").tobytes()
+
+
+def leftover_temp_files():
+    return [name for _, _, names in os.walk(settings.SIGNAL_DIR) for name in names if name.endswith(".tmp")]
+
+
+def test_upload_and_overwrite(client):
+    url = "/api/client/tests/1/signals/eeg?sample_rate=256"
+    assert client.post(url, content=payload([1, 2, 3])).status_code == 200
+    response = client.post(url, content=payload([4, 5]))
+    assert response.status_code == 200
+    assert response.json()["sample_count"] == 2
+    assert np.load(os.path.join(settings.SIGNAL_DIR, "1", "eeg.npy")).tolist() == [4, 5]
+    assert leftover_temp_files() == []
+
+
+def test_chunked_upload_over_limit_rejected(db, monkeypatch):
+    """分块传输没有 Content-Length，读取过程中超限即返回 413，不再读取后续数据"""
+    monkeypatch.setattr(settings, "MAX_SIGNAL_MB", 1)
+    read = []
+
+    class ChunkedRequest:
+        headers = {}
+
+        async def stream(self):
+            for _ in range(4):
+                read.append(1)
+                yield b"\0" * (512 * 1024)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(main.upload_physiological_signal(1, "eeg", 256, ChunkedRequest(), db))
+    assert exc_info.value.status_code == 413
+    assert len(read) == 3
+    assert not os.path.exists(os.path.join(settings.SIGNAL_DIR, "1", "eeg.npy"))
+
+
+def test_failed_commit_keeps_previous_file(db, monkeypatch):
+    crud.save_physiological_signal(db, 1, "eeg", 256, payload([1, 2, 3]))
+
+    def failing_commit():
+        raise OperationalError("COMMIT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(db, "commit", failing_commit)
+    with pytest.raises(OperationalError):
+        crud.save_physiological_signal(db, 1, "eeg", 256, payload([9, 9]))
+    db.rollback()
+    assert np.load(os.path.join(settings.SIGNAL_DIR, "1", "eeg.npy")).tolist() == [1, 2, 3]
+    assert leftover_temp_files() == []
+
+
+def test_concurrent_first_upload_retries_as_update(db, monkeypatch):
+    """查询时通道尚不存在、提交前另一请求已插入：违反唯一索引后按覆盖上传重试"""
+    lookup = crud.get_physiological_signal
+
+    def racing_lookup(session, test_id, channel):
+        if not racing_lookup.raced:
+            racing_lookup.raced = True
+            other = TestingSessionLocal()
+            crud.save_physiological_signal(other, test_id, channel, 128, payload([7]))
+            other.close()
+            return None
+        return lookup(session, test_id, channel)
+
+    racing_lookup.raced = False
+    monkeypatch.setattr(crud, "get_physiological_signal", racing_lookup)
+    signal = crud.save_physiological_signal(db, 1, "eeg", 256, payload([1, 2, 3]))
+    assert signal.sample_rate == 256 and signal.sample_count == 3
+    assert db.query(PhysiologicalSignal).count() == 1
+    assert np.load(signal.file_path).tolist() == [1, 2, 3]
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+学生导入与批量修改测试
+覆盖导入时学号已存在的三种处理方式（skip/update/error）、update 模式的分块 upsert，
+以及批量修改接口的 null 校验和整批回滚。
+"""
+import io
+import pytest
+import sys
+import os
+import tempfile
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi.main import app
+from psy_admin_fastapi.database import get_db_session
+from psy_admin_fastapi.dependencies import get_current_admin_user
+from psy_admin_fastapi.models import Base, AdminUser, ChangeLog, Student
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.services.import_service import ImportConflictError, import_students
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_student_import.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    """覆盖数据库依赖"""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db():
+    """每个测试从两名已有学生开始"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add_all([Student(student_id="S001", name="张三", class_name="一班", gender="男"),
+                Student(student_id="S002", name="李四", class_name="一班", gender="女")])
+    db.commit()
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client(db):
+    app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_current_admin_user] = lambda: AdminUser(id=1, username="admin")
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def csv_file(rows):
+    lines = ["name,student_id,class_name,gender"] + [",".join(row) for row in rows]
+    return io.BytesIO("\n".join(lines).encode("utf-8"))
+
+
+ROWS = [("张三丰", "S001", "二班", "男"), ("王五", "S003", "二班", "男")]
+
+
+def students(db):
+    db.expire_all()
+    return {s.student_id: (s.name, s.class_name) for s in db.query(Student).order_by(Student.student_id)}
+
+
+def test_skip_mode_reports_existing_as_duplicates(db):
+    result = import_students(db, csv_file(ROWS), "students.csv", on_conflict="skip")
+    assert result["success_count"] == 1
+    assert [item["student_id"] for item in result["duplicate_students"]] == ["S001"]
+    assert students(db)["S001"] == ("张三", "一班")
+    assert "S003" in students(db)
+
+
+def test_update_mode_upserts_new_and_existing_rows(db):
+    result = import_students(db, csv_file(ROWS), "students.csv", on_conflict="update")
+    assert (result["success_count"], result["updated_count"], result["duplicate_count"]) == (1, 1, 0)
+    assert students(db) == {"S001": ("张三丰", "二班"), "S002": ("李四", "一班"), "S003": ("王五", "二班")}
+    changed = {row[0] for row in db.query(ChangeLog.entity_id).filter(ChangeLog.entity == "student")}
+    assert changed == {row[0] for row in db.query(Student.id).filter(Student.student_id.in_(["S001", "S003"]))}
+
+
+def test_update_mode_chunks_the_upsert(db, monkeypatch):
+    """每条多行 INSERT 的绑定参数不超过上限：students 表 10 列，上限 20 时每条 2 行"""
+    monkeypatch.setattr(crud, "in_chunk_size", lambda session: 20)
+    rows = [(f"学生{i}", f"S{i:03d}", "三班", "男") for i in range(1, 6)]
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO students"):
+            statements.append(len(parameters))
+            assert len(parameters) <= 20
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        result = import_students(db, csv_file(rows), "students.csv", on_conflict="update")
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert (result["success_count"], result["updated_count"]) == (3, 2)
+    assert len(statements) == 3
+    assert students(db)["S002"] == ("学生2", "三班")
+
+
+def test_error_mode_rolls_back_whole_import(db):
+    with pytest.raises(ImportConflictError) as exc_info:
+        import_students(db, csv_file(ROWS), "students.csv", on_conflict="error")
+    assert [item["student_id"] for item in exc_info.value.conflicts] == ["S001"]
+    assert sorted(students(db)) == ["S001", "S002"]
+
+
+def test_patch_rejects_null_for_required_fields(client, db):
+    response = client.patch("/api/students", json={"updates": [{"student_id": "S001", "name": None}]})
+    assert response.status_code == 422
+    assert students(db)["S001"] == ("张三", "一班")
+
+
+def test_patch_applies_only_provided_fields(client, db):
+    response = client.patch("/api/students", json={"updates": [
+        {"student_id": "S001", "class_name": "三班"},
+        {"student_id": "S002", "name": "李四四"},
+    ]})
+    assert response.status_code == 200 and response.json() == {"updated_count": 2}
+    assert students(db) == {"S001": ("张三", "三班"), "S002": ("李四四", "一班")}
+
+
+def test_patch_with_unknown_student_changes_nothing(client, db):
+    response = client.patch("/api/students", json={"updates": [
+        {"student_id": "S001", "class_name": "三班"},
+        {"student_id": "S404", "class_name": "三班"},
+    ]})
+    assert response.status_code == 400 and "S404" in response.json()["detail"]
+    assert students(db)["S001"] == ("张三", "一班")
+
+
+def test_patch_rolls_back_when_a_write_fails(client, db, monkeypatch):
+    """批量 UPDATE 之后记录变更日志失败时，已执行的修改全部回滚"""
+    def failing(session, student_db_ids, op="upsert"):
+        raise RuntimeError("change log unavailable")
+
+    monkeypatch.setattr(crud, "record_student_changes", failing)
+    response = client.patch("/api/students", json={"updates": [
+        {"student_id": "S001", "class_name": "三班"},
+        {"student_id": "S002", "gender": "男"},
+    ]})
+    assert response.status_code == 500
+    assert students(db) == {"S001": ("张三", "一班"), "S002": ("李四", "一班")}
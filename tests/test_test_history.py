@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+检测历史测试
+同一学生再次上传时旧记录转为历史记录：只保留一条当前记录，变更日志记为 demote 而不是删除，
+增量导出输出 demote 行；翻转 is_latest 之前先锁定学生行；历史记录归档时年份分区键不为空。
+"""
+import pytest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from psy_admin_fastapi import crud
+from psy_admin_fastapi.models import Base, ChangeLog, Score, ScoreArchive, Student, Test, TestArchive
+from psy_admin_fastapi.schemas import TestDataUpload
+
+# 测试数据库URL
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_test_history.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def upload(db, student_id, hours_ago):
+    return crud.create_test_data(db, TestDataUpload(
+        student_id=student_id,
+        name="测试学生",
+        gender="男",
+        age=15,
+        class_name="一班",
+        test_time=datetime.now() - timedelta(hours=hours_ago),
+        questionnaire_scores={"学习焦虑": {"score": 5, "max_score": 15, "level": "轻度"}},
+        physiological_data_summary={"心率": 72.0, "脑电alpha": 9.5},
+        ai_summary="检测结果正常",
+        report_file_path="reports/test.pdf",
+    ))
+
+
+def test_reupload_demotes_previous_test(db):
+    first = upload(db, "S0001", 2)
+    second = upload(db, "S0001", 1)
+    assert [row[0] for row in db.query(Test.id).filter(Test.is_latest == True)] == [second.id]
+    ops = [row[0] for row in db.query(ChangeLog.op).filter(ChangeLog.entity == "test", ChangeLog.entity_id == first.id)
+           .order_by(ChangeLog.id)]
+    assert ops == ["upsert", "demote"]
+    student = db.query(Student).filter(Student.student_id == "S0001").one()
+    assert student.latest_test_id == second.id and student.test_count == 2
+
+
+def test_change_export_outputs_demote_rows(db):
+    first = upload(db, "S0001", 2)
+    since = crud.get_test_record_change_window(db, settle_seconds=0)[0]
+    second = upload(db, "S0001", 1)
+    until, has_more = crud.get_test_record_change_window(db, since=since, settle_seconds=0)
+    _, rows = crud.get_test_record_changes(db, since=since, until=until)
+    assert [(row[0], row[2]) for row in rows] == [("demote", first.id), ("upsert", second.id)]
+    assert not has_more
+
+
+def test_student_row_locked_before_flipping_latest(db):
+    """学生行的加锁查询先于 is_latest 的更新执行，同一学生的并发上传在锁上排队"""
+    upload(db, "S0001", 2)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(" ".join(statement.split()))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        upload(db, "S0001", 1)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    lock = next(i for i, sql in enumerate(statements)
+                if sql.startswith("SELECT students.id AS students_id FROM students WHERE students.id IN"))
+    demote = next(i for i, sql in enumerate(statements) if sql.startswith("UPDATE tests SET is_latest"))
+    assert lock < demote
+
+
+def test_archive_history_fills_archive_year(db):
+    """当前记录不归档；没有检测时间的历史记录按归档时间的年份归档，分区键不为空"""
+    dated = upload(db, "S0001", 24 * 400)
+    dated_id, dated_year = dated.id, dated.test_time.year
+    undated_id = upload(db, "S0001", 2).id
+    current_id = upload(db, "S0001", 1).id
+    db.execute(update(Test).where(Test.id == undated_id).values(test_time=None))
+    db.commit()
+
+    counts = crud.archive_test_history(db, before=datetime.now())
+    assert (counts["tests"], counts["scores"]) == (2, 2)
+    years = dict(db.query(TestArchive.id, TestArchive.archive_year))
+    assert years == {dated_id: dated_year, undated_id: datetime.utcnow().year}
+    assert {row[0] for row in db.query(ScoreArchive.archive_year)} == set(years.values())
+    assert [row[0] for row in db.query(Test.id)] == [current_id]
+    assert [row[0] for row in db.query(Score.test_fk_id)] == [current_id]